@@ -0,0 +1,40 @@
+"""ベンチマーク共通ユーティリティ"""
+import importlib.util
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Sequence
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SETUP_SCRIPT = PROJECT_ROOT / "vscode-project-startup.py"
+
+
+def load_startup_module():
+    """セットアップスクリプトをモジュールとしてロード"""
+    if "vscode_startup" in sys.modules:
+        return sys.modules["vscode_startup"]
+
+    spec = importlib.util.spec_from_file_location("vscode_startup", SETUP_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["vscode_startup"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(func: Callable, *args, repeat: int = 5) -> float:
+    """関数を繰り返し実行し、最短の実行時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def print_table(headers: Sequence[str], rows: List[Sequence]) -> None:
+    """結果を表形式で表示"""
+    widths = [max(len(str(h)), *(len(str(row[i])) for row in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(c).ljust(w) for c, w in zip(row, widths)))
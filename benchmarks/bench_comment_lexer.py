@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+コメント除去（strip_comments）のスループット計測
+
+大きな settings.json / *.code-snippets / YAML / TOML を生成し、
+構文ごとの処理速度を MB/s で表示します。
+
+使用例:
+  python benchmarks/bench_comment_lexer.py
+  python benchmarks/bench_comment_lexer.py --size-mb 32 --repeat 3
+"""
+import argparse
+import json
+
+from _common import load_startup_module, measure, print_table
+
+
+def _repeat_lines(size: int, header: list, block) -> list:
+    """block(i) が返す行を size に達するまで繰り返す"""
+    lines = list(header)
+    total = 0
+    i = 0
+    while total < size:
+        for line in block(i):
+            lines.append(line)
+            total += len(line) + 1
+        i += 1
+    return lines
+
+
+def generate_settings(size: int) -> str:
+    """コメントとglobパターンを含む大きな settings.json を生成"""
+    lines = _repeat_lines(size, ["{"], lambda i: [
+        f"  // ---- section {i} ----",
+        f'  "editor.setting{i}": {i},  // 行末コメント',
+        f'  /* ブロック\n     コメント {i} */',
+        f'  "files.exclude.{i}": {{"src/**/*.js": true, "**/*.tmp{i}": false}},',
+        f'  "url{i}": "https://example.com/path//{i}",',
+    ])
+    lines.append('  "end": true')
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def generate_snippets(size: int) -> str:
+    """コード片（// や /* を含む本文）を持つ大きな code-snippets を生成"""
+    snippets = {}
+    i = 0
+    total = 0
+    while total < size:
+        body = [f"// snippet {i}", "/* header */", f"const x{i} = a // b;", "for (;;) {}"]
+        entry = {"prefix": f"snip{i}", "body": body, "description": f"snippet {i} // demo"}
+        snippets[f"Snippet {i}"] = entry
+        total += len(json.dumps(entry)) + 32
+        i += 1
+    text = json.dumps(snippets, indent=2, ensure_ascii=False)
+    return "// Generated snippets\n" + text.replace('\n  "Snippet', '\n  // entry\n  "Snippet')
+
+
+def generate_yaml(size: int) -> str:
+    """コメントを含む大きな YAML を生成"""
+    lines = _repeat_lines(size, ["# generated", "services:"], lambda i: [
+        f"  svc{i}:  # service {i}",
+        f"    image: 'nginx:{i} # tag'",
+        '    command: "echo # not comment"  # comment',
+        f"    url: http://example.com/#frag{i}",
+    ])
+    return "\n".join(lines)
+
+
+def generate_toml(size: int) -> str:
+    """コメントと複数行文字列を含む大きな TOML を生成"""
+    lines = _repeat_lines(size, ["# generated"], lambda i: [
+        f"[tool.t{i}]  # table {i}",
+        f'name = "x#{i}"  # comment',
+        "doc = \'\'\'",
+        f"# kept {i}",
+        "\'\'\'",
+    ])
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="コメント除去のスループット計測")
+    parser.add_argument("--size-mb", type=float, default=8.0, help="生成する入力のサイズ (MB)")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数（最短時間を採用）")
+    args = parser.parse_args()
+
+    module = load_startup_module()
+    size = int(args.size_mb * 1024 * 1024)
+
+    inputs = [
+        ("settings.json", "json", generate_settings(size)),
+        ("python.code-snippets", "json", generate_snippets(size)),
+        ("docker-compose.yml", "yaml", generate_yaml(size)),
+        ("pyproject.toml", "toml", generate_toml(size)),
+    ]
+
+    rows = []
+    for name, syntax, content in inputs:
+        megabytes = len(content.encode("utf-8")) / (1024 * 1024)
+        elapsed = measure(module.strip_comments, content, syntax, repeat=args.repeat)
+        rows.append((name, syntax, f"{megabytes:.1f}", f"{elapsed * 1000:.1f}", f"{megabytes / elapsed:.1f}"))
+
+    print_table(("input", "syntax", "MB", "ms", "MB/s"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+深いマージ（deep_merge）と従来の再帰版 merge_json の比較
+
+合成した深いドキュメントに対して、次のケースの処理時間を表示します。
+  sparse: 新しいデータが1つの経路だけを変更する（テンプレートの典型的な差分）
+  dense:  新しいデータが全ての葉を変更する
+  chain:  非常に深い一本鎖（再帰版は RecursionError になる）
+
+使用例:
+  python benchmarks/bench_deep_merge.py
+  python benchmarks/bench_deep_merge.py --depth 14 --breadth 3 --repeat 3
+"""
+import argparse
+
+from _common import load_startup_module, measure, print_table
+
+
+def legacy_merge_json(existing_data: dict, new_data: dict) -> dict:
+    """従来の実装（各階層で .copy() して再帰）"""
+    result = existing_data.copy()
+
+    for key, value in new_data.items():
+        if key in result and isinstance(result[key], dict) and isinstance(value, dict):
+            result[key] = legacy_merge_json(result[key], value)
+        else:
+            result[key] = value
+
+    return result
+
+
+def generate_tree(depth: int, breadth: int, leaf) -> dict:
+    """depth 階層・各階層 breadth 個のキーを持つ辞書を生成（葉は leaf(path)）"""
+    def build(level: int, path: str) -> dict:
+        node = {f"leaf{i}": leaf(f"{path}/{i}") for i in range(breadth)}
+        if level < depth:
+            for i in range(breadth):
+                node[f"k{i}"] = build(level + 1, f"{path}/k{i}")
+        return node
+    return build(1, "")
+
+
+def generate_path(depth: int, value) -> dict:
+    """k0/k0/.../leaf0 の1経路だけを持つ辞書を生成"""
+    node = {"leaf0": value}
+    for _ in range(depth - 1):
+        node = {"k0": node}
+    return node
+
+
+def count_nodes(data) -> int:
+    count = 0
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if isinstance(node, dict):
+            stack.extend(node.values())
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="深いマージの比較")
+    parser.add_argument("--depth", type=int, default=12, help="合成ドキュメントの深さ")
+    parser.add_argument("--breadth", type=int, default=3, help="各階層のキー数")
+    parser.add_argument("--chain-depth", type=int, default=20000, help="一本鎖ケースの深さ")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数（最短時間を採用）")
+    args = parser.parse_args()
+
+    module = load_startup_module()
+
+    existing = generate_tree(args.depth, args.breadth, lambda path: path)
+    cases = [
+        ("sparse", existing, generate_path(args.depth, "changed")),
+        ("dense", existing, generate_tree(args.depth, args.breadth, lambda path: path + "*")),
+        ("chain", generate_path(args.chain_depth, "old"), generate_path(args.chain_depth, "new")),
+    ]
+
+    rows = []
+    for name, old, new in cases:
+        try:
+            legacy = f"{measure(legacy_merge_json, old, new, repeat=args.repeat) * 1000:.2f}"
+        except RecursionError:
+            legacy = "RecursionError"
+        current = measure(module.deep_merge, old, new, repeat=args.repeat)
+        rows.append((name, count_nodes(old), count_nodes(new), legacy, f"{current * 1000:.2f}"))
+
+    print_table(("case", "existing nodes", "new nodes", "merge_json (legacy) ms", "deep_merge ms"), rows)
+
+
+if __name__ == "__main__":
+    main()
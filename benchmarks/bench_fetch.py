@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+GitHubモード（リモート取得）の計測
+
+tests/github_stub.py のローカル代替サーバーからテンプレートを取得して適用し、
+ネットワークの遅延・帯域・障害を再現した条件での処理時間とリクエスト数を表示します。
+ネットワーク接続は不要です。
+
+使用例:
+  python benchmarks/bench_fetch.py
+  python benchmarks/bench_fetch.py --latency 0.05 --bandwidth 2000000 default/base python/base docker/base
+  python benchmarks/bench_fetch.py --fail-rate-limit 'templates/python/*'
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _common import PROJECT_ROOT, load_startup_module, print_table
+from suite import quiet, working_directory
+
+sys.path.insert(0, str(PROJECT_ROOT / "tests"))
+from github_stub import GitHubStub  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="リモート取得の計測")
+    parser.add_argument("templates", nargs="*", default=["default/base", "python/base", "docker/base"],
+                        help="適用するテンプレート")
+    parser.add_argument("--latency", type=float, default=0.03, help="リクエストごとの遅延（秒）")
+    parser.add_argument("--bandwidth", type=int, default=None, help="転送速度の上限（バイト/秒）")
+    parser.add_argument("--repeat", type=int, default=3, help="繰り返し回数（最短時間を採用）")
+    parser.add_argument("--fail-server-error", metavar="GLOB", help="一致するパスを 503 にする")
+    parser.add_argument("--fail-rate-limit", metavar="GLOB", help="一致するパスを 429 にする")
+    args = parser.parse_args()
+
+    module = load_startup_module()
+
+    with tempfile.TemporaryDirectory() as temp_dir, \
+            GitHubStub(PROJECT_ROOT, latency=args.latency, bandwidth=args.bandwidth) as stub:
+        # 利用履歴などのキャッシュを利用者のキャッシュディレクトリに書き込まない
+        os.environ["VSCODE_TEMPLATE_CACHE_DIR"] = str(Path(temp_dir) / "cache")
+        if args.fail_server_error:
+            stub.fail(args.fail_server_error, 503)
+        if args.fail_rate_limit:
+            stub.fail(args.fail_rate_limit, 429)
+
+        with open(PROJECT_ROOT / "config.json", encoding="utf-8") as f:
+            config = json.load(f)
+        config["github"] = stub.github_config()
+        config_path = Path(temp_dir) / "config.json"
+        config_path.write_text(json.dumps(config), encoding="utf-8")
+
+        rows = []
+        best = float("inf")
+        for run in range(args.repeat):
+            project = Path(temp_dir) / f"project{run}"
+            project.mkdir()
+            stub.requests.clear()
+
+            start = time.perf_counter()
+            with working_directory(project), quiet():
+                setup = module.TemplateSetup(args.templates, config=module.Config(config_path), use_cache=False)
+                setup.run()
+            elapsed = time.perf_counter() - start
+            best = min(best, elapsed)
+
+            files = sum(1 for path in project.rglob("*") if path.is_file())
+            rows.append((run + 1, f"{elapsed * 1000:.1f}", len(stub.requests), stub.count("*", 200),
+                         stub.count("*", 404), files))
+
+    print_table(("run", "ms", "requests", "200", "404", "files placed"), rows)
+    per_request = best / max(1, rows[-1][2])
+    print(f"\n最短: {best * 1000:.1f} ms（遅延 {args.latency * 1000:.0f} ms、1リクエストあたり {per_request * 1000:.1f} ms）")
+
+
+if __name__ == "__main__":
+    main()
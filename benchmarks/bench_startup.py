@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+コールドスタート時間の計測
+
+ローカルテンプレート（JSONのみ）を空のディレクトリに適用する処理を新しいプロセスで
+繰り返し実行し、中央値を目標時間（--budget-ms）と比較します。
+また python -X importtime の出力から、読み込みに時間のかかったモジュールを表示し、
+このケースで不要なモジュール（コーデックやネットワーク関連）が読み込まれていないことを確認します。
+
+目標時間を超えた場合、または不要なモジュールが読み込まれた場合は終了コード1で終了します。
+
+使用例:
+  python benchmarks/bench_startup.py
+  python benchmarks/bench_startup.py --template default/base --runs 20 --budget-ms 80
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _common import PROJECT_ROOT, SETUP_SCRIPT, print_table
+
+# ローカルのJSONのみのテンプレート適用では読み込まれるべきでないモジュール
+UNEXPECTED_MODULES = (
+    "yaml", "tomllib", "tomli", "tomli_w", "orjson", "xml.etree.ElementTree",
+    "urllib.request", "http.client", "ssl", "subprocess", "concurrent.futures",
+)
+
+
+def run_once(template: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    """空の一時ディレクトリでテンプレートを適用"""
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += [str(SETUP_SCRIPT), "-l", str(PROJECT_ROOT), "--no-cache", template]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        result = subprocess.run(cmd, cwd=work_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"実行失敗 (exit={result.returncode}):\n{result.stdout}\n{result.stderr}")
+    return result
+
+
+def parse_importtime(stderr: str) -> dict:
+    """-X importtime の出力を {モジュール名: (self_us, cumulative_us)} に変換"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = [field.strip() for field in line[len("import time:"):].split("|")]
+        if not fields[0].isdigit():
+            continue  # ヘッダー行
+        modules[fields[2]] = (int(fields[0]), int(fields[1]))
+    return modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="コールドスタート時間の計測")
+    parser.add_argument("--template", default="default/base", help="適用するローカルテンプレート")
+    parser.add_argument("--runs", type=int, default=10, help="計測回数（中央値を採用）")
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="中央値の目標時間（ミリ秒）")
+    parser.add_argument("--top", type=int, default=10, help="表示するモジュール数")
+    args = parser.parse_args()
+
+    # 一度実行してOSのファイルキャッシュを温める（Python自体の起動を計測対象から外さない）
+    run_once(args.template)
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        run_once(args.template)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    baseline = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        baseline.append((time.perf_counter() - start) * 1000)
+
+    modules = parse_importtime(run_once(args.template, importtime=True).stderr)
+    heaviest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    print_table(("module", "self ms", "cumulative ms"),
+                [(name, f"{own / 1000:.2f}", f"{cumulative / 1000:.2f}")
+                 for name, (own, cumulative) in heaviest])
+    print()
+
+    median = statistics.median(timings)
+    interpreter = statistics.median(baseline)
+    print_table(("case", "median ms", "min ms", "budget ms"), [
+        ("python -c pass", f"{interpreter:.1f}", f"{min(baseline):.1f}", "-"),
+        (f"apply {args.template}", f"{median:.1f}", f"{min(timings):.1f}", f"{args.budget_ms:.1f}"),
+    ])
+    print(f"\n読み込まれたモジュール: {len(modules)}")
+
+    failed = False
+    unexpected = [name for name in UNEXPECTED_MODULES if name in modules]
+    if unexpected:
+        print(f"不要なモジュールが読み込まれました: {', '.join(unexpected)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"目標時間を超過しました: {median:.1f} ms > {args.budget_ms:.1f} ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+合成テンプレートリポジトリ・プロジェクトの生成
+
+ベンチマーク用に、次の規模を指定してテンプレートとその適用先のプロジェクトを生成します。
+  templates:  テンプレート数（全テンプレートが同じ相対パスを持つため、組み合わせて適用するとマージが連鎖する）
+  files:      テンプレートあたりのファイル数（JSONC/YAML/TOML/XML/行ベース/バイナリを順に割り当て）
+  file_size:  1ファイルあたりのおおよそのサイズ（バイト）
+  depth:      ファイルを配置するディレクトリの最大の深さ
+
+生成物:
+  <root>/config.json           生成したテンプレート用の設定
+  <root>/templates/bench/tNN/  テンプレート（-l <root> bench/tNN で適用できる）
+  <root>/project/              一部のファイルが既に存在するプロジェクト
+
+使用例:
+  python benchmarks/corpus.py /tmp/corpus --templates 8 --files 24 --file-size 16384 --depth 3
+  cd /tmp/corpus/project && VSCODE_TEMPLATE_CONFIG=/tmp/corpus/config.json \\
+      python /path/to/vscode-project-startup.py -l /tmp/corpus bench/t00 bench/t01
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from _common import PROJECT_ROOT
+
+# (サブフォルダ, 拡張子またはファイル名, 生成関数名) を順に割り当てる
+KINDS = [
+    ("vscode", ".json", "jsonc"),
+    ("config", ".yaml", "yaml"),
+    ("config", ".toml", "toml"),
+    ("config", ".xml", "xml"),
+    ("config", ".gitignore", "lines"),
+    ("docker", ".bin", "binary"),
+]
+
+# サブフォルダ -> プロジェクト内の配置先（config.json の folder_mapping と同じ）
+FOLDER_MAPPING = {"vscode": ".vscode", "config": ".", "docker": "."}
+
+
+def _fill(size: int, block) -> List[str]:
+    """block(i) が返す行を size に達するまで繰り返す"""
+    lines = []
+    total = 0
+    i = 0
+    while total < size:
+        for line in block(i):
+            lines.append(line)
+            total += len(line) + 1
+        i += 1
+    return lines
+
+
+def generate_jsonc(size: int, variant: int) -> bytes:
+    """コメント付きの settings.json 形式（variant ごとに一部の値が異なる）"""
+    lines = ["{", "  // generated"]
+    lines += _fill(size, lambda i: [
+        f"  // setting {i}",
+        f'  "bench.setting{i}": "{i % 7 if i % 3 else variant}",  // 行末コメント',
+        f'  "bench.object{i}": {{"enabled": true, "level": {i % 5}, "source": "t{variant}"}},',
+    ])
+    lines.append(f'  "bench.variant": {variant}')
+    lines.append("}")
+    return "\n".join(lines).encode("utf-8")
+
+
+def generate_yaml(size: int, variant: int) -> bytes:
+    lines = ["# generated", "services:"]
+    lines += _fill(size, lambda i: [
+        f"  svc{i}:  # service {i}",
+        f"    image: 'nginx:{i % 3 if i % 4 else variant}'",
+        f"    environment: {{LEVEL: '{i % 5}', SOURCE: 't{variant}'}}",
+    ])
+    return "\n".join(lines).encode("utf-8")
+
+
+def generate_toml(size: int, variant: int) -> bytes:
+    lines = ["# generated"]
+    lines += _fill(size, lambda i: [
+        f"[tool.t{i}]  # table {i}",
+        f'name = "t{i % 3 if i % 4 else variant}"  # comment',
+        f"level = {i % 5}",
+    ])
+    return "\n".join(lines).encode("utf-8")
+
+
+def generate_xml(size: int, variant: int) -> bytes:
+    lines = ["<?xml version='1.0' encoding='utf-8'?>", "<project>", "  <!-- generated -->"]
+    lines += _fill(size, lambda i: [
+        f'  <component name="c{i}">',
+        f'    <option name="level" value="{i % 5}" />',
+        f'    <option name="source" value="t{i % 3 if i % 4 else variant}" />',
+        "  </component>",
+    ])
+    lines.append("</project>")
+    return "\n".join(lines).encode("utf-8")
+
+
+def generate_lines(size: int, variant: int) -> bytes:
+    lines = ["# generated"]
+    lines += _fill(size, lambda i: [f"build-{i % 97}/", f"*.t{variant}-{i}", f"# section {i}"])
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def generate_binary(size: int, variant: int) -> bytes:
+    return random.Random(variant).randbytes(size)
+
+
+GENERATORS = {
+    "jsonc": generate_jsonc,
+    "yaml": generate_yaml,
+    "toml": generate_toml,
+    "xml": generate_xml,
+    "lines": generate_lines,
+    "binary": generate_binary,
+}
+
+
+def file_layout(files: int, depth: int) -> List[Tuple[str, str, str]]:
+    """テンプレート内のファイル配置 [(サブフォルダ, サブフォルダからの相対パス, 種類)]"""
+    layout = []
+    for i in range(files):
+        subfolder, suffix, kind = KINDS[i % len(KINDS)]
+        level = (i // len(KINDS)) % (depth + 1)
+        directory = "".join(f"d{d}/" for d in range(level))
+        if kind == "lines":
+            # 行ベースのマージ対象はファイル名で判定されるため、名前は変えずにディレクトリを分ける
+            rel_path = f"{directory}l{i}/{suffix}"
+        else:
+            rel_path = f"{directory}f{i}{suffix}"
+        layout.append((subfolder, rel_path, kind))
+    return layout
+
+
+def dest_path(subfolder: str, rel_path: str) -> str:
+    """テンプレート内のファイルのプロジェクト内の配置先"""
+    return (Path(FOLDER_MAPPING[subfolder]) / rel_path).as_posix()
+
+
+def write_config(root: Path) -> Path:
+    """生成したテンプレート用の config.json を書き出す"""
+    with open(PROJECT_ROOT / "config.json.default", encoding="utf-8") as f:
+        config = json.load(f)
+
+    config["folder_mapping"] = dict(FOLDER_MAPPING)
+    config["file_match_patterns"] = ["*.json", "*.yaml", "*.toml", "*.xml", ".gitignore", "*.bin"]
+    config["templates"] = {}
+    config["merge_cache"] = dict(config.get("merge_cache", {}), persistent=False)
+
+    path = root / "config.json"
+    path.write_text(json.dumps(config, indent=2), encoding="utf-8")
+    return path
+
+
+def generate_corpus(root: Path, templates: int = 8, files: int = 24, file_size: int = 16384,
+                    depth: int = 3, existing_ratio: float = 0.5) -> Dict[str, object]:
+    """
+    テンプレートとプロジェクトを生成
+
+    Returns:
+        {"config": 設定ファイル, "templates": テンプレート名のリスト, "project": プロジェクト, "bytes": テンプレートの総サイズ}
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    layout = file_layout(files, depth)
+    names = []
+    total = 0
+
+    for t in range(templates):
+        name = f"bench/t{t:02d}"
+        names.append(name)
+        for i, (subfolder, rel_path, kind) in enumerate(layout):
+            path = root / "templates" / name / subfolder / rel_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            content = GENERATORS[kind](file_size, t * 1000 + i)
+            path.write_bytes(content)
+            total += len(content)
+
+    # 既存ファイル: 配置先の一部に、どのテンプレートとも異なる内容を置く
+    project = root / "project"
+    project.mkdir(exist_ok=True)
+    step = max(1, round(1 / existing_ratio)) if existing_ratio > 0 else 0
+    for i, (subfolder, rel_path, kind) in enumerate(layout):
+        if not step or i % step:
+            continue
+        path = project / dest_path(subfolder, rel_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(GENERATORS[kind](file_size, -1 - i))
+
+    return {"config": write_config(root), "templates": names, "project": project, "bytes": total}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="合成テンプレートの生成")
+    parser.add_argument("root", type=Path, help="出力先ディレクトリ")
+    parser.add_argument("--templates", type=int, default=8, help="テンプレート数")
+    parser.add_argument("--files", type=int, default=24, help="テンプレートあたりのファイル数")
+    parser.add_argument("--file-size", type=int, default=16384, help="1ファイルあたりのサイズ（バイト）")
+    parser.add_argument("--depth", type=int, default=3, help="ディレクトリの最大の深さ")
+    parser.add_argument("--existing-ratio", type=float, default=0.5, help="プロジェクトに既に存在するファイルの割合")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.root, args.templates, args.files, args.file_size, args.depth, args.existing_ratio)
+    print(f"テンプレート: {len(corpus['templates'])} ({corpus['bytes'] / 1024 / 1024:.1f} MB)")
+    print(f"設定: {corpus['config']}")
+    print(f"プロジェクト: {corpus['project']}")
+
+
+if __name__ == "__main__":
+    main()
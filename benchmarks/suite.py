@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+ベンチマークスイート（合成テンプレートに対する計測と回帰判定）
+
+corpus.py で生成したテンプレートとプロジェクトに対して、次の処理時間を計測します。
+  strip_<syntax>_comments  全テンプレートの該当フォーマットのファイルのコメント除去
+  merge_<format>_files     テンプレート同士の該当フォーマットのファイルのマージ（ファイルI/Oを含む）
+  collect_files            全テンプレートのファイル探索（TemplateSetup._collect_files）
+  apply                    全テンプレートをプロジェクトに適用（TemplateSetup.run）
+
+各指標は --repeat 回の最短時間です。--output で結果をJSONに保存し、--compare で保存した
+ベースラインと比較します。いずれかの指標が --tolerance を超えて遅くなった場合は終了コード1で終了します。
+
+使用例:
+  python benchmarks/suite.py --output baseline.json
+  python benchmarks/suite.py --compare baseline.json --tolerance 0.15
+  python benchmarks/suite.py --templates 16 --files 48 --file-size 65536 --depth 4 --output large.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from _common import load_startup_module, print_table
+from corpus import file_layout, generate_corpus
+
+RESULT_VERSION = 1
+
+# 計測対象の指標（フォーマット -> (コメント除去の構文, マージ関数名)）
+FORMATS = {
+    "json": ("json", "merge_json_files"),
+    "yaml": ("yaml", "merge_yaml_files"),
+    "toml": ("toml", "merge_toml_files"),
+    "xml": (None, "merge_xml_files"),
+    "line_based": (None, "merge_line_based_files"),
+}
+
+# 生成関数の種類 -> マージのフォーマット
+KIND_FORMATS = {"jsonc": "json", "yaml": "yaml", "toml": "toml", "xml": "xml", "lines": "line_based"}
+
+
+def best_time(run: Callable[[], None], setup: Optional[Callable[[], None]] = None, repeat: int = 5) -> float:
+    """setup（計測対象外）→ run を繰り返し、最短の実行時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@contextlib.contextmanager
+def quiet():
+    """セットアップスクリプトの表示を抑制"""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def working_directory(path: Path):
+    previous = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def run_suite(module, corpus: dict, root: Path, scale: dict, repeat: int, jobs: Optional[int]) -> Dict[str, dict]:
+    """全指標を計測して {指標名: {"seconds": 秒, "bytes": 処理したバイト数}} を返す"""
+    metrics: Dict[str, dict] = {}
+    templates_root = root / "templates"
+    layout = file_layout(scale["files"], scale["depth"])
+    by_format: Dict[str, list] = {}
+    for subfolder, rel_path, kind in layout:
+        if kind in KIND_FORMATS:
+            by_format.setdefault(KIND_FORMATS[kind], []).append(f"{subfolder}/{rel_path}")
+
+    # コメント除去
+    for format_name, (syntax, _) in FORMATS.items():
+        if syntax is None or format_name not in by_format:
+            continue
+        texts = [(templates_root / name / path).read_text(encoding="utf-8")
+                 for name in corpus["templates"] for path in by_format[format_name]]
+        strip = getattr(module, f"strip_{syntax}_comments")
+        metrics[f"strip_{syntax}_comments"] = {
+            "seconds": best_time(lambda: [strip(text) for text in texts], repeat=repeat),
+            "bytes": sum(len(text.encode("utf-8")) for text in texts),
+        }
+
+    # ファイルのマージ（隣り合うテンプレートの同じファイル同士）
+    output_dir = root / "merge-output"
+    output_dir.mkdir(exist_ok=True)
+    for format_name, (_, merge_name) in FORMATS.items():
+        if format_name not in by_format:
+            continue
+        if not module.CODECS[format_name].available:
+            print(f"スキップ: {merge_name}（{module.CODECS[format_name].missing_message}）")
+            continue
+        merge = getattr(module, merge_name)
+        pairs = []
+        for first, second in zip(corpus["templates"], corpus["templates"][1:]):
+            for path in by_format[format_name]:
+                output = output_dir / f"{len(pairs)}{Path(path).name}"
+                pairs.append((templates_root / first / path, templates_root / second / path, output))
+
+        def merge_all(merge=merge, pairs=pairs):
+            with quiet():
+                if not all(merge(existing, new, output) for existing, new, output in pairs):
+                    raise RuntimeError(f"{merge.__name__} が失敗しました")
+
+        metrics[merge_name] = {
+            "seconds": best_time(merge_all, repeat=repeat),
+            "bytes": sum(existing.stat().st_size + new.stat().st_size for existing, new, _ in pairs),
+        }
+
+    config_path = corpus["config"]
+    project = corpus["project"]
+    work = root / "work"
+
+    def make_setup():
+        return module.TemplateSetup(corpus["templates"], config=module.Config(config_path), local_path=root,
+                                    workers=jobs, use_cache=False)
+
+    # ファイル探索
+    state = {}
+
+    def prepare_collect():
+        with working_directory(project), quiet():
+            state["setup"] = make_setup()
+
+    def collect():
+        if not state["setup"]._collect_files():
+            raise RuntimeError("ファイルが見つかりません")
+
+    metrics["collect_files"] = {
+        "seconds": best_time(collect, prepare_collect, repeat=repeat),
+        "bytes": 0,
+    }
+
+    # 適用全体（毎回プロジェクトを初期状態に戻す）
+    def prepare_apply():
+        shutil.rmtree(work, ignore_errors=True)
+        shutil.copytree(project, work)
+
+    def apply():
+        with working_directory(work), quiet():
+            if not make_setup().run():
+                raise RuntimeError("適用に失敗しました")
+
+    metrics["apply"] = {
+        "seconds": best_time(apply, prepare_apply, repeat=repeat),
+        "bytes": corpus["bytes"],
+    }
+    return metrics
+
+
+def compare(baseline: dict, current: dict, tolerance: float, min_seconds: float) -> bool:
+    """ベースラインと比較して結果を表示（回帰がない場合True）"""
+    if baseline.get("scale") != current["scale"]:
+        print(f"規模が異なるため比較できません: ベースライン {baseline.get('scale')} / 今回 {current['scale']}")
+        sys.exit(2)
+
+    rows = []
+    regressions = []
+    for name, base in baseline["metrics"].items():
+        now = current["metrics"].get(name)
+        if now is None:
+            rows.append((name, f"{base['seconds'] * 1000:.2f}", "-", "-", "未計測"))
+            continue
+        ratio = now["seconds"] / base["seconds"] if base["seconds"] > 0 else 1.0
+        if max(base["seconds"], now["seconds"]) < min_seconds:
+            status = "対象外（短すぎる）"
+        elif ratio > 1 + tolerance:
+            status = "回帰"
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            status = "改善"
+        else:
+            status = "OK"
+        rows.append((name, f"{base['seconds'] * 1000:.2f}", f"{now['seconds'] * 1000:.2f}", f"{ratio:.2f}x", status))
+
+    print_table(("metric", "baseline ms", "current ms", "ratio", "status"), rows)
+    if regressions:
+        print(f"\n許容範囲（+{tolerance:.0%}）を超えて遅くなった指標: {', '.join(regressions)}")
+    return not regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ベンチマークスイート")
+    parser.add_argument("--templates", type=int, default=8, help="テンプレート数")
+    parser.add_argument("--files", type=int, default=24, help="テンプレートあたりのファイル数")
+    parser.add_argument("--file-size", type=int, default=16384, help="1ファイルあたりのサイズ（バイト）")
+    parser.add_argument("--depth", type=int, default=3, help="ディレクトリの最大の深さ")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数（最短時間を採用）")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="適用時のワーカープロセス数（デフォルト: 1）")
+    parser.add_argument("--output", type=Path, help="結果を保存するJSONファイル")
+    parser.add_argument("--compare", type=Path, help="比較するベースライン（--output で保存したJSON）")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="許容する遅延の割合（デフォルト: 0.15）")
+    parser.add_argument("--min-seconds", type=float, default=0.001,
+                        help="これより短い指標は回帰判定の対象外（計測誤差のため）")
+    parser.add_argument("--keep", type=Path, help="生成したテンプレートをこのディレクトリに残す")
+    args = parser.parse_args()
+
+    module = load_startup_module()
+    scale = {"templates": args.templates, "files": args.files, "file_size": args.file_size, "depth": args.depth}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 利用履歴などのキャッシュを利用者のキャッシュディレクトリに書き込まない
+        os.environ["VSCODE_TEMPLATE_CACHE_DIR"] = str(Path(temp_dir) / "cache")
+        root = args.keep or Path(temp_dir)
+        corpus = generate_corpus(root, **scale)
+        metrics = run_suite(module, corpus, root, scale, args.repeat, args.jobs)
+
+    result = {
+        "version": RESULT_VERSION,
+        "scale": scale,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "jobs": args.jobs},
+        "metrics": metrics,
+    }
+
+    rows = [(name, f"{m['seconds'] * 1000:.2f}",
+             f"{m['bytes'] / m['seconds'] / 1024 / 1024:.1f}" if m["bytes"] and m["seconds"] > 0 else "-")
+            for name, m in metrics.items()]
+    print_table(("metric", "ms", "MB/s"), rows)
+
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\n結果を保存しました: {args.output}")
+
+    if args.compare:
+        print()
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if not compare(baseline, result, args.tolerance, args.min_seconds):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,22 @@ def setup_script(project_root: Path) -> Path:
     return project_root / "vscode-project-startup.py"
 
 
+@pytest.fixture(scope="session")
+def startup_module(setup_script: Path):
+    """セットアップスクリプトをモジュールとしてロード
+
+    ワーカープロセスへ関数をpickleで渡せるよう sys.modules にも登録します。
+    """
+    import importlib.util
+    import sys
+
+    spec = importlib.util.spec_from_file_location("vscode_startup", setup_script)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["vscode_startup"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
 @pytest.fixture(scope="session")
 def template_dir(project_root: Path) -> Path:
     """テンプレートディレクトリのパス"""
@@ -68,6 +84,38 @@ def use_test_config(test_config: Path):
         os.environ["VSCODE_TEMPLATE_CONFIG"] = old_value
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path_factory, monkeypatch):
+    """キャッシュ・利用履歴をテストごとの一時ディレクトリに保存（サブプロセスにも引き継ぐ）"""
+    monkeypatch.setenv("VSCODE_TEMPLATE_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+
+
+@pytest.fixture
+def github_stub(tmp_path: Path, template_dir: Path):
+    """テンプレートを配信するGitHubのローカル代替サーバー（github_stub.py）"""
+    from github_stub import GitHubStub
+
+    repo = tmp_path / "stub-repo"
+    shutil.copytree(template_dir, repo / "templates")
+    with GitHubStub(repo) as stub:
+        yield stub
+
+
+@pytest.fixture
+def stub_config(tmp_path: Path, test_config: Path, github_stub) -> Path:
+    """github_stub を参照するテスト用config.json（環境変数にも設定）"""
+    config = json.loads(test_config.read_text())
+    config["github"] = github_stub.github_config()
+
+    config_dir = tmp_path / "stub-config"
+    config_dir.mkdir()
+    config_file = config_dir / "config.json"
+    config_file.write_text(json.dumps(config, indent=2))
+
+    os.environ["VSCODE_TEMPLATE_CONFIG"] = str(config_file)
+    return config_file
+
+
 @pytest.fixture
 def test_dir() -> Generator[Path, None, None]:
     """一時テストディレクトリを作成"""
@@ -0,0 +1,281 @@
+"""GitHub のローカル代替サーバー（テスト・ベンチマーク用）
+
+ディレクトリをリポジトリの内容として、次のエンドポイントを提供します。
+
+  raw.githubusercontent.com  GET /{user}/{repo}/{branch}/{path}
+  Trees API                  GET /repos/{user}/{repo}/git/trees/{branch}?recursive=1
+  codeload（tarball）        GET /{user}/{repo}/tar.gz/{branch}（refs/heads/{branch} も可）
+
+各ベースURL（raw_base_url, api_base_url, codeload_base_url）は同じサーバーを指し、
+エンドポイントはパスの形で区別します。ネットワークの挙動は次の設定で再現できます。
+
+  latency     リクエストごとの遅延（秒）
+  bandwidth   応答本文の転送速度の上限（バイト/秒）
+  fail()      パスのグロブに一致するリクエストを 404/5xx/429（レート制限）にする
+  ETag        全ての応答に付与し、If-None-Match が一致する場合は 304 を返す
+
+使用例:
+    with GitHubStub(repo_root, latency=0.02) as stub:
+        stub.fail("templates/*/broken.json", 500, times=1)
+        config["github"]["raw_base_url"] = stub.raw_base_url
+"""
+import gzip
+import hashlib
+import io
+import json
+import tarfile
+import threading
+import time
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+
+class FailureRule:
+    """障害注入のルール（パスのグロブ、ステータス、残り回数）"""
+
+    def __init__(self, pattern: str, status: int, times: Optional[int] = None, retry_after: int = 60):
+        self.pattern = pattern
+        self.status = status
+        self.remaining = times
+        self.retry_after = retry_after
+
+
+class GitHubStub:
+    """GitHub のローカル代替サーバー"""
+
+    def __init__(self, root: Path, user: str = "stub-user", repo: str = "stub-repo", branch: str = "main",
+                 latency: float = 0.0, bandwidth: Optional[int] = None):
+        self.root = Path(root)
+        self.user = user
+        self.repo = repo
+        self.branch = branch
+        self.latency = latency
+        self.bandwidth = bandwidth
+        # (メソッド, パス, ステータス) の記録
+        self.requests: List[Tuple[str, str, int]] = []
+        self._rules: List[FailureRule] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 起動・停止
+    # ------------------------------------------------------------------
+
+    def start(self) -> "GitHubStub":
+        stub = self
+
+        class Handler(_StubHandler):
+            server_stub = stub
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "GitHubStub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    raw_base_url = base_url
+    api_base_url = base_url
+    codeload_base_url = base_url
+
+    def github_config(self) -> dict:
+        """config.json の github セクション（このサーバーを参照する）"""
+        return {"user": self.user, "repo": self.repo, "branch": self.branch, "raw_base_url": self.raw_base_url}
+
+    # ------------------------------------------------------------------
+    # 障害注入・記録
+    # ------------------------------------------------------------------
+
+    def fail(self, pattern: str, status: int, times: Optional[int] = None, retry_after: int = 60) -> None:
+        """
+        リポジトリ内のパスがグロブに一致するリクエストを失敗させる
+
+        Args:
+            pattern: リポジトリ内のパスのグロブ（Trees API は "@trees"、tarball は "@tarball"）
+            status: 返すステータス（429 と 403 はレート制限のヘッダーを付与）
+            times: 失敗させる回数（None の場合は常に）
+            retry_after: 429 の Retry-After（秒）
+        """
+        with self._lock:
+            self._rules.append(FailureRule(pattern, status, times, retry_after))
+
+    def clear_failures(self) -> None:
+        with self._lock:
+            self._rules.clear()
+
+    def count(self, path_glob: str = "*", status: Optional[int] = None) -> int:
+        """記録したリクエストのうち、パスがグロブに一致するものの数"""
+        with self._lock:
+            return sum(1 for _, path, code in self.requests
+                       if fnmatch(path, path_glob) and (status is None or code == status))
+
+    def _match_failure(self, repo_path: str) -> Optional[FailureRule]:
+        with self._lock:
+            for rule in self._rules:
+                if rule.remaining == 0 or not fnmatch(repo_path, rule.pattern):
+                    continue
+                if rule.remaining is not None:
+                    rule.remaining -= 1
+                return rule
+        return None
+
+    def _record(self, method: str, path: str, status: int) -> None:
+        with self._lock:
+            self.requests.append((method, path, status))
+
+    # ------------------------------------------------------------------
+    # 内容
+    # ------------------------------------------------------------------
+
+    def _files(self) -> List[Path]:
+        return sorted(path for path in self.root.rglob("*") if path.is_file())
+
+    def trees_body(self) -> bytes:
+        tree = []
+        for path in sorted(self.root.rglob("*")):
+            rel = path.relative_to(self.root).as_posix()
+            if path.is_dir():
+                tree.append({"path": rel, "mode": "040000", "type": "tree", "sha": _sha(rel.encode())})
+            elif path.is_file():
+                content = path.read_bytes()
+                tree.append({"path": rel, "mode": "100644", "type": "blob", "sha": _git_blob_sha(content),
+                             "size": len(content)})
+        body = {"sha": _sha(self.branch.encode()), "tree": tree, "truncated": False}
+        return json.dumps(body).encode("utf-8")
+
+    def tarball_body(self) -> bytes:
+        buffer = io.BytesIO()
+        prefix = f"{self.repo}-{self.branch}"
+        # mtime を固定して同じ内容から同じ tarball（同じ ETag）を作る
+        with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as compressed:
+            with tarfile.open(fileobj=compressed, mode="w") as archive:
+                for path in self._files():
+                    info = tarfile.TarInfo(f"{prefix}/{path.relative_to(self.root).as_posix()}")
+                    content = path.read_bytes()
+                    info.size = len(content)
+                    info.mode = 0o644
+                    archive.addfile(info, io.BytesIO(content))
+        return buffer.getvalue()
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def _git_blob_sha(content: bytes) -> str:
+    return _sha(b"blob %d\0" % len(content) + content)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server_stub: GitHubStub
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self._handle(send_body=False)
+
+    def do_GET(self) -> None:
+        self._handle(send_body=True)
+
+    def _handle(self, send_body: bool) -> None:
+        stub = self.server_stub
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        parsed = urlsplit(self.path)
+        repo_path, body_factory, content_type = self._route(unquote(parsed.path))
+        status = 404
+        body = b"404: Not Found"
+        headers = {"Content-Type": "text/plain; charset=utf-8"}
+
+        rule = stub._match_failure(repo_path) if repo_path is not None else None
+        if rule is not None:
+            status = rule.status
+            body = f"{status}: injected failure".encode()
+            if status in (403, 429):
+                headers.update({"Retry-After": str(rule.retry_after), "X-RateLimit-Limit": "60",
+                                "X-RateLimit-Remaining": "0",
+                                "X-RateLimit-Reset": str(int(time.time()) + rule.retry_after)})
+                body = json.dumps({"message": "API rate limit exceeded"}).encode()
+        elif body_factory is not None:
+            content = body_factory()
+            if content is not None:
+                etag = f'"{_sha(content)}"'
+                headers = {"Content-Type": content_type, "ETag": etag}
+                if self.headers.get("If-None-Match") == etag:
+                    status, body = 304, b""
+                else:
+                    status, body = 200, content
+
+        stub._record(self.command, parsed.path, status)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)) if status != 304 else "0")
+        self.end_headers()
+        if send_body and status != 304:
+            self._write_body(body)
+
+    def _route(self, path: str):
+        """(リポジトリ内のパス, 本文を返す関数, Content-Type) を返す（該当しない場合は (None, None, None)）"""
+        stub = self.server_stub
+        parts = path.strip("/").split("/")
+
+        # Trees API
+        trees = ["repos", stub.user, stub.repo, "git", "trees", stub.branch]
+        if parts == trees:
+            return "@trees", stub.trees_body, "application/json; charset=utf-8"
+
+        # codeload
+        if parts[:3] == [stub.user, stub.repo, "tar.gz"] and parts[3:] in ([stub.branch],
+                                                                           ["refs", "heads", stub.branch]):
+            return "@tarball", stub.tarball_body, "application/x-gzip"
+
+        # raw
+        if len(parts) > 3 and parts[:3] == [stub.user, stub.repo, stub.branch]:
+            repo_path = "/".join(parts[3:])
+            file_path = (stub.root / repo_path).resolve()
+            if stub.root.resolve() not in file_path.parents or not file_path.is_file():
+                return repo_path, None, None
+            return repo_path, file_path.read_bytes, "text/plain; charset=utf-8"
+
+        return None, None, None
+
+    def _write_body(self, body: bytes) -> None:
+        bandwidth = self.server_stub.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+
+        # 帯域の上限: 10ms 分ずつ送信して待つ
+        chunk = max(1, bandwidth // 100)
+        start = time.perf_counter()
+        sent = 0
+        for offset in range(0, len(body), chunk):
+            self.wfile.write(body[offset:offset + chunk])
+            sent += len(body[offset:offset + chunk])
+            delay = sent / bandwidth - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
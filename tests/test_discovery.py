@@ -0,0 +1,501 @@
+"""テンプレート探索のユニットテスト
+
+テスト構成:
+1. パターン照合: コンパイル済みの照合器が fnmatch と同じ結果を返すこと
+2. ローカル探索: 枝刈り付きの scandir 探索とディレクトリ内容のキャッシュ
+3. 設定の解決: テンプレートごとの実効設定と設定キャッシュ
+4. ファイル転送: マージしないファイルのストリーミング転送と reflink/hardlink による配置
+5. 適用対象の絞り込み: --only / --exclude の探索時の適用
+"""
+import errno
+import io
+import json
+import os
+from fnmatch import fnmatch
+
+import pytest
+
+
+MERGE_PATTERNS = {
+    "json": ["*.json", "*.code-snippets"],
+    "yaml": ["*.yaml", "*.yml"],
+    "line_based": [".gitignore", ".dockerignore", "requirements*.txt"],
+    "text": ["settings.json", "[Mm]akefile", "?akefile.inc"],
+}
+
+
+def legacy_get_file_format(filename, merge_patterns):
+    """従来の実装（フォーマットごとに全パターンを fnmatch で走査）"""
+    for format_name, patterns in merge_patterns.items():
+        if any(fnmatch(filename, pattern) for pattern in patterns):
+            return format_name
+    return None
+
+
+# ============================================================================
+# 1. パターン照合テスト
+# ============================================================================
+
+class TestPatternMatcher:
+    """PatternMatcher のテスト"""
+
+    @pytest.mark.parametrize("filename", [
+        "settings.json", "launch.json", "python.code-snippets", "docker-compose.yml",
+        "config.yaml", ".gitignore", ".dockerignore", "requirements-dev.txt",
+        "Makefile", "makefile", "Makefile.inc", "README.md", "json", ".json",
+    ])
+    def test_same_result_as_fnmatch(self, startup_module, filename):
+        """照合結果（優先順位を含む）が fnmatch による走査と一致する"""
+        matcher = startup_module.PatternMatcher.from_groups(MERGE_PATTERNS)
+
+        assert matcher.match(filename) == legacy_get_file_format(filename, MERGE_PATTERNS)
+        assert startup_module.get_file_format(filename, MERGE_PATTERNS) == matcher.match(filename)
+
+    def test_earlier_glob_wins_over_later_literal(self, startup_module):
+        """先に定義されたグロブは、後に定義されたリテラルより優先される"""
+        matcher = startup_module.PatternMatcher([("*.json", "json"), ("settings.json", "text")])
+        assert matcher.match("settings.json") == "json"
+
+        matcher = startup_module.PatternMatcher([("settings.json", "text"), ("*.json", "json")])
+        assert matcher.match("settings.json") == "text"
+
+    def test_multi_star_patterns(self, startup_module, monkeypatch):
+        """* が複数のパターンの後のグロブも正しく照合する（3.9/3.10 の translate が含むグループを再現）"""
+        import fnmatch
+        import itertools
+
+        groups = itertools.count()
+        real_translate = fnmatch.translate
+
+        def translate_with_groups(pattern):
+            name = f"g{next(groups)}"
+            return f"(?=(?P<{name}>.*?))(?P={name}){real_translate(pattern)}"
+
+        patterns = {"json": ["*a*b.json"], "yaml": ["*.yml"], "toml": ["*.toml"]}
+        for translate in (real_translate, translate_with_groups):
+            monkeypatch.setattr(fnmatch, "translate", translate)
+            matcher = startup_module.PatternMatcher.from_groups(patterns)
+
+            assert matcher.match("aab.json") == "json"
+            assert matcher.match("x.yml") == "yaml"
+            assert matcher.match("x.toml") == "toml"
+            assert matcher.match("ba.json") is None
+
+    def test_membership_for_file_match_patterns(self, startup_module):
+        """ファイルマッチパターンはリテラル・グロブの両方で判定できる"""
+        matcher = startup_module.PatternMatcher([("settings.json", True), ("*.code-snippets", True)])
+
+        assert "settings.json" in matcher
+        assert "python.code-snippets" in matcher
+        assert "tasks.json" not in matcher
+
+    def test_config_compiles_once(self, startup_module, test_config):
+        """Config は照合器を一度だけコンパイルする"""
+        config = startup_module.Config(test_config)
+
+        assert config.merge_matcher is config.merge_matcher
+        assert config.merge_matcher.match("docker-compose.yml") == "yaml"
+        assert config.get_template_file_matcher("python/base") is config.get_template_file_matcher("python/base")
+
+
+# ============================================================================
+# 2. ローカル探索テスト
+# ============================================================================
+
+def _make_tree(root, paths):
+    for path in paths:
+        file_path = root / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text("x")
+
+
+class TestLocalDiscovery:
+    """PathPatterns と TemplateSource のローカル探索のテスト"""
+
+    TREE = [
+        "settings.json",
+        "extra/settings.json",
+        "extra/tasks.json",
+        "snippets/python.code-snippets",
+        "snippets/deep/go.code-snippets",
+        "big/a/b/c/d.txt",
+        "big/e/f.txt",
+    ]
+
+    def _walk(self, startup_module, root, patterns):
+        listed = []
+
+        def list_dir(path):
+            listed.append(path.relative_to(root).as_posix())
+            return {entry.name: entry.is_dir() for entry in path.iterdir()} if path.is_dir() else None
+
+        return startup_module.PathPatterns(patterns).walk(root, list_dir), listed
+
+    def test_name_patterns_match_anywhere(self, startup_module, tmp_path):
+        """ファイル名のみのパターンは従来どおり任意の階層で一致する"""
+        _make_tree(tmp_path, self.TREE)
+        patterns = ["settings.json", "*.code-snippets"]
+
+        files, _ = self._walk(startup_module, tmp_path, patterns)
+
+        matcher = startup_module.PatternMatcher([(pattern, True) for pattern in patterns])
+        expected = sorted(p.relative_to(tmp_path).as_posix() for p in tmp_path.rglob("*")
+                          if p.is_file() and matcher.match(p.name))
+        assert files == expected
+
+    def test_path_patterns_prune_directories(self, startup_module, tmp_path):
+        """パス付きのパターンでは一致し得ないディレクトリを読まない"""
+        _make_tree(tmp_path, self.TREE)
+
+        files, listed = self._walk(startup_module, tmp_path, ["/settings.json", "snippets/*.code-snippets"])
+
+        assert files == ["settings.json", "snippets/python.code-snippets"]
+        assert sorted(listed) == [".", "snippets"]
+
+    def test_double_star(self, startup_module, tmp_path):
+        """** は0個以上のディレクトリに一致する"""
+        _make_tree(tmp_path, self.TREE)
+
+        files, listed = self._walk(startup_module, tmp_path, ["snippets/**/*.code-snippets", "big/**"])
+
+        assert files == ["big/a/b/c/d.txt", "big/e/f.txt",
+                         "snippets/deep/go.code-snippets", "snippets/python.code-snippets"]
+        assert "extra" not in listed
+
+    def test_matches_relative_path(self, startup_module):
+        """相対パスの判定"""
+        patterns = startup_module.PathPatterns(["/top.json", "a/*/c.json", "*.yml"])
+
+        assert "top.json" in patterns
+        assert "x/top.json" not in patterns
+        assert "a/b/c.json" in patterns
+        assert "a/b/x/c.json" not in patterns
+        assert "deep/dir/compose.yml" in patterns
+
+    def test_listing_cached_across_subfolders(self, startup_module, test_config, tmp_path, monkeypatch):
+        """サブフォルダごとの探索でディレクトリ内容が再利用される"""
+        _make_tree(tmp_path, ["templates/t/vscode/settings.json", "templates/t/config/.gitignore"])
+        source = startup_module.TemplateSource(startup_module.Config(test_config), local_path=tmp_path)
+
+        scanned = []
+        real_scandir = startup_module.os.scandir
+        monkeypatch.setattr(startup_module.os, "scandir", lambda path: scanned.append(path) or real_scandir(path))
+
+        found = {subfolder: source.list_template_files("templates", "t", subfolder)
+                 for subfolder in ("vscode", "snippets", "config", "docker")}
+        source.list_template_files("templates", "t", "vscode")
+
+        assert found == {"vscode": ["settings.json"], "snippets": [], "config": [".gitignore"], "docker": []}
+        # テンプレートのルート + 存在する2つのサブフォルダのみ（存在しないサブフォルダは読まない）
+        assert len(scanned) == 3
+
+
+# ============================================================================
+# 3. 設定の解決テスト
+# ============================================================================
+
+class TestConfigPlan:
+    """TemplatePlan と設定キャッシュのテスト"""
+
+    CONFIG = {
+        "github": {"user": "u", "repo": "r", "branch": "main"},
+        "folder_mapping": {"vscode": ".vscode", "config": "."},
+        "merge_patterns": {"json": ["*.json"]},
+        "file_match_patterns": ["settings.json", ".gitignore"],
+        "templates": {
+            "python/base": {
+                "folder_mapping": {"config": "conf"},
+                "file_match_patterns": ["pyproject.toml", "settings.json"],
+            },
+        },
+    }
+
+    @pytest.fixture
+    def config_file(self, tmp_path):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps(self.CONFIG))
+        return path
+
+    def test_plan_resolves_effective_settings(self, startup_module, config_file):
+        """グローバル設定とテンプレート固有の設定が解決される"""
+        plan = startup_module.Config(config_file).plan("python/base")
+
+        assert plan.folder_mapping == (("vscode", ".vscode"), ("config", "conf"))
+        assert plan.file_patterns == ("settings.json", ".gitignore", "pyproject.toml")
+        assert "pyproject.toml" in plan.file_matcher
+        assert plan.merge_matcher.match("a.json") == "json"
+
+    def test_unknown_template_uses_global_settings(self, startup_module, config_file):
+        """templates セクションにないテンプレートはグローバル設定のみ"""
+        plan = startup_module.Config(config_file).plan("other")
+
+        assert plan.folder_mapping == (("vscode", ".vscode"), ("config", "."))
+        assert plan.file_patterns == ("settings.json", ".gitignore")
+
+    def test_plan_is_immutable(self, startup_module, config_file):
+        """実効設定は変更できない"""
+        plan = startup_module.Config(config_file).plan("python/base")
+        with pytest.raises(AttributeError):
+            plan.file_patterns = ()
+
+    def test_cache_used_until_config_changes(self, startup_module, config_file, monkeypatch):
+        """2回目以降はキャッシュを使用し、設定ファイルが更新されると読み直す"""
+        startup_module.Config(config_file)
+        cache_path = config_file.with_name(".config.json.cache")
+        assert cache_path.exists()
+
+        def fail(*args, **kwargs):
+            raise AssertionError("config.json が再解析された")
+
+        monkeypatch.setattr(startup_module.json, "load", fail)
+        assert startup_module.Config(config_file).plan("python/base").file_patterns[-1] == "pyproject.toml"
+        monkeypatch.undo()
+
+        changed = dict(self.CONFIG, file_match_patterns=["tasks.json"])
+        config_file.write_text(json.dumps(changed))
+        stat = config_file.stat()
+        os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        assert startup_module.Config(config_file).plan("other").file_patterns == ("tasks.json",)
+
+    def test_corrupt_cache_is_ignored(self, startup_module, config_file):
+        """壊れたキャッシュは無視して設定ファイルを読み直す"""
+        config_file.with_name(".config.json.cache").write_bytes(b"broken")
+        assert startup_module.Config(config_file).branch == "main"
+
+
+# ============================================================================
+# 4. ファイル転送テスト
+# ============================================================================
+
+class FakeResponse(io.BytesIO):
+    """urlopen の応答の代わり（読み込みサイズを記録する）"""
+
+    def __init__(self, data, content_length=None):
+        super().__init__(data)
+        self.headers = {} if content_length is None else {"Content-Length": str(content_length)}
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+class TestFileTransfer:
+    """copy_file と TemplateSource.transfer_file のテスト"""
+
+    DATA = os.urandom(3 * 1024 * 1024 + 17)
+
+    def test_copy_file_uses_kernel_copy(self, startup_module, tmp_path):
+        """内容が一致し、カーネル内コピーが使用される"""
+        source = tmp_path / "asset.bin"
+        source.write_bytes(self.DATA)
+
+        method = startup_module.copy_file(source, tmp_path / "copy.bin")
+
+        assert (tmp_path / "copy.bin").read_bytes() == self.DATA
+        assert method in ("copy_file_range", "sendfile")
+        assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+    @pytest.mark.parametrize("unsupported, expected", [
+        (["copy_file_range"], "sendfile"),
+        (["copy_file_range", "sendfile"], "copy"),
+    ])
+    def test_copy_file_falls_back(self, startup_module, tmp_path, monkeypatch, unsupported, expected):
+        """カーネル内コピーが使用できない場合は次の方法で続きからコピーする"""
+        source = tmp_path / "asset.bin"
+        source.write_bytes(self.DATA)
+
+        real_copy_file_range, real_sendfile = os.copy_file_range, os.sendfile
+
+        def partial_then_fail(name):
+            # 1回目は途中まで（1000バイト）コピーし、2回目以降は未対応として失敗させる
+            calls = []
+
+            def wrapper(*args):
+                calls.append(args)
+                if len(calls) > 1:
+                    raise OSError(errno.EXDEV, "unsupported")
+                if name == "copy_file_range":
+                    return real_copy_file_range(args[0], args[1], 1000, *args[3:])
+                return real_sendfile(args[0], args[1], args[2], 1000)
+            return wrapper
+
+        for name in unsupported:
+            monkeypatch.setattr(startup_module.os, name, partial_then_fail(name))
+
+        assert startup_module.copy_file(source, tmp_path / "copy.bin") == expected
+        assert (tmp_path / "copy.bin").read_bytes() == self.DATA
+
+    def test_local_transfer_streams_large_files(self, startup_module, test_config, tmp_path, monkeypatch):
+        """しきい値以上のローカルファイルはメモリに読み込まずにコピーする"""
+        (tmp_path / "templates").mkdir()
+        (tmp_path / "templates" / "large.bin").write_bytes(self.DATA)
+        (tmp_path / "templates" / "small.txt").write_bytes(b"small")
+        source = startup_module.TemplateSource(startup_module.Config(test_config), local_path=tmp_path,
+                                               stream_threshold=1024 * 1024)
+
+        copied = []
+        real_copy = startup_module.copy_file
+        monkeypatch.setattr(startup_module, "copy_file", lambda src, dest: copied.append(src.name) or real_copy(src, dest))
+
+        out = tmp_path / "out"
+        assert source.transfer_file("templates/large.bin", out / "large.bin")
+        assert source.transfer_file("templates/small.txt", out / "small.txt")
+        assert not source.transfer_file("templates/missing.txt", out / "missing.txt")
+
+        assert copied == ["large.bin"]
+        assert (out / "large.bin").read_bytes() == self.DATA
+        assert (out / "small.txt").read_bytes() == b"small"
+
+    @pytest.mark.parametrize("content_length", [len(DATA), None])
+    def test_remote_transfer_writes_chunks(self, startup_module, test_config, tmp_path, monkeypatch, content_length):
+        """サイズが大きい・不明なリモートファイルはチャンク単位で書き出す"""
+        source = startup_module.TemplateSource(startup_module.Config(test_config), chunk_size=64 * 1024)
+        response = FakeResponse(self.DATA, content_length)
+        monkeypatch.setattr(source, "_open_github",
+                            lambda path, report_errors=True: None if path == startup_module.TEMPLATE_INDEX_NAME
+                            else response)
+
+        assert source.transfer_file("templates/t/docker/asset.bin", tmp_path / "asset.bin")
+
+        assert (tmp_path / "asset.bin").read_bytes() == self.DATA
+        assert set(response.reads) == {64 * 1024}
+
+    def test_remote_transfer_keeps_existing_file_on_error(self, startup_module, test_config, tmp_path, monkeypatch):
+        """受信中にエラーが発生した場合は既存ファイルを残す"""
+        source = startup_module.TemplateSource(startup_module.Config(test_config))
+        response = FakeResponse(self.DATA)
+        response.read = lambda size=-1: (_ for _ in ()).throw(ConnectionResetError("reset"))
+        monkeypatch.setattr(source, "_open_github",
+                            lambda path, report_errors=True: None if path == startup_module.TEMPLATE_INDEX_NAME
+                            else response)
+        (tmp_path / "asset.bin").write_bytes(b"old")
+
+        assert not source.transfer_file("templates/t/docker/asset.bin", tmp_path / "asset.bin")
+        assert (tmp_path / "asset.bin").read_bytes() == b"old"
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["asset.bin"]
+
+
+class TestLinkPlacement:
+    """place_file のテスト"""
+
+    @pytest.fixture
+    def source(self, tmp_path):
+        path = tmp_path / "templates" / "asset.bin"
+        path.parent.mkdir()
+        path.write_bytes(b"asset" * 1000)
+        return path
+
+    def test_hardlink_shares_file(self, startup_module, source, tmp_path):
+        """hardlink ではテンプレートと同じファイルを共有し、再配置しても一時ファイルを残さない"""
+        dest = tmp_path / "project" / "asset.bin"
+        dest.parent.mkdir()
+        dest.write_bytes(b"old")
+
+        assert startup_module.place_file(source, dest, "hardlink") == "hardlink"
+        assert startup_module.place_file(source, dest, "hardlink") == "hardlink"
+
+        assert os.path.samefile(source, dest)
+        assert os.listdir(dest.parent) == ["asset.bin"]
+
+    def test_falls_back_to_copy(self, startup_module, source, tmp_path, monkeypatch):
+        """ハードリンク・reflink が使用できない場合はコピーする"""
+        def cross_device(*args):
+            raise OSError(errno.EXDEV, "cross-device link")
+
+        monkeypatch.setattr(startup_module.os, "link", cross_device)
+        monkeypatch.setattr(startup_module, "_reflink", lambda src, dest: False)
+        dest = tmp_path / "asset.bin"
+
+        assert startup_module.place_file(source, dest, "hardlink") in ("copy_file_range", "sendfile", "copy")
+        assert dest.read_bytes() == source.read_bytes()
+        assert not os.path.samefile(source, dest)
+
+    def test_reflink_or_copy(self, startup_module, source, tmp_path):
+        """reflink はファイルシステムが未対応の場合コピーになる（内容は常に一致）"""
+        dest = tmp_path / "asset.bin"
+
+        method = startup_module.place_file(source, dest, "reflink")
+
+        assert method in ("reflink", "copy_file_range", "sendfile", "copy")
+        assert dest.read_bytes() == source.read_bytes()
+        assert not os.path.samefile(source, dest)
+
+    def test_setup_never_hardlinks_merge_targets(self, startup_module, test_config, tmp_path, monkeypatch):
+        """マージ対象になり得るファイルはハードリンクしない（後のマージでテンプレートを書き換えないため）"""
+        template = tmp_path / "templates" / "docker" / "base"
+        _make_tree(template, ["config/Dockerfile", "vscode/settings.json"])
+        project = tmp_path / "project"
+        project.mkdir()
+        monkeypatch.chdir(project)
+
+        setup = startup_module.TemplateSetup(["docker/base"], config=startup_module.Config(test_config),
+                                             local_path=tmp_path, use_cache=False, link_mode="hardlink")
+        assert setup.run()
+
+        assert os.path.samefile(template / "config" / "Dockerfile", project / "Dockerfile")
+        assert not os.path.samefile(template / "vscode" / "settings.json", project / ".vscode" / "settings.json")
+
+
+# ============================================================================
+# 5. 適用対象の絞り込みテスト
+# ============================================================================
+
+class TestFileFilter:
+    """FileFilter と探索時の絞り込みのテスト"""
+
+    def test_matches_dest_or_template_path(self, startup_module):
+        """配置先・テンプレート内のどちらのパスでも指定でき、除外が優先される"""
+        file_filter = startup_module.FileFilter(only=[".vscode/settings.json", "config/*"], exclude=["*.bak"])
+
+        assert file_filter.accepts("vscode/settings.json", ".vscode/settings.json")
+        assert file_filter.accepts("config/.gitignore", ".gitignore")
+        assert not file_filter.accepts("vscode/tasks.json", ".vscode/tasks.json")
+        assert not file_filter.accepts("config/old.bak", "old.bak")
+        assert not startup_module.FileFilter()
+
+    def test_directory_pruning(self, startup_module):
+        """対象となり得ないディレクトリ、全体が除外されたディレクトリを判定できる"""
+        only = startup_module.FileFilter(only=[".vscode/settings.json"])
+        assert only.may_include_dir("vscode", ".vscode")
+        assert not only.may_include_dir("docker", "docker")
+        # 配置先がルートのサブフォルダは、.vscode/ を含む可能性があるため探索する
+        assert only.may_include_dir("config", ".")
+
+        exclude = startup_module.FileFilter(exclude=["docker/**"])
+        assert not exclude.may_include_dir("docker", ".")
+        assert exclude.may_include_dir("config", ".")
+
+    def test_local_discovery_skips_filtered(self, startup_module, test_config, tmp_path, monkeypatch):
+        """対象外のサブフォルダ・ディレクトリは読まず、対象のファイルだけを収集する"""
+        template = tmp_path / "templates" / "t"
+        _make_tree(template, ["vscode/settings.json", "vscode/tasks.json", "config/.gitignore",
+                              "docker/Dockerfile", "snippets/python.code-snippets"])
+        project = tmp_path / "project"
+        project.mkdir()
+        monkeypatch.chdir(project)
+
+        scanned = []
+        real_scandir = startup_module.os.scandir
+        monkeypatch.setattr(startup_module.os, "scandir", lambda path: scanned.append(path) or real_scandir(path))
+
+        setup = startup_module.TemplateSetup(["t"], config=startup_module.Config(test_config), local_path=tmp_path,
+                                             use_cache=False, only=["settings.json", "*.code-snippets"],
+                                             exclude=["snippets/**"])
+        assert setup._collect_files()
+
+        assert [dest.relative_to(project).as_posix() for _, dest, _ in setup.files_to_process] == [".vscode/settings.json"]
+        assert template / "snippets" not in scanned
+
+    def test_remote_discovery_skips_filtered(self, startup_module, test_config, monkeypatch):
+        """GitHub から取得する場合、対象外のファイルは取得を試行しない"""
+        source = startup_module.TemplateSource(startup_module.Config(test_config))
+        requested = []
+        monkeypatch.setattr(source, "get_file_content", lambda path: requested.append(path) or b"{}")
+
+        file_filter = startup_module.FileFilter(only=[".vscode/settings.json"])
+        files = source.list_template_files("templates", "default/base", "vscode", file_filter.for_folder("vscode", ".vscode"))
+
+        assert files == ["settings.json"]
+        assert requested == ["templates/default/base/vscode/settings.json"]
@@ -0,0 +1,769 @@
+"""マージエンジンのユニットテスト
+
+テスト構成:
+1. 並列マージ: プロセスプールとインライン実行の結果が一致すること
+2. コーデックレジストリ: 高速バックエンドとフォールバックの出力一致、登録による拡張
+3. コメント除去: 文字列を考慮した1パスのトークナイザ
+4. JSONCパッチ: コメント・書式を保持した差分適用
+5. 深いマージ: 反復処理・構造共有・リスト戦略
+6. マージ結果キャッシュ: メモリLRU・永続キャッシュ・ヒット率
+7. XMLマージ: 識別属性による対応付け・ストリーミング処理
+8. 行ベースマージ: ハッシュ値による重複排除・ストリーミング処理
+"""
+import json
+
+import pytest
+
+
+MERGE_PATTERNS = {
+    "json": ["*.json"],
+    "line_based": [".gitignore"],
+}
+
+
+# ============================================================================
+# 1. 並列マージテスト
+# ============================================================================
+
+class TestParallelMerge:
+    """MergeExecutor のテスト"""
+
+    def _jobs(self, count: int) -> list:
+        jobs = []
+        for i in range(count):
+            existing = json.dumps({"keep": i, "override": "old"}).encode()
+            contents = [json.dumps({"override": "new", "added": i}).encode()]
+            jobs.append((f"settings{i}.json", existing, contents, MERGE_PATTERNS))
+        return jobs
+
+    def test_small_jobs_run_inline(self, startup_module):
+        """閾値未満のジョブはプールを使わずに実行される"""
+        executor = startup_module.MergeExecutor(workers=4, min_jobs=8, min_bytes=1 << 20)
+        results = executor.run(self._jobs(2))
+
+        assert executor.used_pool is False
+        assert json.loads(results[0][0]) == {"keep": 0, "override": "new", "added": 0}
+
+    def test_pool_matches_inline(self, startup_module):
+        """プロセスプールの結果がインライン実行と一致し、稼働率が記録される"""
+        jobs = self._jobs(6)
+        inline = startup_module.MergeExecutor(workers=1).run(jobs)
+
+        executor = startup_module.MergeExecutor(workers=2, min_jobs=2)
+        pooled = executor.run(jobs)
+
+        assert executor.used_pool is True
+        assert [r[0] for r in pooled] == [r[0] for r in inline]
+        assert sum(count for count, _ in executor.worker_stats.values()) == len(jobs)
+
+    def test_merge_chain_folds_in_order(self, startup_module):
+        """同じ配置先への複数テンプレートが適用順に畳み込まれる"""
+        contents = [b"a\nb\n", b"b\nc\n"]
+        merged, steps, _, _ = startup_module.run_merge_chain(".gitignore", None, contents, MERGE_PATTERNS)
+
+        assert merged == b"a\nb\nc\n"
+        assert [action for action, _ in steps] == ["create", "merge"]
+
+    def test_merge_error_is_reported(self, startup_module):
+        """不正な内容はエラーとして報告され、既存内容が保持される"""
+        merged, steps, _, _ = startup_module.run_merge_chain(
+            "settings.json", b'{"a": 1}', [b"{broken"], MERGE_PATTERNS
+        )
+
+        assert merged == b'{"a": 1}'
+        assert steps[0][0] == "error"
+        assert "JSON マージエラー" in steps[0][1]
+
+
+# ============================================================================
+# 2. コーデックレジストリテスト
+# ============================================================================
+
+class TestCodecRegistry:
+    """FormatCodec / register_codec のテスト"""
+
+    def test_builtin_formats_registered(self, startup_module):
+        """標準フォーマットがすべて登録されている"""
+        assert {"json", "yaml", "toml", "xml", "line_based"} <= set(startup_module.CODECS)
+
+    @pytest.mark.parametrize("codec_class, existing, new", [
+        ("JsonCodec", b'{"a": {"b": 1}, "u": "\\u65e5\\u672c"} // c', b'{"a": {"c": [1.5, 2]}}'),
+        ("YamlCodec", "services:\n  web:\n    image: nginx  # c\n名前: 値\n".encode(), b"services:\n  db: {image: pg}\n"),
+        ("TomlCodec", b'[tool.a]\nx = 1\n', b'[tool.a]\ny = "z"\n[tool.b]\nlist = [1, 2]\n'),
+    ])
+    def test_fallback_output_identical(self, startup_module, codec_class, existing, new):
+        """純Pythonのフォールバックが高速バックエンドと同一の出力を生成する"""
+        fast = getattr(startup_module, codec_class)()
+        fallback = getattr(startup_module, codec_class)(prefer_fast=False)
+        if not fast.available:
+            pytest.skip(f"{codec_class} のバックエンドが利用できません")
+
+        assert fast.merge_content(existing, new) == fallback.merge_content(existing, new)
+
+    def test_yaml_dumpers_identical_on_realistic_document(self, startup_module):
+        """libyaml と純Pythonのダンパーが、長い文字列・Unicode・ネストしたリスト・アンカーを含む文書で同一の出力を生成する"""
+        fast = startup_module.YamlCodec()
+        fallback = startup_module.YamlCodec(prefer_fast=False)
+        if fast.backend != "libyaml":
+            pytest.skip("libyaml が利用できません")
+
+        existing = """x-defaults: &defaults
+  restart: unless-stopped
+  logging:
+    driver: json-file
+    options: {max-size: 10m, max-file: "3"}
+  environment: &env
+    TZ: Asia/Tokyo
+    GREETING: "こんにちは、世界 🌏 — ünïcödé ✓"
+services:
+  web:
+    <<: *defaults
+    image: nginx:1.25
+    command: ["nginx", "-g", "daemon off;"]
+    ports: ["80:80", "443:443"]
+    healthcheck:
+      test: [CMD-SHELL, "curl -fsS http://localhost/healthz || exit 1"]
+      interval: 30s
+  worker:
+    <<: *defaults
+    environment:
+      <<: *env
+      DESCRIPTION: >-
+        This is a deliberately long folded string that goes well past the default line width of eighty
+        characters so that both dumpers have to decide where to wrap it, including a tab\tand quotes "here".
+    volumes:
+      - - nested
+        - - deeper
+          - {key: value, list: [1, 2.5, null, true, 0o17, 1e3]}
+      - "説明: 日本語の長い文字列を含む行で、折り返しの位置が両方のダンパーで一致することを確認するためのテキストです。"
+"""
+        new = """services:
+  worker:
+    command: [python, -m, app.worker, "--queue=default", "--concurrency=4"]
+  scheduler:
+    command: [python, -m, app.scheduler]
+    labels:
+      multiline: |
+        line one
+        行 two 🚀
+"""
+
+        merged = fast.merge_content(existing.encode(), new.encode())
+        assert merged == fallback.merge_content(existing.encode(), new.encode())
+        assert "🌏".encode() in merged and "🚀".encode() in merged
+        data = fast.parse(merged)
+        assert fast.serialize(data) == fallback.serialize(data)
+
+    def test_yaml_output_identical_for_random_strings(self, startup_module):
+        """改行・\\x85・長い行を含むランダムな文字列でも両方のバックエンドの出力・読み込み結果が一致する"""
+        import random
+
+        fast = startup_module.YamlCodec()
+        fallback = startup_module.YamlCodec(prefer_fast=False)
+        if fast.backend != "libyaml":
+            pytest.skip("libyaml が利用できません")
+
+        rng = random.Random(0)
+        alphabet = "abcXYZ019 ,.:#-'\"\n\t\x85\u2028é日🌏"
+        for _ in range(2000):
+            data = {"k": "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 120))),
+                    "list": ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))]}
+            serialized = fast.serialize(data)
+            assert serialized == fallback.serialize(data), data
+            assert fast.parse(serialized) == fallback.parse(serialized)
+
+    def test_register_new_format(self, startup_module):
+        """登録のみで新しいフォーマットがマージ対象になる"""
+
+        class KeyValueCodec(startup_module.FormatCodec):
+            name = "kv"
+            label = "KV"
+
+            def parse(self, content):
+                return dict(line.split("=", 1) for line in content.decode().splitlines() if line)
+
+            def serialize(self, data):
+                return "".join(f"{k}={v}\n" for k, v in sorted(data.items())).encode()
+
+        startup_module.register_codec(KeyValueCodec())
+        try:
+            merged, error = startup_module.merge_structured_content(
+                "app.env", b"A=1\nB=2\n", b"B=3\nC=4\n", {"kv": ["*.env"]}
+            )
+        finally:
+            del startup_module.CODECS["kv"]
+
+        assert error is None
+        assert merged == b"A=1\nB=3\nC=4\n"
+
+
+# ============================================================================
+# 3. コメント除去テスト
+# ============================================================================
+
+def _rstrip_lines(text: str) -> str:
+    """行末の空白を除去（コメント直前の空白は保持されるため）"""
+    return "\n".join(line.rstrip() for line in text.split("\n"))
+
+
+class TestCommentLexer:
+    """strip_comments のテスト"""
+
+    def test_json_glob_patterns_in_strings_preserved(self, startup_module):
+        """文字列内の /* や // はコメントとして扱われない"""
+        content = '''{
+  // 除外設定
+  "files.exclude": {"src/**/*.js": true, "**/*.tmp": true}, /* block */
+  "url": "https://example.com", "quote": "a\\"//b"
+}'''
+        data = json.loads(startup_module.strip_json_comments(content))
+
+        assert data["files.exclude"] == {"src/**/*.js": True, "**/*.tmp": True}
+        assert data["url"] == "https://example.com"
+        assert data["quote"] == 'a"//b'
+
+    def test_yaml_hash_requires_preceding_whitespace(self, startup_module):
+        """YAMLの # は行頭または空白の後のみコメントになる"""
+        content = "url: http://x/#frag  # comment\nq: 'a # b'\nit: don't # c\n"
+        stripped = _rstrip_lines(startup_module.strip_yaml_comments(content))
+
+        assert stripped == "url: http://x/#frag\nq: 'a # b'\nit: don't\n"
+
+    def test_toml_multiline_strings_preserved(self, startup_module):
+        """TOMLの複数行文字列内の # は保持される"""
+        content = 'x = """\n# not a comment\n""" # comment\ny = \'#\' # c\n'
+        stripped = _rstrip_lines(startup_module.strip_toml_comments(content))
+
+        assert stripped == 'x = """\n# not a comment\n"""\ny = \'#\'\n'
+
+
+# ============================================================================
+# 4. JSONCパッチテスト
+# ============================================================================
+
+class TestJsoncPatch:
+    """patch_jsonc / JsonCodec の書式保持マージのテスト"""
+
+    EXISTING = """{
+  // エディタ設定
+  "editor.tabSize": 2,
+  "editor.rulers": [80, 120],
+  "files.exclude": {
+    "**/.git": true, // git
+  },
+  /* 保存 */
+  "files.autoSave": "afterDelay"  // 自動保存
+}
+"""
+
+    def test_unchanged_keys_produce_identical_text(self, startup_module):
+        """値が変わらない場合はテキストが一切変更されない"""
+        patched = startup_module.patch_jsonc(self.EXISTING, {"editor.tabSize": 2, "files.exclude": {"**/.git": True}})
+
+        assert patched == self.EXISTING
+
+    def test_only_changed_regions_are_edited(self, startup_module):
+        """変更されたキーのみ編集され、コメントと他の行はそのまま残る"""
+        patched = startup_module.patch_jsonc(self.EXISTING, {
+            "editor.tabSize": 4,
+            "editor.rulers": [100],
+            "files.exclude": {"**/node_modules": True},
+            "newSetting": "v",
+        })
+
+        assert patched == """{
+  // エディタ設定
+  "editor.tabSize": 4,
+  "editor.rulers": [100],
+  "files.exclude": {
+    "**/.git": true, // git
+    "**/node_modules": true,
+  },
+  /* 保存 */
+  "files.autoSave": "afterDelay",  // 自動保存
+  "newSetting": "v"
+}
+"""
+
+    def test_result_matches_full_merge(self, startup_module, template_dir):
+        """パッチ結果のデータが従来の深いマージと一致する"""
+        codec = startup_module.CODECS["json"]
+        existing = (template_dir / "default" / "base" / "vscode" / "settings.json").read_bytes()
+        new = (template_dir / "python" / "base" / "vscode" / "settings.json").read_bytes()
+
+        patched = codec.merge_content(existing, new)
+
+        assert codec.parse(patched) == startup_module.merge_json(codec.parse(existing), codec.parse(new))
+        assert b"// ====" in patched
+
+    def test_non_object_root_falls_back(self, startup_module):
+        """ルートがオブジェクトでない場合は通常のマージにフォールバックする"""
+        assert startup_module.patch_jsonc("[1, 2]", {"a": 1}) is None
+
+    def test_crlf_line_endings_preserved(self, startup_module):
+        """CRLFのファイルに挿入する行もCRLFで書き出す"""
+        new_data = {
+            "editor.rulers": [100],
+            "files.exclude": {"**/node_modules": True},
+            "newSetting": {"nested": [1, 2]},
+        }
+        patched = startup_module.patch_jsonc(self.EXISTING.replace("\n", "\r\n"), new_data)
+
+        assert "\n" not in patched.replace("\r\n", "")
+        assert patched.replace("\r\n", "\n") == startup_module.patch_jsonc(self.EXISTING, new_data)
+
+    def test_replaced_value_with_trailing_comma(self, startup_module):
+        """末尾カンマを含む既存の値も置き換えられる（文字列内のカンマは保持）"""
+        existing = """{
+  "list": [1, 2,],
+  "object": {"a": "x,]", /* c */},
+  "same": [1,],
+}
+"""
+        patched = startup_module.patch_jsonc(existing, {"list": [3], "object": 5, "same": [1]})
+
+        assert patched == """{
+  "list": [3],
+  "object": 5,
+  "same": [1,],
+}
+"""
+
+
+# ============================================================================
+# 5. 深いマージテスト
+# ============================================================================
+
+class TestDeepMerge:
+    """deep_merge のテスト"""
+
+    def test_untouched_subtrees_are_shared(self, startup_module):
+        """新しいデータが触れない部分木はコピーされず、入力は変更されない"""
+        existing = {"a": {"x": 1, "y": {"z": 2}}, "b": {"c": [1, 2]}}
+        new = {"a": {"x": 10}}
+
+        merged = startup_module.deep_merge(existing, new)
+
+        assert merged == {"a": {"x": 10, "y": {"z": 2}}, "b": {"c": [1, 2]}}
+        assert merged["b"] is existing["b"]
+        assert merged["a"]["y"] is existing["a"]["y"]
+        assert existing["a"]["x"] == 1
+
+    def test_deep_nesting_without_recursion_limit(self, startup_module):
+        """再帰上限を超える深さでもマージできる"""
+        depth = 5000
+        existing, new = {"v": "old", "keep": True}, {"v": "new"}
+        for _ in range(depth):
+            existing, new = {"n": existing}, {"n": new}
+
+        merged = startup_module.deep_merge(existing, new)
+
+        for _ in range(depth):
+            merged = merged["n"]
+        assert merged == {"v": "new", "keep": True}
+
+    @pytest.mark.parametrize("strategy,expected", [
+        ("replace", ["b", "c"]),
+        ("append", ["a", "b", "b", "c"]),
+        ("union", ["a", "b", "c"]),
+    ])
+    def test_list_strategies(self, startup_module, strategy, expected):
+        """リスト戦略ごとの結果"""
+        merged = startup_module.deep_merge({"l": ["a", "b"]}, {"l": ["b", "c"]}, strategy)
+        assert merged == {"l": expected}
+
+    def test_union_by_key_merges_matching_items(self, startup_module):
+        """list_merge_key が一致する辞書要素は深くマージされる"""
+        existing = {"services": [{"name": "web", "env": {"A": "1"}}, {"name": "db"}]}
+        new = {"services": [{"name": "web", "env": {"B": "2"}}, {"name": "cache"}]}
+
+        merged = startup_module.deep_merge(existing, new, "union", "name")
+
+        assert merged == {"services": [
+            {"name": "web", "env": {"A": "1", "B": "2"}},
+            {"name": "db"},
+            {"name": "cache"},
+        ]}
+
+    def test_jsonc_patch_honours_list_strategy(self, startup_module):
+        """JSONCパッチでもリスト戦略が適用される"""
+        codec = startup_module.CODECS["json"]
+        existing = b'{\n  // rulers\n  "editor.rulers": [80]\n}\n'
+        new = b'{"editor.rulers": [80, 100]}'
+        options = {"list_strategy": "union"}
+
+        patched = codec.merge_content(existing, new, options)
+
+        assert b"// rulers" in patched
+        assert codec.parse(patched) == codec.merge(codec.parse(existing), codec.parse(new), options)
+        assert codec.parse(patched) == {"editor.rulers": [80, 100]}
+
+    def test_unknown_strategy_is_rejected(self, startup_module):
+        """未知のリスト戦略はエラー"""
+        with pytest.raises(ValueError):
+            startup_module.deep_merge({"l": [1]}, {"l": [2]}, "zip")
+
+
+# ============================================================================
+# 6. マージ結果キャッシュテスト
+# ============================================================================
+
+class TestMergeCache:
+    """MergeCache と MergeExecutor のキャッシュ連携のテスト"""
+
+    def _job(self, existing: bytes, new: bytes, options=None) -> tuple:
+        return ("settings.json", existing, [new], MERGE_PATTERNS, options)
+
+    def test_repeated_job_hits_memory(self, startup_module):
+        """同じ内容の組み合わせは2回目以降キャッシュから返される"""
+        cache = startup_module.MergeCache()
+        executor = startup_module.MergeExecutor(workers=1, cache=cache)
+        job = self._job(b'{"a": 1}', b'{"b": 2}')
+
+        first = executor.run([job])
+        second = executor.run([job])
+
+        assert second[0][0] == first[0][0]
+        assert second[0][1] == first[0][1] == [("merge", None)]
+        assert (cache.memory_hits, cache.misses) == (1, 1)
+        assert cache.hit_rate == 0.5
+
+    def test_options_are_part_of_key(self, startup_module):
+        """マージオプションが異なる場合は別のエントリになる"""
+        cache = startup_module.MergeCache()
+        executor = startup_module.MergeExecutor(workers=1, cache=cache)
+        existing, new = b'{"l": [1]}', b'{"l": [2]}'
+
+        replaced = executor.run([self._job(existing, new)])[0][0]
+        appended = executor.run([self._job(existing, new, {"list_strategy": "append"})])[0][0]
+
+        assert json.loads(replaced) == {"l": [2]}
+        assert json.loads(appended) == {"l": [1, 2]}
+        assert cache.misses == 2
+
+    def test_persistent_tier_survives_new_instance(self, startup_module, tmp_path):
+        """永続キャッシュは別インスタンス（別の実行）からも参照できる"""
+        job = self._job(b'{"a": 1}', b'{"b": 2}')
+        first = startup_module.MergeExecutor(workers=1, cache=startup_module.MergeCache(directory=tmp_path))
+        merged = first.run([job])[0][0]
+
+        cache = startup_module.MergeCache(directory=tmp_path)
+        result = startup_module.MergeExecutor(workers=1, cache=cache).run([job])
+
+        assert result[0][0] == merged
+        assert (cache.disk_hits, cache.misses) == (1, 0)
+
+    def test_lru_evicts_oldest(self, startup_module):
+        """メモリ上のエントリ数は max_entries を超えない"""
+        cache = startup_module.MergeCache(max_entries=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, key.encode())
+
+        assert cache.get("a") is None
+        assert cache.get("c") == b"c"
+
+    def test_errors_are_not_cached(self, startup_module):
+        """エラーを含む結果はキャッシュされない"""
+        cache = startup_module.MergeCache()
+        executor = startup_module.MergeExecutor(workers=1, cache=cache)
+        job = self._job(b'{"a": 1}', b"{broken")
+
+        executor.run([job])
+        result = executor.run([job])
+
+        assert result[0][1][0][0] == "error"
+        assert cache.misses == 2
+
+
+# ============================================================================
+# 7. XMLマージテスト
+# ============================================================================
+
+class TestXmlMerge:
+    """XmlStreamMerger / XmlCodec のテスト"""
+
+    EXISTING = """<?xml version="1.0"?>
+<project xmlns="urn:p" xmlns:x="urn:x" version="4">
+  <!-- IDE設定 -->
+  <component name="Editor" x:scope="app">
+    <option name="tabSize" value="2" />
+    <list>
+      <item>one</item>
+    </list>
+  </component>
+  <modules />
+</project>
+""".encode("utf-8")
+
+    NEW = b"""<project xmlns="urn:p" version="5">
+  <component name="Editor">
+    <option name="tabSize" value="4" />
+    <list>
+      <item>one</item>
+      <item>two</item>
+    </list>
+  </component>
+  <component name="Vcs" />
+</project>
+"""
+
+    def test_elements_matched_by_identity_and_merged(self, startup_module):
+        """タグと識別属性で対応付けて再帰的にマージし、接頭辞・コメントを保持する"""
+        merged = startup_module.CODECS["xml"].merge_content(self.EXISTING, self.NEW).decode()
+
+        assert merged == """<?xml version='1.0' encoding='utf-8'?>
+<project xmlns="urn:p" xmlns:x="urn:x" version="5">
+  <!-- IDE設定 -->
+  <component name="Editor" x:scope="app">
+    <option name="tabSize" value="4" />
+    <list>
+      <item>one</item>
+      <item>two</item>
+    </list>
+  </component>
+  <modules />
+  <component name="Vcs" />
+</project>
+"""
+
+    def test_reapply_does_not_duplicate(self, startup_module):
+        """同じテンプレートを再適用しても要素が重複しない"""
+        codec = startup_module.CODECS["xml"]
+        once = codec.merge_content(self.EXISTING, self.NEW)
+        assert codec.merge_content(once, self.NEW) == once
+
+    def test_unkeyed_top_level_siblings_not_collapsed(self, startup_module):
+        """ルート直下の識別属性を持たない要素はマージせず、同一内容がなければ追加する"""
+        codec = startup_module.CODECS["xml"]
+        existing = b"<deps>\n  <dependency>a</dependency>\n  <dependency>b</dependency>\n</deps>\n"
+        new = b"<deps><dependency>c</dependency></deps>"
+
+        merged = codec.merge_content(existing, new)
+
+        assert [child.text for child in codec.parse(merged)] == ["a", "b", "c"]
+        assert codec.merge_content(merged, new) == merged
+        assert codec.merge_content(existing, b"<deps><dependency>b</dependency></deps>") == existing.replace(
+            b"<deps>", b"<?xml version='1.0' encoding='utf-8'?>\n<deps>")
+
+    def test_append_mode_keeps_legacy_behaviour(self, startup_module):
+        """xml_mode=append では従来どおり子要素を末尾に追加する"""
+        codec = startup_module.CODECS["xml"]
+        merged = codec.merge_content(b"<r><a/></r>", b"<r><a/></r>", {"xml_mode": "append"})
+        assert len(codec.parse(merged)) == 2
+
+    def test_tree_builder_without_comment_support(self, startup_module, monkeypatch):
+        """TreeBuilder が insert_comments を受け付けない環境（Python 3.7）でもマージできる"""
+        from xml.etree import ElementTree
+
+        real_builder = ElementTree.TreeBuilder
+
+        def legacy_builder(**kwargs):
+            if kwargs:
+                raise TypeError("TreeBuilder() takes no keyword arguments")
+            return real_builder()
+
+        monkeypatch.setattr(ElementTree, "TreeBuilder", legacy_builder)
+        merged = startup_module.CODECS["xml"].merge_content(self.EXISTING, self.NEW).decode()
+
+        assert "IDE設定" not in merged
+        assert '<option name="tabSize" value="4" />' in merged and '<component name="Vcs" />' in merged
+
+    def test_streams_large_file_with_bounded_memory(self, startup_module, tmp_path):
+        """大きなファイルを処理済み要素を破棄しながらストリーム処理する"""
+        import tracemalloc
+
+        count = 50000
+        existing_file = tmp_path / "big.xml"
+        with existing_file.open("w") as f:
+            f.write("<project>\n")
+            for i in range(count):
+                f.write(f'  <component name="c{i}"><option name="o" value="{i}" /></component>\n')
+            f.write("</project>\n")
+        new_file = tmp_path / "new.xml"
+        new_file.write_bytes(b'<project><component name="c7"><option name="o" value="x" /></component></project>')
+
+        tracemalloc.start()
+        try:
+            startup_module.CODECS["xml"].merge_file(existing_file, new_file, existing_file)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        merged = startup_module.CODECS["xml"].parse(existing_file.read_bytes())
+        assert len(merged) == count
+        assert merged[7][0].get("value") == "x"
+        assert peak < existing_file.stat().st_size / 4
+
+
+    def test_merge_in_place_matches_chain(self, startup_module, tmp_path):
+        """配置先のファイル上でのマージ結果が、1つずつ畳み込んだ結果と一致する"""
+        codec = startup_module.CODECS["xml"]
+        contents = [self.NEW, b'<project xmlns="urn:p"><component name="Vcs"><option name="vcs" value="git" /></component></project>']
+        dest_file = tmp_path / "workspace.xml"
+        dest_file.write_bytes(self.EXISTING)
+
+        assert codec.merge_in_place(dest_file, contents)
+
+        expected = self.EXISTING
+        for content in contents:
+            expected = codec.merge_content(expected, content)
+        assert dest_file.read_bytes() == expected
+        mtime = dest_file.stat().st_mtime_ns
+        assert not codec.merge_in_place(dest_file, contents)
+        assert dest_file.stat().st_mtime_ns == mtime
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["workspace.xml"]
+        assert not codec.can_merge_in_place({"xml_mode": "append"})
+
+    def test_apply_streams_large_destination(self, startup_module, tmp_path, test_config, monkeypatch):
+        """大きな既存ファイルへの適用は内容を読み込まずにストリーム処理する"""
+        import tracemalloc
+
+        template = tmp_path / "templates" / "t" / "config"
+        template.mkdir(parents=True)
+        (template / "workspace.xml").write_bytes(
+            b'<project><component name="c7"><option name="o" value="x" /></component></project>')
+        project = tmp_path / "project"
+        project.mkdir()
+        dest_file = project / "workspace.xml"
+        count = 50000
+        with dest_file.open("w") as f:
+            f.write("<project>\n")
+            for i in range(count):
+                f.write(f'  <component name="c{i}"><option name="o" value="{i}" /></component>\n')
+            f.write("</project>\n")
+        size = dest_file.stat().st_size
+        config = json.loads(test_config.read_text())
+        config["file_match_patterns"].append("workspace.xml")
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps(config))
+        monkeypatch.chdir(project)
+
+        setup = startup_module.TemplateSetup(["t"], config=startup_module.Config(config_file),
+                                             local_path=tmp_path, use_cache=False, workers=1)
+        setup.in_place_threshold = 1024
+        assert setup._collect_files()
+        tracemalloc.start()
+        try:
+            assert setup._process_files()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        merged = startup_module.CODECS["xml"].parse(dest_file.read_bytes())
+        assert len(merged) == count
+        assert merged[7][0].get("value") == "x"
+        assert peak < size / 4
+
+# ============================================================================
+# 8. 行ベースマージテスト
+# ============================================================================
+
+class TestLineBasedMerge:
+    """LineBasedCodec のテスト"""
+
+    def test_existing_content_copied_unchanged(self, startup_module):
+        """既存の内容（改行コード・重複を含む）はそのまま残り、新しい行だけが追加される"""
+        codec = startup_module.CODECS["line_based"]
+        existing = b"# Python\r\n*.pyc\r\n*.pyc\r\n"
+
+        merged = codec.merge_content(existing, b"*.pyc\n.venv/\n.venv/\n")
+
+        assert merged == existing + b".venv/\n"
+
+    def test_missing_trailing_newline(self, startup_module):
+        """既存の末尾に改行がなくても行が連結されない"""
+        codec = startup_module.CODECS["line_based"]
+        assert codec.merge_content(b"a", b"b\n") == b"a\nb\n"
+        assert codec.merge_content(b"a", b"a\n") == b"a"
+
+    def test_merge_file_in_place_appends(self, startup_module, tmp_path):
+        """出力先が既存ファイルの場合は追記のみ行う"""
+        codec = startup_module.CODECS["line_based"]
+        existing_file = tmp_path / ".gitignore"
+        existing_file.write_bytes(b"a\nb\n")
+        new_file = tmp_path / "new"
+        new_file.write_bytes(b"b\nc\n")
+        empty_file = tmp_path / "empty"
+        empty_file.write_bytes(b"")
+
+        codec.merge_file(existing_file, new_file, existing_file)
+        codec.merge_file(empty_file, new_file, tmp_path / "out")
+
+        assert existing_file.read_bytes() == b"a\nb\nc\n"
+        assert (tmp_path / "out").read_bytes() == b"b\nc\n"
+
+    def test_memory_grows_with_unique_lines(self, startup_module, tmp_path):
+        """メモリ使用量はファイルサイズではなく一意な行数に比例する"""
+        import tracemalloc
+
+        codec = startup_module.CODECS["line_based"]
+        existing_file = tmp_path / ".gitignore"
+        with existing_file.open("wb") as f:
+            for i in range(200000):
+                f.write(f"build/generated/output-{i % 100:03d}/**/*.tmp\n".encode())
+        new_file = tmp_path / "new"
+        new_file.write_bytes(b"build/generated/output-007/**/*.tmp\n.cache/\n")
+
+        tracemalloc.start()
+        try:
+            codec.merge_file(existing_file, new_file, existing_file)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert existing_file.read_bytes().endswith(b"output-099/**/*.tmp\n.cache/\n")
+        assert peak < existing_file.stat().st_size / 20
+
+    def test_merge_in_place_matches_chain(self, startup_module, tmp_path, monkeypatch):
+        """複数のテンプレートを追記した結果が、1つずつ畳み込んだ結果と一致する"""
+        codec = startup_module.CODECS["line_based"]
+        # ハッシュ値の配列を複数に分割して統合する経路も通す
+        monkeypatch.setattr(codec, "INDEX_CHUNK_LINES", 2)
+        existing = b"a\r\nb\na\nc\nd\ne"
+        contents = [b"e\nf\nb\ng", b"g\nh\nf\n"]
+        dest_file = tmp_path / ".gitignore"
+        dest_file.write_bytes(existing)
+
+        assert codec.merge_in_place(dest_file, contents)
+
+        expected = existing
+        for content in contents:
+            expected = codec.merge_content(expected, content)
+        assert dest_file.read_bytes() == expected == b"a\r\nb\na\nc\nd\ne\nf\ng\nh\n"
+        assert not codec.merge_in_place(dest_file, contents)
+        assert dest_file.read_bytes() == expected
+
+    def test_apply_appends_to_large_destination(self, startup_module, tmp_path, test_config, monkeypatch):
+        """大きな既存ファイルへの適用は内容を読み込まずに追記する"""
+        import tracemalloc
+
+        for name, lines in (("a", b".venv/\n*.pyc\n"), ("b", b"*.pyc\n.cache/\n")):
+            template = tmp_path / "templates" / name / "config"
+            template.mkdir(parents=True)
+            (template / ".gitignore").write_bytes(lines)
+        project = tmp_path / "project"
+        project.mkdir()
+        dest_file = project / ".gitignore"
+        with dest_file.open("wb") as f:
+            for i in range(200000):
+                f.write(f"build/generated/output-{i % 100:03d}/**/*.tmp\n".encode())
+        size = dest_file.stat().st_size
+        inode = dest_file.stat().st_ino
+        monkeypatch.chdir(project)
+
+        setup = startup_module.TemplateSetup(["a", "b"], config=startup_module.Config(test_config),
+                                             local_path=tmp_path, use_cache=False, workers=1)
+        setup.in_place_threshold = 1024
+        assert setup._collect_files()
+        tracemalloc.start()
+        try:
+            assert setup._process_files()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert dest_file.stat().st_ino == inode
+        with dest_file.open("rb") as f:
+            f.seek(size)
+            assert f.read() == b".venv/\n*.pyc\n.cache/\n"
+        assert peak < size / 10
@@ -8,6 +8,7 @@
 5. エラーハンドリングテスト: 不正な入力への対応
 """
 import json
+import os
 import subprocess
 import sys
 from pathlib import Path
@@ -89,6 +90,19 @@ class TestBasicFunctionality:
         assert (test_dir / "docker-compose.yml").exists()
         assert (test_dir / ".dockerignore").exists()
 
+    def test_local_json_template_skips_optional_modules(self, setup_script: Path, test_dir: Path,
+                                                        template_dir: Path):
+        """ローカルのJSONのみのテンプレートではコーデック・ネットワーク関連のモジュールを読み込まない"""
+        cmd = [sys.executable, "-X", "importtime", str(setup_script),
+               "-l", str(template_dir.parent), "default/base"]
+        result = subprocess.run(cmd, cwd=test_dir, capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+
+        imported = {line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines()
+                    if line.startswith("import time:")}
+        for module in ("yaml", "tomllib", "tomli_w", "xml.etree.ElementTree", "urllib.request", "subprocess"):
+            assert module not in imported
+
 
 # ============================================================================
 # 2. 階層的テンプレートテスト
@@ -427,6 +441,622 @@ GitHub URLフォーマットのテスト"""
             assert "HTTP" in result.stderr or "URL" in result.stderr or "エラー" in result.stderr, \
                    f"予期されるエラーメッセージがない: {result.stderr}"
 
+# ============================================================================
+# 8. GitHubスタブサーバーテスト
+# ============================================================================
+
+def run_remote(setup_script: Path, test_dir: Path, template_types: list[str]) -> subprocess.CompletedProcess:
+    """GitHubモード（-l なし）でセットアップを実行"""
+    cmd = [sys.executable, str(setup_script)] + template_types
+    return subprocess.run(cmd, cwd=test_dir, capture_output=True, text=True, timeout=60)
+
+
+class TestGitHubStub:
+    """ローカルの代替サーバーを使用したGitHubモードのテスト（ネットワーク不要）"""
+
+    def test_remote_apply(self, setup_script: Path, test_dir: Path, template_dir: Path, github_stub, stub_config):
+        """raw のURLからテンプレートを取得して配置する"""
+        result = run_remote(setup_script, test_dir, ["default/base"])
+
+        assert result.returncode == 0, result.stderr
+        assert (test_dir / ".vscode" / "settings.json").read_bytes() == \
+            (template_dir / "default" / "base" / "vscode" / "settings.json").read_bytes()
+        assert github_stub.count("/stub-user/stub-repo/main/templates/default/base/vscode/settings.json", 200) >= 1
+
+    def test_server_error_is_reported(self, setup_script: Path, test_dir: Path, github_stub, stub_config):
+        """5xx はエラーとして表示し、ファイルを配置しない"""
+        github_stub.fail("templates/default/base/vscode/settings.json", 503)
+
+        result = run_remote(setup_script, test_dir, ["default/base"])
+
+        assert "HTTP エラー 503" in result.stderr
+        assert not (test_dir / ".vscode" / "settings.json").exists()
+
+    def test_etag_and_rate_limit(self, github_stub):
+        """ETag が一致する場合は 304、レート制限はヘッダー付きの 429 を返す"""
+        from urllib import request
+        from urllib.error import HTTPError
+
+        url = f"{github_stub.raw_base_url}/stub-user/stub-repo/main/templates/default/base/vscode/settings.json"
+        with request.urlopen(url) as response:
+            etag = response.headers["ETag"]
+
+        with pytest.raises(HTTPError) as not_modified:
+            request.urlopen(request.Request(url, headers={"If-None-Match": etag}))
+        assert not_modified.value.code == 304
+
+        github_stub.fail("templates/*", 429, times=1, retry_after=5)
+        with pytest.raises(HTTPError) as limited:
+            request.urlopen(url)
+        assert limited.value.code == 429
+        assert limited.value.headers["X-RateLimit-Remaining"] == "0"
+        assert limited.value.headers["Retry-After"] == "5"
+        # 回数を指定した障害は使い切ると解除される
+        with request.urlopen(url) as response:
+            assert response.status == 200
+
+    def test_trees_and_tarball(self, github_stub):
+        """Trees API と codeload の tarball でリポジトリの内容を取得できる"""
+        import io
+        import tarfile
+        from urllib import request
+
+        with request.urlopen(f"{github_stub.api_base_url}/repos/stub-user/stub-repo/git/trees/main?recursive=1") as response:
+            tree = json.load(response)["tree"]
+        assert {"path": "templates/default/base/vscode/settings.json", "type": "blob"}.items() <= \
+            next(entry for entry in tree if entry["path"] == "templates/default/base/vscode/settings.json").items()
+
+        with request.urlopen(f"{github_stub.codeload_base_url}/stub-user/stub-repo/tar.gz/refs/heads/main") as response:
+            archive = tarfile.open(fileobj=io.BytesIO(response.read()), mode="r:gz")
+        assert "stub-repo-main/templates/default/base/vscode/settings.json" in archive.getnames()
+
+    def test_latency_and_bandwidth(self, startup_module, github_stub, stub_config, tmp_path):
+        """遅延と帯域の上限が応答時間に反映され、大きなファイルは受信しながら書き出される"""
+        import time
+
+        asset = github_stub.root / "templates" / "docker" / "base" / "docker" / "asset.bin"
+        asset.parent.mkdir(parents=True)
+        asset.write_bytes(b"x" * 200_000)
+        github_stub.latency = 0.05
+        github_stub.bandwidth = 1_000_000
+
+        source = startup_module.TemplateSource(startup_module.Config(stub_config), stream_threshold=0,
+                                               chunk_size=16 * 1024)
+        start = time.perf_counter()
+        assert source.transfer_file("templates/docker/base/docker/asset.bin", tmp_path / "asset.bin")
+        elapsed = time.perf_counter() - start
+
+        assert (tmp_path / "asset.bin").read_bytes() == asset.read_bytes()
+        assert elapsed >= 0.05 + 0.2 * 0.9
+
+
+# ============================================================================
+# 9. トレーステスト
+# ============================================================================
+
+class TestTracing:
+    """--trace / --timings による処理区間の記録"""
+
+    def test_trace_file_is_chrome_format(self, setup_script: Path, test_dir: Path, template_dir: Path):
+        """--trace で全フェーズの区間を Chrome trace-event 形式で書き出す"""
+        trace = test_dir / "trace.json"
+        run_setup(setup_script, test_dir, template_dir.parent,
+                  ["default/base", "python/base", "--trace", str(trace)])
+
+        events = json.loads(trace.read_text())["traceEvents"]
+        spans = [event for event in events if event["ph"] == "X"]
+        assert {"phase", "config", "discovery", "fetch", "merge", "write"} <= {event["cat"] for event in spans}
+        assert [event["name"] for event in spans if event["cat"] == "phase"] == \
+            ["config", "collect", "transfer", "merge", "write"]
+        assert all(event["dur"] >= 0 and event["ts"] >= 0 for event in spans)
+        assert any(event["name"] == "process_name" for event in events if event["ph"] == "M")
+
+    def test_timings_summary(self, setup_script: Path, test_dir: Path, template_dir: Path):
+        """--timings でカテゴリごとの集計を表示する"""
+        _, stdout, _ = run_setup(setup_script, test_dir, template_dir.parent, ["default/base", "--timings"])
+
+        assert "処理時間の内訳:" in stdout
+        assert "  - フェーズ: config " in stdout
+        assert "  - discovery: " in stdout
+
+    def test_disabled_tracing_records_nothing(self, startup_module):
+        """トレースが無効な場合は共有の空のコンテキストを返す"""
+        assert startup_module._tracer is None
+        assert startup_module.trace_span("x", "merge") is startup_module._NO_SPAN
+
+        tracer = startup_module.enable_tracing()
+        try:
+            with startup_module.trace_span("x", "merge", file="a.json"):
+                pass
+        finally:
+            assert startup_module.disable_tracing() is tracer
+        assert [(event[0], event[1], event[6]) for event in tracer.events] == [("x", "merge", {"file": "a.json"})]
+        assert tracer.summary()[0][:2] == ("merge", 1)
+
+    def test_memory_peaks_propagate_to_parent(self, startup_module):
+        """入れ子の区間の最大値は親の区間と実行全体に反映される"""
+        tracer = startup_module.enable_tracing(memory=True)
+        try:
+            with startup_module.trace_span("merge", "phase"):
+                with startup_module.trace_span("a.json", "job"):
+                    block = bytearray(4 * 1024 * 1024)
+                    del block
+        finally:
+            startup_module.disable_tracing()
+            tracer.memory.stop()
+
+        job, phase = (event[6] for event in tracer.events)
+        assert job["mem_growth"] >= 4 * 1024 * 1024
+        assert phase["mem_peak"] >= job["mem_peak"]
+        assert tracer.memory.run_peak >= phase["mem_peak"]
+        assert tracer.memory.check_budget(tracer.events, None, {"job": 1}) != []
+        assert tracer.memory.check_budget(tracer.events, 64, {"merge": 64}) == []
+
+    def test_memory_peaks_without_reset_peak(self, startup_module, monkeypatch):
+        """tracemalloc.reset_peak のない Python 3.8 以前でも区間の最大値を記録する"""
+        import tracemalloc
+
+        monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+        tracer = startup_module.enable_tracing(memory=True)
+        try:
+            with startup_module.trace_span("merge", "phase"):
+                with startup_module.trace_span("a.json", "job"):
+                    block = bytearray(4 * 1024 * 1024)
+                    del block
+                with startup_module.trace_span("b.json", "job"):
+                    pass
+        finally:
+            startup_module.disable_tracing()
+            tracer.memory.stop()
+
+        first, second, phase = (event[6] for event in tracer.events)
+        assert first["mem_growth"] >= 4 * 1024 * 1024
+        assert second["mem_peak"] < 4 * 1024 * 1024
+        assert phase["mem_peak"] >= first["mem_peak"]
+        assert tracer.memory.run_peak >= phase["mem_peak"]
+
+    def test_memory_budget_from_config(self, setup_script: Path, test_dir: Path, template_dir: Path,
+                                       test_config: Path, monkeypatch):
+        """設定の上限を超えた場合、on_exceed が fail なら終了コード1"""
+        config = json.loads(test_config.read_text())
+        config["memory"] = {"budget_mb": None, "phase_budget_mb": {"transfer": 0.001}, "on_exceed": "fail"}
+        config_file = test_dir / "memory-config.json"
+        config_file.write_text(json.dumps(config))
+        monkeypatch.setenv("VSCODE_TEMPLATE_CONFIG", str(config_file))
+
+        code, stdout, stderr = run_setup(setup_script, test_dir, template_dir.parent,
+                                         ["default/base", "--memory-report"], expect_success=False)
+
+        assert code == 1
+        assert "メモリ使用量（tracemalloc）:" in stdout
+        assert "メモリ使用量が上限を超えました: transfer" in stderr
+
+
+# ============================================================================
+# 10. 実行統計テスト
+# ============================================================================
+
+class TestRunMetrics:
+    """--metrics による OpenMetrics 形式の実行統計"""
+
+    @staticmethod
+    def samples(text: str) -> dict:
+        return dict(line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+
+    def test_metrics_file(self, setup_script: Path, test_dir: Path, template_dir: Path):
+        """テンプレートごとのカウンターを書き出し、再適用で変化のないファイルは書き込まない"""
+        metrics = test_dir / "metrics.prom"
+        run_setup(setup_script, test_dir, template_dir.parent, ["default/base", "--metrics", str(metrics)])
+        first = metrics.read_text()
+        assert first.endswith("# EOF\n")
+        samples = self.samples(first)
+        assert samples['vscode_template_files_discovered_total{template="default/base"}'] == "2"
+        assert samples['vscode_template_files_created_total{template="default/base"}'] == "2"
+        assert int(samples['vscode_template_transferred_bytes_total{template="default/base"}']) > 0
+        assert samples['vscode_template_phase_duration_seconds_count{phase="fetch",template="default/base"}'] == "2"
+        assert samples["vscode_template_last_run_success"] == "1"
+
+        settings = test_dir / ".vscode" / "settings.json"
+        mtime = settings.stat().st_mtime_ns
+        run_setup(setup_script, test_dir, template_dir.parent, ["default/base", "--metrics", str(metrics)])
+        samples = self.samples(metrics.read_text())
+        assert samples['vscode_template_skipped_total{template="default/base"}'] == "2"
+        assert samples['vscode_template_merges_total{template="default/base"}'] == "0"
+        assert settings.stat().st_mtime_ns == mtime
+
+    def test_histogram_buckets_and_label_escaping(self, startup_module):
+        """バケットは累積で、ラベルの値はエスケープされる"""
+        metrics = startup_module.RunMetrics()
+        metrics.observe("merge", 'a"b', 0.003)
+        metrics.observe("merge", 'a"b', 0.2)
+
+        samples = self.samples(metrics.to_openmetrics())
+        labels = 'phase="merge",template="a\\"b"'
+        assert samples[f'vscode_template_phase_duration_seconds_bucket{{{labels},le="0.001"}}'] == "0"
+        assert samples[f'vscode_template_phase_duration_seconds_bucket{{{labels},le="0.005"}}'] == "1"
+        assert samples[f'vscode_template_phase_duration_seconds_bucket{{{labels},le="0.25"}}'] == "2"
+        assert samples[f'vscode_template_phase_duration_seconds_bucket{{{labels},le="+Inf"}}'] == "2"
+        assert samples[f"vscode_template_phase_duration_seconds_count{{{labels}}}"] == "2"
+
+
+# ============================================================================
+# 11. イベント出力テスト
+# ============================================================================
+
+class TestEventOutput:
+    """--output jsonl による構造化イベント"""
+
+    def test_jsonl_events(self, setup_script: Path, test_dir: Path, template_dir: Path):
+        """標準出力は1行1イベントのJSONのみで、ファイルごと・フェーズごとのイベントを含む"""
+        (test_dir / ".vscode").mkdir()
+        (test_dir / ".vscode" / "settings.json").write_text('{"editor.fontSize": 99}')
+
+        _, stdout, stderr = run_setup(setup_script, test_dir, template_dir.parent,
+                                      ["default/base", "python/base", "--output", "jsonl"])
+
+        events = [json.loads(line) for line in stdout.splitlines()]
+        assert [event["phase"] for event in events if event["event"] == "phase"] == \
+            ["config", "collect", "transfer", "merge", "write"]
+
+        files = [event for event in events if event["event"] == "file"]
+        assert len(files) == 4
+        settings = [event for event in files if event["dest"] == ".vscode/settings.json"]
+        assert [(event["template"], event["action"], event["outcome"]) for event in settings] == \
+            [("default/base", "merge", "ok"), ("python/base", "merge", "ok")]
+        assert all(event["bytes"] > 0 and event["duration_ms"] >= 0 and "merge_ms" in event for event in settings)
+
+        assert events[-2]["event"] == "summary" and events[-2]["processed"] == 4
+        assert "\033[" not in stdout
+        assert "対象ディレクトリ" in stderr
+
+    def test_event_log_preserves_order(self, startup_module):
+        """キューに入れたイベントは close() までに順番どおり書き出される"""
+        import io
+
+        stream = io.StringIO()
+        log = startup_module.EventLog(stream)
+        for i in range(1000):
+            log.emit("file", index=i, path=Path(f"f{i}"))
+        log.close()
+        log.close()
+
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert [event["index"] for event in events] == list(range(1000))
+        assert events[0]["path"] == "f0"
+
+
+    def test_warnings_are_events(self, startup_module, monkeypatch, capsys):
+        """イベント出力時の警告は標準出力に直接書かず message イベントになる"""
+        import io
+
+        stream = io.StringIO()
+        log = startup_module.EventLog(stream)
+        monkeypatch.setattr(startup_module, "_event_log", log)
+        startup_module.print_warning("並列マージを利用できないため逐次実行します: x")
+        log.close()
+
+        assert capsys.readouterr().out == ""
+        event = json.loads(stream.getvalue())
+        assert (event["event"], event["level"]) == ("message", "warning")
+
+# ============================================================================
+# 12. 監査テスト
+# ============================================================================
+
+class TestAudit:
+    """audit サブコマンド"""
+
+    def test_audit_reports_drift_without_writing(self, setup_script: Path, tmp_path: Path, template_dir: Path):
+        """差分・未配置を報告し、ファイルを変更しない。2回目はハッシュキャッシュを使用する"""
+        import os
+
+        clean, drifted, empty = (tmp_path / name for name in ("clean", "drifted", "empty"))
+        for project in (clean, drifted, empty):
+            project.mkdir()
+        for project in (clean, drifted):
+            run_setup(setup_script, project, template_dir.parent, ["default/base"])
+        (drifted / ".vscode" / "settings.json").write_text('{"editor.fontSize": 99}\n')
+        # 直近に更新されたファイルはキャッシュされないため、更新時刻を過去にする
+        for path in tmp_path.rglob("*"):
+            if path.is_file():
+                old = path.stat().st_mtime_ns - 10_000_000_000
+                os.utime(path, ns=(old, old))
+        before = {path: path.stat().st_mtime_ns for path in tmp_path.rglob("*") if path.is_file()}
+
+        cmd = [sys.executable, str(setup_script), "audit", "-l", str(template_dir.parent),
+               "--stat-cache", str(tmp_path / "stat.json"), "-p", str(clean), "-p", str(drifted), "-p", str(empty),
+               "--output", "jsonl", "default/base"]
+        for _ in range(2):
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            assert result.returncode == 1, result.stderr
+
+            events = [json.loads(line) for line in result.stdout.splitlines()]
+            statuses = {(Path(event["project"]).name, event["dest"]): event["status"]
+                        for event in events if event["event"] == "audit"}
+            assert statuses == {
+                ("clean", ".vscode/settings.json"): "ok", ("clean", ".gitignore"): "ok",
+                ("drifted", ".vscode/settings.json"): "drift", ("drifted", ".gitignore"): "ok",
+                ("empty", ".vscode/settings.json"): "missing", ("empty", ".gitignore"): "missing",
+            }
+
+        assert "ハッシュキャッシュ: ヒット 6/6" in result.stderr
+        assert {path: path.stat().st_mtime_ns for path in before} == before
+
+    def test_audit_after_apply_is_clean(self, setup_script: Path, tmp_path: Path, template_dir: Path):
+        """適用直後の監査は一致し、コメントを追加しただけのマージ対象ファイルも一致とする"""
+        project = tmp_path / "project"
+        project.mkdir()
+        templates = ["default/base", "python/base", "docker/base"]
+        run_setup(setup_script, project, template_dir.parent, templates)
+
+        cmd = [sys.executable, str(setup_script), "audit", "-l", str(template_dir.parent), "--no-stat-cache",
+               "-p", str(project), "--output", "jsonl", *templates]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        assert result.returncode == 0, result.stdout + result.stderr
+
+        compose = project / "docker-compose.yml"
+        compose.write_text("# ローカルのメモ\n" + compose.read_text())
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        assert result.returncode == 0, result.stdout + result.stderr
+
+        compose.write_text("services: {}\n")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        events = [json.loads(line) for line in result.stdout.splitlines()]
+        assert result.returncode == 1
+        assert [event["dest"] for event in events if event.get("status") == "drift"] == ["docker-compose.yml"]
+
+    def test_stat_cache_detects_changes(self, startup_module, tmp_path: Path):
+        """サイズ・更新時刻・inode のいずれかが変わったファイルは読み直し、直近の更新はキャッシュしない"""
+        import os
+
+        path = tmp_path / "a.txt"
+        path.write_text("one")
+        old = path.stat().st_mtime_ns - 10_000_000_000
+        os.utime(path, ns=(old, old))
+
+        cache = startup_module.StatCache(tmp_path / "stat.json")
+        first = cache.digest(path)
+        assert cache.digest(path) == first and cache.hits == 1
+
+        path.write_text("three")
+        os.utime(path, ns=(old, old))
+        assert cache.digest(path) != first
+
+        path.write_text("new")
+        assert cache.digest(path) is not None and str(path) in cache.files
+        assert cache.files[str(path)][1] == old  # 直近の更新は記録しない
+        assert cache.digest(tmp_path / "missing") is None
+
+
+# ============================================================================
+# 13. テンプレートソースのレイヤーテスト
+# ============================================================================
+
+def write_layered_config(tmp_path: Path, test_config: Path, sources: list) -> Path:
+    """sources を設定したテスト用config.json（相対パスは tmp_path から）"""
+    config = json.loads(test_config.read_text())
+    config["sources"] = sources
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(config, indent=2))
+    return config_file
+
+
+def write_overlay(root: Path) -> None:
+    """default/base の一部を上書きするオーバーレイのテンプレート"""
+    settings = root / "templates" / "default" / "base" / "vscode" / "settings.json"
+    settings.parent.mkdir(parents=True)
+    settings.write_text('{\n  "editor.fontSize": 20,\n  "company.internal": true\n}\n')
+
+
+class TestTemplateSources:
+    """複数のテンプレートソース（sources）"""
+
+    def test_overlay_layer_is_merged_last(self, setup_script: Path, test_dir: Path, tmp_path: Path,
+                                          template_dir: Path, test_config: Path):
+        """後のレイヤーの内容を後にマージし、オーバーレイにないファイルは公開レイヤーから配置する"""
+        write_overlay(tmp_path / "overlay")
+        config_file = write_layered_config(tmp_path, test_config, [
+            {"name": "public", "local": str(template_dir.parent)},
+            {"name": "private", "local": "overlay"},
+        ])
+
+        result = subprocess.run([sys.executable, str(setup_script), "default/base"], cwd=test_dir,
+                                capture_output=True, text=True, env={**os.environ, "VSCODE_TEMPLATE_CONFIG": str(config_file)})
+
+        assert result.returncode == 0, result.stderr
+        assert "テンプレートソース: public < private" in result.stdout
+        settings = (test_dir / ".vscode" / "settings.json").read_text()
+        assert '"editor.fontSize": 20' in settings
+        assert '"company.internal": true' in settings
+        assert '"editor.tabSize": 2' in settings
+        assert (test_dir / ".gitignore").read_bytes() == (template_dir / "default" / "base" / "config" / ".gitignore").read_bytes()
+
+    def test_remote_and_local_layers(self, startup_module, test_dir: Path, tmp_path: Path,
+                                     test_config: Path, github_stub, monkeypatch):
+        """リモートとローカルのレイヤーを組み合わせ、探索時に取得した内容を再利用する"""
+        write_overlay(tmp_path / "overlay")
+        config_file = write_layered_config(tmp_path, test_config, [
+            {"name": "public", "github": github_stub.github_config()},
+            {"name": "private", "local": str(tmp_path / "overlay")},
+        ])
+        monkeypatch.chdir(test_dir)
+
+        setup = startup_module.TemplateSetup(["default/base"], config=startup_module.Config(config_file),
+                                             use_cache=False)
+        assert setup.run()
+
+        assert [source.name for source in setup.file_sources] == ["public", "public", "private"]
+        settings = (test_dir / ".vscode" / "settings.json").read_text()
+        assert '"company.internal": true' in settings and '"editor.tabSize": 2' in settings
+        # 探索で存在を確認したファイルは再取得しない
+        assert github_stub.count("/stub-user/stub-repo/main/templates/default/base/vscode/settings.json", 200) == 1
+
+    def test_layer_requires_one_kind(self, startup_module, tmp_path: Path, test_config: Path):
+        """github と local のどちらか一方のみを指定する"""
+        config_file = write_layered_config(tmp_path, test_config, [{"name": "broken"}])
+
+        with pytest.raises(SystemExit):
+            startup_module.Config(config_file).sources
+
+
+# ============================================================================
+# 14. テンプレートインデックステスト
+# ============================================================================
+
+class TestTemplateIndex:
+    """index サブコマンドと、インデックスを使用したリモートの探索"""
+
+    def test_repository_index_is_up_to_date(self, setup_script: Path):
+        """リポジトリの template-index.json がテンプレートと一致する"""
+        result = subprocess.run([sys.executable, str(setup_script), "index", "--check"],
+                                capture_output=True, text=True)
+
+        assert result.returncode == 0, f"index サブコマンドで更新してください:\n{result.stdout}{result.stderr}"
+
+    def test_remote_discovery_uses_index(self, startup_module, setup_script: Path, test_dir: Path,
+                                         tmp_path: Path, github_stub, stub_config: Path, monkeypatch):
+        """インデックスを1回取得して探索し、2回目以降はハッシュが一致するキャッシュの内容を使用する"""
+        subprocess.run([sys.executable, str(setup_script), "index", "-l", str(github_stub.root)], check=True)
+        config = json.loads(stub_config.read_text())
+        config["fetch_cache"] = {"enabled": True, "directory": str(tmp_path / "content")}
+        stub_config.write_text(json.dumps(config))
+
+        requests = []
+        for run in range(2):
+            project = test_dir / f"project{run}"
+            project.mkdir()
+            monkeypatch.chdir(project)
+            github_stub.requests.clear()
+            setup = startup_module.TemplateSetup(["default/base", "python/base"],
+                                                 config=startup_module.Config(stub_config))
+            assert setup.run()
+            requests.append([path for _, path, _ in github_stub.requests])
+
+            assert (project / ".vscode" / "settings.json").is_file()
+            assert github_stub.count("*", 404) == 0
+
+        index_path = "/stub-user/stub-repo/main/template-index.json"
+        assert requests[0][0] == index_path and len(requests[0]) == len(setup.files_to_process) + 1
+        assert requests[1] == [index_path]
+
+    def test_stale_index_is_reported(self, startup_module, setup_script: Path, test_dir: Path,
+                                     github_stub, stub_config: Path, monkeypatch, capsys):
+        """インデックス作成後に変更された内容は使用し、警告する"""
+        subprocess.run([sys.executable, str(setup_script), "index", "-l", str(github_stub.root)], check=True)
+        settings = github_stub.root / "templates" / "default" / "base" / "vscode" / "settings.json"
+        settings.write_text('{"editor.fontSize": 30}\n')
+        monkeypatch.chdir(test_dir)
+
+        setup = startup_module.TemplateSetup(["default/base"], config=startup_module.Config(stub_config),
+                                             use_cache=False)
+        assert setup.run()
+
+        assert (test_dir / ".vscode" / "settings.json").read_text() == '{"editor.fontSize": 30}\n'
+        assert "テンプレートインデックスと一致しません" in capsys.readouterr().out
+
+
+# ============================================================================
+# 15. 先読みテスト
+# ============================================================================
+
+class TestPrefetch:
+    """利用履歴による次に適用されやすいテンプレートの先読み"""
+
+    def test_usage_prediction(self, startup_module, tmp_path: Path):
+        """同時に適用された割合の高い順に予測し、記録は保存される"""
+        usage = startup_module.UsageStats(tmp_path / "usage.json")
+        for _ in range(3):
+            usage.record(["default/base", "python/base"])
+        usage.record(["docker/base", "default/base"])
+
+        assert usage.predict(["default/base"]) == ["python/base"]
+        assert usage.predict(["default/base"], min_probability=0.2) == ["python/base", "docker/base"]
+        assert usage.predict(["default/base", "python/base"], min_probability=0.2) == ["docker/base"]
+        assert startup_module.UsageStats(tmp_path / "usage.json").runs[-1] == ["default/base", "docker/base"]
+
+    def test_prefetch_warms_cache_for_next_run(self, startup_module, setup_script: Path, test_dir: Path,
+                                                tmp_path: Path, github_stub, stub_config: Path, monkeypatch):
+        """予測したテンプレートを予算内で取得キャッシュに保存し、次の実行は取得せずに適用する"""
+        subprocess.run([sys.executable, str(setup_script), "index", "-l", str(github_stub.root)], check=True)
+        history = tmp_path / "usage.json"
+        history.write_text(json.dumps({"version": 1, "runs": [["default/base", "python/base"]] * 3}))
+        config = json.loads(stub_config.read_text())
+        config["fetch_cache"] = {"enabled": True, "directory": str(tmp_path / "content")}
+        config["prefetch"] = {"history": str(history), "budget_kb": 64, "wait_seconds": 10}
+        stub_config.write_text(json.dumps(config))
+
+        def apply(templates, project):
+            project.mkdir()
+            monkeypatch.chdir(project)
+            github_stub.requests.clear()
+            setup = startup_module.TemplateSetup(templates, config=startup_module.Config(stub_config))
+            assert setup.run()
+            return [path for _, path, _ in github_stub.requests]
+
+        first = apply(["default/base"], test_dir / "first")
+        assert any("/templates/python/base/" in path for path in first)
+
+        second = apply(["python/base"], test_dir / "second")
+        assert second == ["/stub-user/stub-repo/main/template-index.json"]
+        assert (test_dir / "second" / ".vscode" / "python.code-snippets").is_file()
+        assert json.loads(history.read_text())["runs"][-2:] == [["default/base"], ["python/base"]]
+
+    def test_prefetch_respects_budget(self, startup_module, setup_script: Path, test_dir: Path,
+                                      tmp_path: Path, github_stub, stub_config: Path, monkeypatch):
+        """予算を超えるファイルは先読みしない"""
+        subprocess.run([sys.executable, str(setup_script), "index", "-l", str(github_stub.root)], check=True)
+        history = tmp_path / "usage.json"
+        history.write_text(json.dumps({"version": 1, "runs": [["default/base", "python/base"]]}))
+        config = json.loads(stub_config.read_text())
+        config["fetch_cache"] = {"enabled": True, "directory": str(tmp_path / "content")}
+        config["prefetch"] = {"history": str(history), "budget_kb": 0, "wait_seconds": 10}
+        stub_config.write_text(json.dumps(config))
+        monkeypatch.chdir(test_dir)
+
+        setup = startup_module.TemplateSetup(["default/base"], config=startup_module.Config(stub_config))
+        assert setup.run()
+
+        assert github_stub.count("*/templates/python/base/*") == 0
+
+    def test_prefetch_is_throttled_and_not_awaited(self, startup_module, setup_script: Path, test_dir: Path,
+                                                   tmp_path: Path, github_stub, stub_config: Path, monkeypatch):
+        """先読みは rate_kbps で速度を抑え、デフォルトでは完了を待たずに中止する"""
+        import time
+
+        subprocess.run([sys.executable, str(setup_script), "index", "-l", str(github_stub.root)], check=True)
+        history = tmp_path / "usage.json"
+        history.write_text(json.dumps({"version": 1, "runs": [["default/base", "python/base"]] * 3}))
+        config = json.loads(stub_config.read_text())
+        config["fetch_cache"] = {"enabled": True, "directory": str(tmp_path / "content")}
+        # 1ファイル取得すると数分待つ速度
+        config["prefetch"] = {"history": str(history), "rate_kbps": 0.01}
+        stub_config.write_text(json.dumps(config))
+        monkeypatch.chdir(test_dir)
+
+        setup = startup_module.TemplateSetup(["default/base"], config=startup_module.Config(stub_config))
+        start = time.perf_counter()
+        assert setup.run()
+
+        assert time.perf_counter() - start < 5
+        assert github_stub.count("*/templates/python/base/*") <= 1
+
+    def test_no_cache_does_not_record_usage(self, startup_module, test_dir: Path, tmp_path: Path,
+                                            test_config: Path, template_dir: Path, monkeypatch):
+        """キャッシュを使用しない実行は利用履歴を記録しない"""
+        history = tmp_path / "usage.json"
+        config = json.loads(test_config.read_text())
+        config["prefetch"] = {"history": str(history)}
+        config_file = tmp_path / "config.json"
+        config_file.write_text(json.dumps(config))
+        monkeypatch.chdir(test_dir)
+
+        setup = startup_module.TemplateSetup(["default/base"], config=startup_module.Config(config_file),
+                                             local_path=template_dir.parent, use_cache=False)
+        assert setup.run()
+
+        assert not history.exists()
+
+
 class TestPrerequisites:
     """実行環境の前提条件テスト"""
 
@@ -457,8 +1087,9 @@ class TestPrerequisites:
 class TestCommentStripping:
     """コメント除去機能のテスト"""
 
-    def test_json_with_single_line_comments(self, setup_script: Path, test_dir: Path, template_dir: Path):
-        """JSONファイルの単一行コメントを除去してマージ"""
+    def test_json_with_single_line_comments(self, setup_script: Path, test_dir: Path, template_dir: Path,
+                                            startup_module):
+        """JSONファイルの単一行コメントを保持したままマージ"""
         # コメント付きJSONファイルを作成
         vscode_dir = test_dir / ".vscode"
         vscode_dir.mkdir(parents=True)
@@ -474,18 +1105,22 @@ class TestCommentStripping:
         # マージテンプレートを適用
         run_setup(setup_script, test_dir, template_dir.parent, ["test/merge-json"])
 
-        # マージ結果を確認
-        with open(vscode_dir / "settings.json") as f:
-            merged = json.load(f)
+        # マージ結果を確認（コメントは保持される）
+        merged_text = (vscode_dir / "settings.json").read_text()
+        assert "// エディタ設定" in merged_text
+        assert "// フォントサイズ" in merged_text
+        merged = json.loads(startup_module.strip_json_comments(merged_text))
 
         # 既存の設定が保持されている
         assert merged["editor.fontSize"] == 14
         assert merged["files.autoSave"] == "afterDelay"
         # テンプレートからの新設定が追加される
         assert merged["newSetting"] == "from-template"
+        assert merged["editor.tabSize"] == 4
 
-    def test_json_with_multi_line_comments(self, setup_script: Path, test_dir: Path, template_dir: Path):
-        """JSONファイルの複数行コメントを除去してマージ"""
+    def test_json_with_multi_line_comments(self, setup_script: Path, test_dir: Path, template_dir: Path,
+                                           startup_module):
+        """JSONファイルの複数行コメントを保持したままマージ"""
         # コメント付きJSONファイルを作成
         vscode_dir = test_dir / ".vscode"
         vscode_dir.mkdir(parents=True)
@@ -495,7 +1130,7 @@ class TestCommentStripping:
        説明します */
     "editor.tabSize": 2,
     "editor.fontSize": 14,
-    /* このコメントも除去される */
+    /* このコメントも保持される */
     "files.autoSave": "afterDelay"
 }"""
         with open(vscode_dir / "settings.json", "w") as f:
@@ -504,9 +1139,10 @@ class TestCommentStripping:
         # マージテンプレートを適用
         run_setup(setup_script, test_dir, template_dir.parent, ["test/merge-json"])
 
-        # マージ結果を確認
-        with open(vscode_dir / "settings.json") as f:
-            merged = json.load(f)
+        # マージ結果を確認（コメントは保持される）
+        merged_text = (vscode_dir / "settings.json").read_text()
+        assert "/* このコメントも保持される */" in merged_text
+        merged = json.loads(startup_module.strip_json_comments(merged_text))
 
         # 既存の設定が保持されている
         assert merged["editor.fontSize"] == 14
@@ -7,42 +7,17 @@ JSON/YAML/TOML/XMLファイルのマージをサポート。
 """
 
 import argparse
+import errno
 import json
+import mmap
 import os
 import re
-import shutil
-import subprocess
 import sys
-import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Set, Tuple
-from urllib import request
-from urllib.error import HTTPError, URLError
-
-# 構造化ファイル処理用ライブラリ（遅延インポート）
-try:
-    import yaml
-    HAS_YAML = True
-except ImportError:
-    HAS_YAML = False
-
-try:
-    import tomli
-    import tomli_w
-    HAS_TOML = True
-except ImportError:
-    try:
-        import tomllib as tomli  # Python 3.11+
-        import tomli_w
-        HAS_TOML = True
-    except ImportError:
-        HAS_TOML = False
-
-try:
-    from xml.etree import ElementTree as ET
-    HAS_XML = True
-except ImportError:
-    HAS_XML = False
 
 
 # カラーコード
@@ -54,10 +29,337 @@ class Colors:
     NC = '\033[0m'  # No Color
 
 
+# ============================================================================
+# トレース
+# ============================================================================
+
+class _Span:
+    """記録中の区間（with 文で使用）"""
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Optional[dict]):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        if self.tracer.memory is not None:
+            self.tracer.memory.enter(self.category == "phase")
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        duration = time.perf_counter_ns() - self.start
+        args = self.args
+        if self.tracer.memory is not None:
+            peak, growth = self.tracer.memory.exit(self.name if self.category == "phase" else None)
+            args = dict(args or {}, mem_peak=peak, mem_growth=growth)
+        self.tracer.add(self.name, self.category, self.start, duration, args)
+        return False
+
+
+class Tracer:
+    """
+    処理区間（スパン）の記録
+
+    設定の読み込み・探索・取得・コメント除去・パース・マージ・書き込みの各区間を
+    カテゴリ付きで記録し、Chrome trace-event 形式（chrome://tracing や Perfetto で表示可能）
+    での出力と、カテゴリごとの集計を行います。時刻は perf_counter_ns の値で、
+    ワーカープロセスで記録した区間もそのまま統合できます。
+    """
+
+    # 集計表示の順序
+    CATEGORIES = ("phase", "config", "discovery", "fetch", "prefetch", "job", "strip", "parse", "merge", "serialize",
+                  "write")
+
+    def __init__(self, memory: Optional["MemoryProfiler"] = None):
+        import threading
+
+        self._get_ident = threading.get_ident
+        # メモリ使用量の計測（--memory-report）。区間の引数 mem_peak に最大値、
+        # mem_growth に開始時からの増加量（いずれもバイト）を記録する
+        self.memory = memory
+        self.origin = time.perf_counter_ns()
+        # (名前, カテゴリ, 開始ns, 所要ns, プロセスID, スレッドID, 引数)
+        self.events: List[tuple] = []
+
+    def span(self, name: str, category: str, args: Optional[dict] = None) -> _Span:
+        return _Span(self, name, category, args)
+
+    def add(self, name: str, category: str, start: int, duration: int, args: Optional[dict] = None) -> None:
+        self.events.append((name, category, start, duration, os.getpid(), self._get_ident(), args))
+
+    def to_chrome(self) -> dict:
+        """Chrome trace-event 形式（時刻はマイクロ秒）"""
+        events = []
+        for name, category, start, duration, pid, tid, args in self.events:
+            event = {"name": name, "cat": category, "ph": "X", "ts": (start - self.origin) / 1000,
+                     "dur": duration / 1000, "pid": pid, "tid": tid}
+            if args:
+                event["args"] = args
+            events.append(event)
+        main_pid = os.getpid()
+        for pid in sorted({event["pid"] for event in events}):
+            label = "vscode-project-startup" if pid == main_pid else f"merge worker {pid}"
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": label}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: Path) -> None:
+        """Chrome trace-event 形式のJSONを書き出す"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome(), f)
+
+    def summary(self) -> List[Tuple[str, int, float, float]]:
+        """カテゴリごとの (カテゴリ, 区間数, 合計ms, 最大ms)"""
+        totals: Dict[str, List[float]] = {}
+        for _, category, _, duration, _, _, _ in self.events:
+            entry = totals.setdefault(category, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration / 1e6
+            entry[2] = max(entry[2], duration / 1e6)
+        order = {category: index for index, category in enumerate(self.CATEGORIES)}
+        return [(category, int(count), total, longest)
+                for category, (count, total, longest) in sorted(totals.items(),
+                                                                 key=lambda item: order.get(item[0], len(order)))]
+
+    def print_summary(self) -> None:
+        """フェーズとカテゴリごとの所要時間を表示（入れ子の区間は親の時間にも含まれる）"""
+        print("処理時間の内訳:")
+        phases = [f"{name} {duration / 1e6:.2f} ms"
+                  for name, category, _, duration, _, _, _ in self.events if category == "phase"]
+        if phases:
+            print(f"  - フェーズ: {', '.join(phases)}")
+        for category, count, total, longest in self.summary():
+            if category == "phase":
+                continue
+            print(f"  - {category}: {count} 区間, 合計 {total:.2f} ms, 最大 {longest:.2f} ms")
+
+
+def _format_size(size: float) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} MB"
+    return f"{size / 1024:.1f} KB"
+
+
+class MemoryProfiler:
+    """
+    tracemalloc によるメモリ使用量の計測
+
+    区間ごとに、開始から終了までの確保済みメモリ（計測開始以降に確保されたもの）の最大値と、
+    開始時からの増加量を記録します。入れ子の区間の最大値は親の区間にも反映されます。
+    フェーズの区間では開始時と終了時のスナップショットを比較し、増加量の多い割り当て箇所を記録します。
+
+    tracemalloc.reset_peak のない Python 3.8 以前では区間ごとに最大値を計測し直せないため、
+    区間中に実行全体の最大値が更新された場合はその値を、それ以外は開始時と終了時の確保量の
+    大きい方を区間の最大値とします（区間内の一時的な増加は過小評価される場合があります）。
+    """
+
+    # 報告する処理のカテゴリ
+    CATEGORIES = ("fetch", "parse", "merge", "serialize", "write")
+    # ファイルごとの最大値を集計するカテゴリ（区間名がファイル）
+    FILE_CATEGORIES = ("fetch", "job", "write")
+
+    def __init__(self, top: int = 5):
+        import tracemalloc
+
+        self._tracemalloc = tracemalloc
+        self.top = top
+        # 記録中の区間ごとの最大値（先頭は実行全体）と開始時の確保量
+        self._peaks: List[int] = [0]
+        self._starts: List[int] = []
+        # reset_peak がない場合の、計測し直した時点の (実行全体の最大値, 確保量)
+        self._reset_peak = getattr(tracemalloc, "reset_peak", None)
+        self._mark = (0, 0)
+        self._snapshot = None
+        # フェーズ名 -> [(割り当て箇所, 増加バイト数)]
+        self.sites: Dict[str, List[Tuple[str, int]]] = {}
+        self._filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                         tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+        tracemalloc.start()
+
+    def stop(self) -> None:
+        self._tracemalloc.stop()
+
+    @property
+    def run_peak(self) -> int:
+        """実行全体の最大値（バイト）"""
+        if not self._tracemalloc.is_tracing():
+            return max(self._peaks)
+        return max(max(self._peaks), self._tracemalloc.get_traced_memory()[1])
+
+    def _traced_memory(self) -> Tuple[int, int]:
+        """(現在の確保量, 最後に計測し直してからの最大値)"""
+        current, peak = self._tracemalloc.get_traced_memory()
+        if self._reset_peak is None:
+            mark_peak, mark_current = self._mark
+            peak = peak if peak > mark_peak else max(current, mark_current)
+        return current, peak
+
+    def _restart_peak(self) -> None:
+        """最大値を計測し直す"""
+        if self._reset_peak is not None:
+            self._reset_peak()
+        else:
+            current, peak = self._tracemalloc.get_traced_memory()
+            self._mark = (peak, current)
+
+    def enter(self, phase: bool) -> None:
+        """区間の開始（それまでの最大値を親の区間に反映してから計測し直す）"""
+        current, peak = self._traced_memory()
+        self._peaks[-1] = max(self._peaks[-1], peak)
+        self._peaks.append(0)
+        self._starts.append(current)
+        if phase:
+            self._snapshot = self._tracemalloc.take_snapshot().filter_traces(self._filters)
+        self._restart_peak()
+
+    def exit(self, phase_name: Optional[str] = None) -> Tuple[int, int]:
+        """区間の終了（区間の (最大値, 開始時からの増加量) を返す）"""
+        peak = max(self._peaks.pop(), self._traced_memory()[1])
+        start = self._starts.pop()
+        self._peaks[-1] = max(self._peaks[-1], peak)
+        if phase_name is not None and self._snapshot is not None:
+            snapshot = self._tracemalloc.take_snapshot().filter_traces(self._filters)
+            self.sites[phase_name] = [
+                (f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", stat.size_diff)
+                for stat in snapshot.compare_to(self._snapshot, "lineno")[:self.top] if stat.size_diff > 0
+            ]
+            self._snapshot = None
+        return peak, max(0, peak - start)
+
+    def print_report(self, events: List[tuple]) -> None:
+        """実行全体・フェーズ・処理・ファイルごとの最大値と、フェーズごとの割り当て箇所を表示"""
+        print("メモリ使用量（tracemalloc）:")
+        print(f"  - 実行全体の最大: {_format_size(self.run_peak)}")
+        phases = [f"{name} {_format_size(args['mem_peak'])}"
+                  for name, category, _, _, _, _, args in events
+                  if category == "phase" and args and "mem_peak" in args]
+        if phases:
+            print(f"  - フェーズ: {', '.join(phases)}")
+
+        for category in self.CATEGORIES:
+            spans = [(args["mem_growth"], args["mem_peak"], args.get("file", name))
+                     for name, span_category, _, _, _, _, args in events
+                     if span_category == category and args and "mem_peak" in args]
+            if spans:
+                growth, peak, label = max(spans)
+                print(f"  - {category}: 最大 +{_format_size(growth)} → {_format_size(peak)} ({label}), {len(spans)} 区間")
+
+        # ファイルごと: 取得・マージジョブ・書き込みの区間のうち増加量が最大のもの
+        files: Dict[str, Tuple[int, int, str]] = {}
+        for name, category, _, _, _, _, args in events:
+            if category in self.FILE_CATEGORIES and args and "mem_peak" in args:
+                if name not in files or args["mem_growth"] > files[name][0]:
+                    files[name] = (args["mem_growth"], args["mem_peak"], category)
+        if files:
+            print(f"  - ファイルごとの増加量（上位{self.top}件）:")
+            for name, (growth, peak, category) in sorted(files.items(), key=lambda item: -item[1][0])[:self.top]:
+                print(f"      {name}: +{_format_size(growth)} → {_format_size(peak)} ({category})")
+
+        for phase, sites in self.sites.items():
+            if not sites:
+                continue
+            print(f"  - 割り当て箇所（{phase}、増加量の上位{len(sites)}件）:")
+            for site, size in sites:
+                print(f"      {site}: +{_format_size(size)}")
+
+    def check_budget(self, events: List[tuple], budget_mb: Optional[float],
+                     phase_budgets_mb: Dict[str, float]) -> List[str]:
+        """
+        上限を超えた項目を返す
+
+        Args:
+            budget_mb: 実行全体の上限（MB）
+            phase_budgets_mb: フェーズ名またはカテゴリ（fetch, parse, merge, write など）ごとの上限（MB）
+        """
+        exceeded = []
+        if budget_mb is not None and self.run_peak > budget_mb * 1024 * 1024:
+            exceeded.append(f"実行全体: {_format_size(self.run_peak)} > {budget_mb} MB")
+        for key, limit in phase_budgets_mb.items():
+            spans = [(args["mem_peak"], args.get("file", name))
+                     for name, category, _, _, _, _, args in events
+                     if args and "mem_peak" in args
+                     and (category == key if category != "phase" else name == key)]
+            if not spans:
+                continue
+            peak, label = max(spans)
+            if peak > limit * 1024 * 1024:
+                exceeded.append(f"{key}: {_format_size(peak)} ({label}) > {limit} MB")
+        return exceeded
+
+
+# 有効なトレーサー（無効な場合はNone）
+_tracer: Optional[Tracer] = None
+_NO_SPAN = nullcontext()
+
+
+def enable_tracing(memory: bool = False) -> Tracer:
+    """トレースを有効にする（memory=True の場合は区間ごとのメモリ使用量も計測する）"""
+    global _tracer
+    _tracer = Tracer(MemoryProfiler() if memory else None)
+    return _tracer
+
+
+def disable_tracing() -> Optional[Tracer]:
+    """トレースを無効にし、記録していたトレーサーを返す"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def trace_span(name: str, category: str, **args):
+    """区間を記録するコンテキストマネージャー（トレースが無効な場合は何もしない）"""
+    if _tracer is None:
+        return _NO_SPAN
+    return _Span(_tracer, name, category, args or None)
+
+
 # ============================================================================
 # 設定管理
 # ============================================================================
 
+# 設定キャッシュの形式を変更した場合に上げる
+CONFIG_CACHE_VERSION = 1
+
+
+class TemplatePlan:
+    """
+    テンプレートごとの実効設定（不変）
+
+    グローバル設定とテンプレート固有の設定を解決した結果です。
+    パターンの照合器は最初に使用したときにコンパイルされます。
+    """
+
+    __slots__ = ('name', 'folder_mapping', 'file_patterns', 'merge_matcher', '_file_matcher')
+
+    def __init__(self, name: str, folder_mapping: Tuple[Tuple[str, str], ...],
+                 file_patterns: Tuple[str, ...], merge_matcher: "PatternMatcher"):
+        """
+        Args:
+            name: テンプレート名
+            folder_mapping: (サブフォルダ, 配置先) の組（グローバル + テンプレート固有）
+            file_patterns: ファイルマッチパターン（グローバル + テンプレート固有、重複除去済み）
+            merge_matcher: マージパターンの照合器（全テンプレート共通）
+        """
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'folder_mapping', folder_mapping)
+        object.__setattr__(self, 'file_patterns', file_patterns)
+        object.__setattr__(self, 'merge_matcher', merge_matcher)
+        object.__setattr__(self, '_file_matcher', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"TemplatePlan は変更できません: {name}")
+
+    @property
+    def file_matcher(self) -> "PathPatterns":
+        """ファイルマッチパターンのコンパイル結果"""
+        if self._file_matcher is None:
+            object.__setattr__(self, '_file_matcher', PathPatterns(list(self.file_patterns)))
+        return self._file_matcher
+
+
 class Config:
     """設定管理クラス"""
 
@@ -77,10 +379,16 @@ class Config:
                 config_path = Path(__file__).parent / "config.json"
 
         self.config_path = config_path
-        self._config = self._load_config()
+        self.cache_path = config_path.with_name(f".{config_path.name}.cache")
+        # テンプレート名 -> (folder_mapping, file_patterns) の解決済みデータ
+        self._resolved: Dict[str, Tuple[tuple, tuple]] = {}
+        with trace_span("load", "config", path=str(config_path)):
+            self._config = self._load_config()
+        self._merge_matcher: Optional[PatternMatcher] = None
+        self._plans: Dict[str, TemplatePlan] = {}
 
     def _load_config(self) -> dict:
-        """設定ファイルを読み込む（存在しない場合は作成）"""
+        """設定ファイルを読み込む（存在しない場合は作成、有効なキャッシュがあれば使用）"""
         if not self.config_path.exists():
             print(f"{Colors.YELLOW}設定ファイルが見つかりません: {self.config_path}{Colors.NC}")
             print(f"{Colors.BLUE}デフォルトのconfig.jsonを作成します...{Colors.NC}")
@@ -89,8 +397,16 @@ class Config:
             print()
 
         try:
-            with self.config_path.open('r', encoding='utf-8') as f:
-                return json.load(f)
+            stat = self.config_path.stat()
+            signature = (CONFIG_CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+            with trace_span("read_cache", "config"):
+                cached = self._read_cache(signature)
+            if cached is not None:
+                config, self._resolved = cached
+                return config
+
+            with trace_span("parse", "config"), self.config_path.open('r', encoding='utf-8') as f:
+                config = json.load(f)
         except json.JSONDecodeError as e:
             print_error(f"設定ファイルのJSON形式が不正です: {e}")
             sys.exit(1)
@@ -98,6 +414,53 @@ class Config:
             print_error(f"設定ファイル読み込みエラー: {e}")
             sys.exit(1)
 
+        with trace_span("resolve", "config"):
+            self._resolved = self._resolve_templates(config)
+        with trace_span("write_cache", "config"):
+            self._write_cache(signature, config, self._resolved)
+        return config
+
+    @staticmethod
+    def _resolve_templates(config: dict) -> Dict[str, Tuple[tuple, tuple]]:
+        """templates セクションの各テンプレートの実効設定を解決"""
+        folder_mapping = config.get("folder_mapping", {})
+        file_patterns = config.get("file_match_patterns", [])
+        resolved = {}
+        for name, template_config in config.get("templates", {}).items():
+            mapping = dict(folder_mapping)
+            mapping.update(template_config.get("folder_mapping", {}))
+            # グローバル設定 + テンプレート固有のパターン（順序を保って重複除去）
+            patterns = dict.fromkeys(file_patterns)
+            patterns.update(dict.fromkeys(template_config.get("file_match_patterns", [])))
+            resolved[name] = (tuple(mapping.items()), tuple(patterns))
+        return resolved
+
+    def _read_cache(self, signature: tuple) -> Optional[Tuple[dict, Dict[str, Tuple[tuple, tuple]]]]:
+        """設定キャッシュを読み込む（設定ファイルの更新時刻・サイズが一致しない場合はNone）"""
+        import marshal
+
+        try:
+            cached_signature, config, resolved = marshal.loads(self.cache_path.read_bytes())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if cached_signature != signature:
+            return None
+        return config, resolved
+
+    def _write_cache(self, signature: tuple, config: dict, resolved: Dict[str, Tuple[tuple, tuple]]) -> None:
+        """設定キャッシュを書き込む（書き込めない場合は何もしない）"""
+        import marshal
+
+        temp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        try:
+            temp_path.write_bytes(marshal.dumps((signature, config, resolved)))
+            os.replace(temp_path, self.cache_path)
+        except (OSError, ValueError):
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+
     def _create_default_config(self) -> None:
         """デフォルトの設定ファイルを作成"""
         default_config_path = Path(__file__).parent / "config.json.default"
@@ -121,6 +484,8 @@ class Config:
             branch = "main"
             url = f"https://raw.githubusercontent.com/{user}/{repo}/{branch}/config.json.default"
 
+            from urllib import request
+
             req = request.Request(url)
             with request.urlopen(req, timeout=10) as response:
                 content = response.read()
@@ -146,6 +511,41 @@ class Config:
     def branch(self) -> str:
         return self._config["github"]["branch"]
 
+    @property
+    def raw_base_url(self) -> str:
+        """ファイルを取得するベースURL（テストやミラーでは別のサーバーを指定できる）"""
+        return self._config["github"].get("raw_base_url", "https://raw.githubusercontent.com").rstrip("/")
+
+    @property
+    def template_index(self) -> Optional[str]:
+        """リモートのテンプレートインデックスのパス（リポジトリのルートから、nullの場合は使用しない）"""
+        return self._config["github"].get("index", TEMPLATE_INDEX_NAME)
+
+    @property
+    def sources(self) -> List[dict]:
+        """
+        テンプレートソースのレイヤー（優先度の低い順、未設定の場合は github セクションのみ）
+
+        各レイヤーは {"name": 名前, "github": {user, repo, branch, raw_base_url, index}, "token_env": 環境変数名}
+        または {"name": 名前, "local": ディレクトリ}。相対パスは設定ファイルからの相対パスです。
+        """
+        layers = self._config.get("sources")
+        if not layers:
+            return [{"name": "github", "github": self._config["github"]}]
+
+        resolved = []
+        for number, layer in enumerate(layers, 1):
+            if ("github" in layer) == ("local" in layer):
+                print_error(f"sources の{number}番目のレイヤーには github と local のどちらか一方を指定してください")
+                sys.exit(1)
+            layer = dict(layer)
+            layer.setdefault("name", f"layer{number}")
+            if "local" in layer:
+                path = Path(layer["local"]).expanduser()
+                layer["local"] = path if path.is_absolute() else self.config_path.parent / path
+            resolved.append(layer)
+        return resolved
+
     @property
     def folder_mapping(self) -> Dict[str, str]:
         return self._config["folder_mapping"]
@@ -155,6 +555,13 @@ class Config:
         """マージパターン（フォーマット別）"""
         return self._config["merge_patterns"]
 
+    @property
+    def merge_matcher(self) -> "PatternMatcher":
+        """マージパターンのコンパイル済み照合器（ファイル名 -> フォーマット）"""
+        if self._merge_matcher is None:
+            self._merge_matcher = PatternMatcher.from_groups(self.merge_patterns)
+        return self._merge_matcher
+
     def get_all_merge_patterns(self) -> List[str]:
         """全マージパターンをフラットなリストで取得"""
         patterns = []
@@ -167,6 +574,62 @@ class Config:
         """GitHubファイル探索で試行するファイルパターン"""
         return self._config.get("file_match_patterns", [])
 
+    @property
+    def merge_options(self) -> dict:
+        """マージオプション（list_strategy, list_merge_key）"""
+        return self._config.get("merge_options", {})
+
+    @property
+    def merge_cache(self) -> dict:
+        """マージ結果キャッシュ設定（enabled, max_entries, persistent, directory）"""
+        return self._config.get("merge_cache", {})
+
+    @property
+    def parallel(self) -> dict:
+        """並列マージ設定（workers, min_jobs, min_bytes）"""
+        return self._config.get("parallel", {})
+
+    @property
+    def transfer(self) -> dict:
+        """ファイル転送設定（stream_threshold, chunk_size）"""
+        return self._config.get("transfer", {})
+
+    @property
+    def fetch_cache(self) -> dict:
+        """取得した内容のキャッシュ設定（enabled, directory）"""
+        return self._config.get("fetch_cache", {})
+
+    @property
+    def prefetch(self) -> dict:
+        """先読み設定（enabled, budget_kb, rate_kbps, min_probability, max_templates, wait_seconds, history）"""
+        return self._config.get("prefetch", {})
+
+    @property
+    def memory(self) -> dict:
+        """メモリ使用量の上限設定（budget_mb, phase_budget_mb, on_exceed）"""
+        return self._config.get("memory", {})
+
+    def plan(self, template_name: str) -> TemplatePlan:
+        """テンプレートの実効設定を取得（テンプレートごとに一度だけ作成）"""
+        plan = self._plans.get(template_name)
+        if plan is None:
+            resolved = self._resolved.get(template_name)
+            if resolved is None:
+                # templates セクションにないテンプレートはグローバル設定のみ
+                resolved = (tuple(self.folder_mapping.items()), tuple(dict.fromkeys(self.file_match_patterns)))
+            with trace_span("plan", "config", template=template_name):
+                plan = TemplatePlan(template_name, resolved[0], resolved[1], self.merge_matcher)
+            self._plans[template_name] = plan
+        return plan
+
+    @property
+    def subfolders(self) -> Set[str]:
+        """全テンプレートのサブフォルダ名（グローバル + テンプレート固有のフォルダマッピング）"""
+        names = set(self.folder_mapping)
+        for template_config in self._config.get("templates", {}).values():
+            names.update(template_config.get("folder_mapping", {}))
+        return names
+
     def get_template_folder_mapping(self, template_name: str) -> Dict[str, str]:
         """テンプレート固有のフォルダマッピングを取得"""
         templates = self._config.get("templates", {})
@@ -175,17 +638,11 @@ class Config:
 
     def get_template_file_match_patterns(self, template_name: str) -> List[str]:
         """テンプレート固有のファイルマッチパターンを取得（グローバル設定 + テンプレート固有）"""
-        templates = self._config.get("templates", {})
-        template_config = templates.get(template_name, {})
-        template_patterns = template_config.get("file_match_patterns", [])
-
-        # グローバル設定 + テンプレート固有のパターンをマージ（重複除去）
-        combined = list(self.file_match_patterns)  # コピーを作成
-        for pattern in template_patterns:
-            if pattern not in combined:
-                combined.append(pattern)
+        return list(self.plan(template_name).file_patterns)
 
-        return combined
+    def get_template_file_matcher(self, template_name: str) -> "PathPatterns":
+        """テンプレートのファイルマッチパターンのコンパイル結果"""
+        return self.plan(template_name).file_matcher
 
 
 # ============================================================================
@@ -222,22 +679,116 @@ def check_dependencies(merge_patterns: Dict[str, List[str]]) -> None:
         print()
 
 
+# ============================================================================
+# イベント出力（JSON Lines）
+# ============================================================================
+
+class EventLog:
+    """
+    構造化イベントの出力（--output jsonl）
+
+    emit() はイベントをキューに入れるだけで返り、バックグラウンドのスレッドが
+    溜まったイベントをまとめて1行1イベントのJSONとして書き出します。
+    端末やパイプへの書き込みを処理の進行と切り離すため、出力先が遅くても待たされません。
+    """
+
+    # 1回の書き込みにまとめる最大イベント数
+    BATCH_SIZE = 256
+
+    def __init__(self, stream):
+        import queue
+        import threading
+
+        self.stream = stream
+        self._queue = queue.SimpleQueue()
+        self._empty = queue.Empty
+        self._thread = threading.Thread(target=self._drain, name="event-log", daemon=True)
+        self._thread.start()
+        self._closed = False
+
+    def emit(self, event: str, **fields) -> None:
+        """イベントを追加（fields は JSON に変換できる値）"""
+        self._queue.put({"event": event, "time": round(time.time(), 6), **fields})
+
+    def _drain(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except self._empty:
+                pass
+
+            done = None in batch
+            lines = [json.dumps(event, ensure_ascii=False, default=str) for event in batch if event is not None]
+            if lines:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            if done:
+                return
+
+    def close(self) -> None:
+        """キューに残ったイベントを書き出して終了"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+
+# 有効なイベント出力（--output jsonl 以外はNone）
+_event_log: Optional[EventLog] = None
+
+
+def start_event_log(stream) -> EventLog:
+    """イベント出力を開始（終了時にキューに残ったイベントを書き出す）"""
+    global _event_log
+    import atexit
+
+    _event_log = EventLog(stream)
+    atexit.register(_event_log.close)
+    return _event_log
+
+
+def emit_event(event: str, **fields) -> None:
+    """イベントを出力（イベント出力が無効な場合は何もしない）"""
+    if _event_log is not None:
+        _event_log.emit(event, **fields)
+
+
 # ============================================================================
 # ユーティリティ関数
 # ============================================================================
 
 def print_error(message: str) -> None:
-    """エラーメッセージを表示"""
+    """エラーメッセージを表示（イベント出力時は message イベント）"""
+    if _event_log is not None:
+        _event_log.emit("message", level="error", message=message)
+        return
     print(f"{Colors.RED}エラー: {message}{Colors.NC}", file=sys.stderr)
 
 
+def print_warning(message: str) -> None:
+    """警告メッセージを表示（イベント出力時は message イベント）"""
+    if _event_log is not None:
+        _event_log.emit("message", level="warning", message=message)
+        return
+    print(f"{Colors.YELLOW}警告: {message}{Colors.NC}")
+
+
 def print_success(message: str) -> None:
-    """成功メッセージを表示"""
+    """成功メッセージを表示（イベント出力時は message イベント）"""
+    if _event_log is not None:
+        _event_log.emit("message", level="success", message=message)
+        return
     print(f"{Colors.GREEN}✓{Colors.NC} {message}")
 
 
 def print_info(message: str) -> None:
-    """情報メッセージを表示"""
+    """情報メッセージを表示（イベント出力時は message イベント）"""
+    if _event_log is not None:
+        _event_log.emit("message", level="info", message=message)
+        return
     print(f"{Colors.BLUE}{message}{Colors.NC}")
 
 
@@ -261,434 +812,2590 @@ def load_github_token() -> Optional[str]:
     return None
 
 
-def should_merge_file(filename: str, merge_patterns: Dict[str, List[str]]) -> bool:
-    """ファイルがマージ対象かどうかを判定"""
-    from fnmatch import fnmatch
-    # 全フォーマットのパターンをチェック
-    for format_patterns in merge_patterns.values():
-        if any(fnmatch(filename, pattern) for pattern in format_patterns):
-            return True
-    return False
-
-
-# ============================================================================
-# マージ関数
-# ============================================================================
+@contextmanager
+def map_file(path: Path):
+    """
+    ファイルを読み取り専用でメモリマップする（空ファイルやmmap非対応の場合は読み込んだbytes）
 
-def merge_json(existing_data: dict, new_data: dict) -> dict:
-    """JSONデータを深くマージ"""
-    result = existing_data.copy()
+    bytes と同様にスライス・find・len が使用でき、内容をヒープにコピーしません。
+    """
+    with path.open('rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # 空ファイルは mmap できない
+            mapped = None
 
-    for key, value in new_data.items():
-        if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-            result[key] = merge_json(result[key], value)
-        else:
-            result[key] = value
+        if mapped is None:
+            yield f.read()
+            return
 
-    return result
+        try:
+            yield mapped
+        finally:
+            mapped.close()
 
 
-def strip_json_comments(content: str) -> str:
-    """
-    JSON文字列からコメントを除去する
-    - 単一行コメント (//) を除去
-    - 複数行コメント (/* */) を除去
+@contextmanager
+def atomic_write(path: Path):
+    """一時ファイル（バイナリ）に書き出し、正常に終了した場合のみ path に置き換える"""
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with temp_path.open('wb') as output:
+            yield output
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
 
-    Args:
-        content: JSONコンテンツ文字列
 
-    Returns:
-        コメントが除去されたJSON文字列
-    """
-    # 複数行コメント /* ... */ を除去
-    content = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
-
-    # 単一行コメント // を除去（文字列内の//は除外）
-    lines = []
-    in_string = False
-    escape_next = False
-
-    for line in content.split('\n'):
-        cleaned_line = []
-        i = 0
-        while i < len(line):
-            char = line[i]
-
-            # エスケープ処理
-            if escape_next:
-                cleaned_line.append(char)
-                escape_next = False
-                i += 1
-                continue
+# カーネル内コピー・リンクが使用できない場合の errno（別ファイルシステム・未対応のファイル種別など）
+_COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                         errno.ENOTSUP, errno.EPERM, errno.EBADF, errno.ENOTTY, errno.EMLINK}
 
-            # バックスラッシュ
-            if char == '\\':
-                cleaned_line.append(char)
-                escape_next = True
-                i += 1
-                continue
+# ファイルの配置方法（reflink/hardlink が使用できない場合は copy にフォールバック）
+LINK_MODES = ("copy", "reflink", "hardlink")
 
-            # ダブルクォート
-            if char == '"':
-                in_string = not in_string
-                cleaned_line.append(char)
-                i += 1
-                continue
+# linux/fs.h: _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
 
-            # コメント開始（文字列外の場合のみ）
-            if not in_string and i + 1 < len(line) and line[i:i+2] == '//':
-                break  # 行の残りを無視
 
-            cleaned_line.append(char)
-            i += 1
+def _copy_fd(source_fd: int, dest_fd: int, size: int, chunk_size: int = 1024 * 1024) -> str:
+    """
+    ファイルディスクリプタ間でコピー（copy_file_range → sendfile → read/write の順に試す）
 
-        line_str = ''.join(cleaned_line).rstrip()
-        if line_str:  # 空行でない場合のみ追加
-            lines.append(line_str)
+    Returns:
+        使用した方法（"copy_file_range", "sendfile", "copy"）
+    """
+    offset = 0
+    for method in ("copy_file_range", "sendfile"):
+        if not hasattr(os, method):
+            continue
+        try:
+            while offset < size:
+                if method == "copy_file_range":
+                    copied = os.copy_file_range(source_fd, dest_fd, size - offset, offset)
+                else:
+                    copied = os.sendfile(dest_fd, source_fd, offset, size - offset)
+                if copied == 0:
+                    # コピー中にファイルが縮んだ
+                    break
+                offset += copied
+            return method
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+
+    os.lseek(source_fd, offset, os.SEEK_SET)
+    with open(source_fd, 'rb', closefd=False) as source, open(dest_fd, 'wb', closefd=False) as dest:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            dest.write(chunk)
+    return "copy"
+
+
+def copy_file(source: Path, dest: Path) -> str:
+    """
+    ファイルの内容をPythonのバッファを経由せずにコピー（dest は最後に置き換える）
 
-    return '\n'.join(lines)
+    Returns:
+        使用した方法（"copy_file_range", "sendfile", "copy"）
+    """
+    with source.open('rb') as src, atomic_write(dest) as output:
+        return _copy_fd(src.fileno(), output.fileno(), os.fstat(src.fileno()).st_size)
 
 
-def merge_json_files(existing_file: Path, new_file: Path, output_file: Path) -> bool:
-    """JSONファイルをマージ（コメントを自動除去）"""
+def _reflink(source: Path, dest: Path) -> bool:
+    """CoW クローン（FICLONE）で dest を作成（ファイルシステムが未対応の場合False）"""
     try:
-        # 既存ファイルを読み込み、コメントを除去
-        with existing_file.open('r', encoding='utf-8') as f:
-            existing_content = f.read()
-        existing_content = strip_json_comments(existing_content)
-        existing_data = json.loads(existing_content)
+        import fcntl
+    except ImportError:
+        return False
 
-        # 新規ファイルを読み込み、コメントを除去
-        with new_file.open('r', encoding='utf-8') as f:
-            new_content = f.read()
-        new_content = strip_json_comments(new_content)
-        new_data = json.loads(new_content)
+    temp_path = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    try:
+        with source.open('rb') as src, temp_path.open('wb') as output:
+            fcntl.ioctl(output.fileno(), _FICLONE, src.fileno())
+        os.replace(temp_path, dest)
+        return True
+    except OSError as e:
+        if e.errno not in _COPY_FALLBACK_ERRNOS:
+            raise
+        return False
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
 
-        merged_data = merge_json(existing_data, new_data)
 
-        with output_file.open('w', encoding='utf-8') as f:
-            json.dump(merged_data, f, indent=2, ensure_ascii=False)
-            f.write('\n')
+def _hardlink(source: Path, dest: Path) -> bool:
+    """source へのハードリンクで dest を置き換える（別ファイルシステムなどの場合False）"""
+    if dest.exists() and os.path.samefile(source, dest):
+        # 既に同じファイルを共有している（rename は同一ファイル間では何もしない）
+        return True
 
+    temp_path = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    try:
+        if temp_path.exists():
+            temp_path.unlink()
+        os.link(source, temp_path)
+        os.replace(temp_path, dest)
         return True
-    except Exception as e:
-        print_error(f"JSON マージエラー: {e}")
+    except OSError as e:
+        if e.errno not in _COPY_FALLBACK_ERRNOS:
+            raise
         return False
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
 
 
-def strip_yaml_comments(content: str) -> str:
+def place_file(source: Path, dest: Path, mode: str = "copy") -> str:
     """
-    YAML文字列からコメントを除去する
-    - # で始まるコメントを除去（文字列内の#は保持）
+    ローカルのファイルを dest に配置（hardlink → reflink → copy の順にフォールバック）
 
-    Args:
-        content: YAMLコンテンツ文字列
+    hardlink は配置先とテンプレートが同じファイルを共有するため、配置後に書き換えられない
+    ファイルにのみ使用してください。
 
     Returns:
-        コメントが除去されたYAML文字列
+        使用した方法（"hardlink", "reflink", または copy_file の戻り値）
     """
-    lines = []
-    for line in content.split('\n'):
-        # 簡易的な処理: 行頭から#までを探す（クォート内は考慮しない簡易版）
-        # YAMLパーサーは通常コメントを処理できるため、これは予備的な処理
-        # クォート外の # を見つける
-        in_single_quote = False
-        in_double_quote = False
-        escape_next = False
-        cleaned = []
-
-        for i, char in enumerate(line):
-            if escape_next:
-                cleaned.append(char)
-                escape_next = False
-                continue
-
-            if char == '\\' and (in_single_quote or in_double_quote):
-                cleaned.append(char)
-                escape_next = True
-                continue
+    if mode not in LINK_MODES:
+        raise ValueError(f"未対応の配置方法: {mode}")
+    if mode == "hardlink" and _hardlink(source, dest):
+        return "hardlink"
+    if mode in ("hardlink", "reflink") and _reflink(source, dest):
+        return "reflink"
+    return copy_file(source, dest)
 
-            if char == '"' and not in_single_quote:
-                in_double_quote = not in_double_quote
-                cleaned.append(char)
-                continue
 
-            if char == "'" and not in_double_quote:
-                in_single_quote = not in_single_quote
-                cleaned.append(char)
-                continue
+# グロブのワイルドカード文字
+_GLOB_WILDCARD = re.compile(r'[*?\[]')
 
-            if char == '#' and not in_single_quote and not in_double_quote:
-                break  # コメント開始
 
-            cleaned.append(char)
+class PatternMatcher:
+    """
+    ファイル名パターンの照合器（一度だけコンパイル）
 
-        cleaned_line = ''.join(cleaned).rstrip()
-        lines.append(cleaned_line)
+    ワイルドカードを含まないパターンは辞書で、ワイルドカードを含むパターンは
+    1つに結合した正規表現で照合します。パターンの数によらず1回の呼び出しで
+    最初に一致したパターンの値（フォーマット名など）を返します。
+    照合結果は fnmatch と同じで、複数のパターンが一致する場合は先に定義された方が優先されます。
+    """
 
-    return '\n'.join(lines)
+    def __init__(self, items: List[Tuple[str, object]]):
+        """
+        Args:
+            items: (パターン, 値) のリスト（優先順）
+        """
+        from fnmatch import translate
+
+        self.patterns = [pattern for pattern, _ in items]
+        self._literals: Dict[str, Tuple[int, object]] = {}
+        self._glob_values: List[Tuple[int, object]] = []
+        globs = []
+        for index, (pattern, value) in enumerate(items):
+            if _GLOB_WILDCARD.search(pattern) is None:
+                self._literals.setdefault(os.path.normcase(pattern), (index, value))
+            else:
+                globs.append(f"(?P<p{len(self._glob_values)}>{translate(os.path.normcase(pattern))})")
+                self._glob_values.append((index, value))
+        # パターンごとに名前付きグループ（Python 3.9/3.10 の translate は * が複数のパターンに
+        # 内部のグループを含めるため、番号ではなく名前で一致したパターンを判定する）
+        self._regex = re.compile("|".join(globs)) if globs else None
+
+    @classmethod
+    def from_groups(cls, groups: Dict[str, List[str]]) -> "PatternMatcher":
+        """{値: [パターン, ...]} から作成（merge_patterns 用）"""
+        return cls([(pattern, name) for name, patterns in groups.items() for pattern in patterns])
+
+    def match(self, name: str):
+        """最初に一致したパターンの値を返す（一致しない場合はNone）"""
+        name = os.path.normcase(name)
+        literal = self._literals.get(name)
+        if self._regex is not None:
+            found = self._regex.match(name)
+            if found is not None:
+                index, value = self._glob_values[int(found.lastgroup[1:])]
+                if literal is None or index < literal[0]:
+                    return value
+        return literal[1] if literal is not None else None
+
+    def __contains__(self, name: str) -> bool:
+        return self.match(name) is not None
+
+
+class PathPatterns:
+    """
+    ファイルマッチパターン（file_match_patterns）のコンパイル結果
 
+    パターンの種類:
+      settings.json      サブツリー内の任意の階層にある同名のファイル
+      *.code-snippets    サブツリー内の任意の階層でファイル名がグロブに一致するファイル
+      snippets/*.json    サブフォルダからの相対パスがグロブに一致するファイル（* は / をまたがない）
+      /settings.json     サブフォルダ直下のファイルのみ
+      **/test/*.json     ** は0個以上のディレクトリに一致
 
-def strip_toml_comments(content: str) -> str:
+    探索時は各ディレクトリで一致し得るパターンの状態だけを保持し、どのパターンにも
+    一致し得ないディレクトリには降りません。
     """
-    TOML文字列からコメントを除去する
-    - # で始まるコメントを除去（文字列内の#は保持）
 
-    Args:
-        content: TOMLコンテンツ文字列
+    _DOUBLE_STAR = "**"
 
-    Returns:
-        コメントが除去されたTOML文字列
-    """
-    lines = []
-    for line in content.split('\n'):
-        # TOMLのコメントは # から行末まで
-        in_single_quote = False
-        in_double_quote = False
-        in_triple_single = False
-        in_triple_double = False
-        escape_next = False
-        cleaned = []
-
-        i = 0
-        while i < len(line):
-            char = line[i]
-
-            if escape_next:
-                cleaned.append(char)
-                escape_next = False
-                i += 1
-                continue
+    def __init__(self, patterns: List[str]):
+        from fnmatch import translate
 
-            # トリプルクォートのチェック
-            if i + 2 < len(line):
-                three_chars = line[i:i+3]
-                if three_chars == '"""' and not in_single_quote and not in_triple_single:
-                    in_triple_double = not in_triple_double
-                    cleaned.append(three_chars)
-                    i += 3
-                    continue
-                elif three_chars == "'''" and not in_double_quote and not in_triple_double:
-                    in_triple_single = not in_triple_single
-                    cleaned.append(three_chars)
-                    i += 3
+        self.patterns = list(patterns)
+        # パターンごとのセグメント列（リテラルは文字列、グロブはコンパイル済みの match 関数）
+        self._segments: List[tuple] = []
+        for pattern in self.patterns:
+            if pattern.startswith("/"):
+                parts = pattern.lstrip("/").split("/")
+            elif "/" in pattern:
+                parts = pattern.split("/")
+            else:
+                parts = [self._DOUBLE_STAR, pattern]
+            segments = []
+            for part in parts:
+                if part == "" or part == ".":
                     continue
+                if part == self._DOUBLE_STAR or _GLOB_WILDCARD.search(part) is None:
+                    segments.append(part)
+                else:
+                    segments.append(re.compile(translate(part)).match)
+            self._segments.append(tuple(segments))
+
+        self._initial = self._closure((index, 0) for index, segments in enumerate(self._segments) if segments)
+
+    def _closure(self, states) -> frozenset:
+        """** は0個のディレクトリにも一致するため、次のセグメントの状態も加える"""
+        result = set()
+        pending = list(states)
+        while pending:
+            state = pending.pop()
+            if state in result:
+                continue
+            result.add(state)
+            index, position = state
+            segments = self._segments[index]
+            if segments[position] == self._DOUBLE_STAR and position + 1 < len(segments):
+                pending.append((index, position + 1))
+        return frozenset(result)
+
+    def _advance(self, states: frozenset, name: str, is_dir: bool) -> Tuple[bool, frozenset]:
+        """
+        エントリ1つ分状態を進める
 
-            if char == '\\' and (in_single_quote or in_double_quote or in_triple_single or in_triple_double):
-                cleaned.append(char)
-                escape_next = True
-                i += 1
+        Returns:
+            (ファイルとして一致したか, ディレクトリの場合に子に引き継ぐ状態)
+        """
+        matched = False
+        children = []
+        for index, position in states:
+            segments = self._segments[index]
+            segment = segments[position]
+            last = position == len(segments) - 1
+
+            if segment == self._DOUBLE_STAR:
+                if is_dir:
+                    children.append((index, position))
+                elif last:
+                    matched = True
                 continue
 
-            if char == '"' and not in_single_quote and not in_triple_single and not in_triple_double:
-                in_double_quote = not in_double_quote
-                cleaned.append(char)
-                i += 1
+            if segment.__class__ is str:
+                if segment != name:
+                    continue
+            elif segment(name) is None:
                 continue
 
-            if char == "'" and not in_double_quote and not in_triple_double and not in_triple_single:
-                in_single_quote = not in_single_quote
-                cleaned.append(char)
-                i += 1
+            if is_dir:
+                if not last:
+                    children.append((index, position + 1))
+            elif last:
+                matched = True
+
+        return matched, (self._closure(children) if children else frozenset())
+
+    def matches(self, rel_path: str) -> bool:
+        """相対パス（/ 区切り）がいずれかのパターンに一致するか"""
+        parts = [part for part in rel_path.split("/") if part]
+        states = self._initial
+        for part in parts[:-1]:
+            _, states = self._advance(states, part, True)
+            if not states:
+                return False
+        return bool(parts) and self._advance(states, parts[-1], False)[0]
+
+    def __contains__(self, rel_path: str) -> bool:
+        return self.matches(rel_path)
+
+    def _states_under(self, dir_path: str) -> frozenset:
+        states = self._initial
+        for part in dir_path.split("/"):
+            if part in ("", "."):
                 continue
+            _, states = self._advance(states, part, True)
+            if not states:
+                break
+        return states
+
+    def may_match_under(self, dir_path: str) -> bool:
+        """ディレクトリ（/ 区切りの相対パス）以下のファイルに一致し得るか"""
+        return bool(self._states_under(dir_path))
+
+    def matches_all_under(self, dir_path: str) -> bool:
+        """ディレクトリ以下の全てのファイルに一致するか（末尾が ** のパターン）"""
+        return any(self._segments[index][position] == self._DOUBLE_STAR
+                   and position == len(self._segments[index]) - 1
+                   for index, position in self._states_under(dir_path))
+
+    def walk(self, root: Path, list_dir, include=None) -> List[str]:
+        """
+        root 以下の一致するファイルを列挙（枝刈りあり）
 
-            if char == '#' and not (in_single_quote or in_double_quote or in_triple_single or in_triple_double):
-                break  # コメント開始
+        Args:
+            root: 探索の起点ディレクトリ
+            list_dir: ディレクトリの内容 {名前: ディレクトリかどうか} を返す関数（存在しない場合はNone）
+            include: 追加の絞り込み (相対パス, ディレクトリかどうか) -> bool。
+                     False を返したディレクトリには降りない
 
-            cleaned.append(char)
-            i += 1
+        Returns:
+            root からの相対パス（/ 区切り、ソート済み）
+        """
+        results = []
+        stack = [(root, "", self._initial)]
+        while stack:
+            path, prefix, states = stack.pop()
+            entries = list_dir(path)
+            if not entries:
+                continue
 
-        cleaned_line = ''.join(cleaned).rstrip()
-        lines.append(cleaned_line)
+            # 全ての状態がリテラルの場合は、ディレクトリ内容を走査せず名前で直接参照
+            literals = {self._segments[index][position] for index, position in states}
+            if all(segment.__class__ is str and segment != self._DOUBLE_STAR for segment in literals):
+                names = [name for name in literals if name in entries]
+            else:
+                names = entries
 
-    return '\n'.join(lines)
+            for name in names:
+                is_dir = entries[name]
+                matched, children = self._advance(states, name, is_dir)
+                if is_dir:
+                    if children and (include is None or include(prefix + name, True)):
+                        stack.append((path / name, f"{prefix}{name}/", children))
+                elif matched and (include is None or include(prefix + name, False)):
+                    results.append(prefix + name)
 
+        results.sort()
+        return results
 
-def merge_yaml_files(existing_file: Path, new_file: Path, output_file: Path) -> bool:
-    """YAMLファイルをマージ（コメントを自動除去）"""
-    if not HAS_YAML:
-        print_error("PyYAML がインストールされていません: pip install pyyaml")
-        return False
 
-    try:
-        # インポートを遅延実行（.venvからのインポートを可能にするため）
-        import yaml
+class FileFilter:
+    """
+    --only / --exclude による適用対象の絞り込み
 
-        # 既存ファイルを読み込み
-        with existing_file.open('r', encoding='utf-8') as f:
-            existing_content = f.read()
-        # YAMLパーサーは通常コメントを扱えるが、念のため除去オプションを提供
-        try:
-            existing_data = yaml.safe_load(existing_content) or {}
-        except yaml.YAMLError:
-            # コメント除去を試みる
-            existing_content = strip_yaml_comments(existing_content)
-            existing_data = yaml.safe_load(existing_content) or {}
-
-        # 新規ファイルを読み込み
-        with new_file.open('r', encoding='utf-8') as f:
-            new_content = f.read()
-        try:
-            new_data = yaml.safe_load(new_content) or {}
-        except yaml.YAMLError:
-            # コメント除去を試みる
-            new_content = strip_yaml_comments(new_content)
-            new_data = yaml.safe_load(new_content) or {}
+    パターンは PathPatterns と同じ形式で、配置先のパス（プロジェクトからの相対パス、
+    例: .vscode/settings.json）とテンプレート内のパス（例: vscode/settings.json）の
+    どちらかに一致すれば一致とみなします。探索時にディレクトリ単位で判定するため、
+    対象外のファイルは列挙・取得されません。
+    """
 
-        merged_data = merge_json(existing_data, new_data)
+    def __init__(self, only: Optional[List[str]] = None, exclude: Optional[List[str]] = None):
+        self.only = PathPatterns(only) if only else None
+        self.exclude = PathPatterns(exclude) if exclude else None
 
-        with output_file.open('w', encoding='utf-8') as f:
-            yaml.dump(merged_data, f, default_flow_style=False, allow_unicode=True)
+    def __bool__(self) -> bool:
+        return self.only is not None or self.exclude is not None
 
+    def accepts(self, template_path: str, dest_path: str) -> bool:
+        """ファイルが対象か"""
+        if self.only is not None and not (self.only.matches(template_path) or self.only.matches(dest_path)):
+            return False
+        if self.exclude is not None and (self.exclude.matches(template_path) or self.exclude.matches(dest_path)):
+            return False
         return True
-    except Exception as e:
-        print_error(f"YAML マージエラー: {e}")
-        return False
-
-
-def merge_toml_files(existing_file: Path, new_file: Path, output_file: Path) -> bool:
-    """TOMLファイルをマージ（コメントを自動除去）"""
-    if not HAS_TOML:
-        print_error("tomli/tomli_w がインストールされていません: pip install tomli tomli-w")
-        return False
 
-    try:
-        # インポートを遅延実行（.venvからのインポートを可能にするため）
-        try:
-            import tomli
-        except ImportError:
-            import tomllib as tomli
+    def may_include_dir(self, template_dir: str, dest_dir: str) -> bool:
+        """ディレクトリ以下に対象となり得るファイルがあるか"""
+        if self.only is not None and not (self.only.may_match_under(template_dir)
+                                          or self.only.may_match_under(dest_dir)):
+            return False
+        if self.exclude is not None and (self.exclude.matches_all_under(template_dir)
+                                         or self.exclude.matches_all_under(dest_dir)):
+            return False
+        return True
 
-        import tomli_w
+    def for_folder(self, subfolder: str, dest_dir: str):
+        """サブフォルダからの相対パスを判定する関数 (相対パス, ディレクトリかどうか) -> bool を返す"""
+        def include(rel_path: str, is_dir: bool) -> bool:
+            template_path = f"{subfolder}/{rel_path}"
+            dest_path = (Path(dest_dir) / rel_path).as_posix()
+            if is_dir:
+                return self.may_include_dir(template_path, dest_path)
+            return self.accepts(template_path, dest_path)
+        return include
 
-        # 既存ファイルを読み込み
-        with existing_file.open('r', encoding='utf-8') as f:
-            existing_content = f.read()
-        try:
-            existing_data = tomli.loads(existing_content)
-        except Exception:
-            # コメント除去を試みる
-            existing_content = strip_toml_comments(existing_content)
-            existing_data = tomli.loads(existing_content)
 
-        # 新規ファイルを読み込み
-        with new_file.open('r', encoding='utf-8') as f:
-            new_content = f.read()
-        try:
-            new_data = tomli.loads(new_content)
-        except Exception:
-            # コメント除去を試みる
-            new_content = strip_toml_comments(new_content)
-            new_data = tomli.loads(new_content)
+@lru_cache(maxsize=32)
+def _compile_groups(frozen: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> PatternMatcher:
+    return PatternMatcher([(pattern, name) for name, patterns in frozen for pattern in patterns])
 
-        merged_data = merge_json(existing_data, new_data)
 
-        with output_file.open('wb') as f:
-            tomli_w.dump(merged_data, f)
+def as_pattern_matcher(merge_patterns) -> PatternMatcher:
+    """merge_patterns（辞書またはコンパイル済みの照合器）を照合器に変換"""
+    if isinstance(merge_patterns, PatternMatcher):
+        return merge_patterns
+    return _compile_groups(tuple((name, tuple(patterns)) for name, patterns in merge_patterns.items()))
 
-        return True
-    except Exception as e:
-        print_error(f"TOML マージエラー: {e}")
-        return False
 
-        with output_file.open('wb') as f:
-            tomli_w.dump(merged_data, f)
+def should_merge_file(filename: str, merge_patterns) -> bool:
+    """ファイルがマージ対象かどうかを判定"""
+    return as_pattern_matcher(merge_patterns).match(filename) is not None
 
-        return True
-    except Exception as e:
-        print_error(f"TOML マージエラー: {e}")
-        return False
 
+# ============================================================================
+# マージ関数
+# ============================================================================
 
-def merge_xml_files(existing_file: Path, new_file: Path, output_file: Path) -> bool:
-    """XMLファイルをマージ（基本的な実装）"""
-    if not HAS_XML:
-        print_error("XML サポートが利用できません")
-        return False
+# リストのマージ戦略
+#   replace: 新しいリストで置き換え（デフォルト）
+#   append:  既存のリストの後ろに連結
+#   union:   既存にない要素のみ追加（list_merge_key 指定時は同じキーの辞書を深くマージ）
+LIST_STRATEGIES = ("replace", "append", "union")
 
-    try:
-        existing_tree = ET.parse(existing_file)
-        new_tree = ET.parse(new_file)
 
-        existing_root = existing_tree.getroot()
-        new_root = new_tree.getroot()
+def _list_item_fingerprint(item) -> str:
+    """リスト要素の同一性判定用の正規化表現（辞書やリストはハッシュできないため）"""
+    return json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
 
-        # 新しい要素を追加（単純な追加のみ、深いマージはなし）
-        for child in new_root:
-            existing_root.append(child)
 
-        existing_tree.write(output_file, encoding='utf-8', xml_declaration=True)
-        return True
-    except Exception as e:
-        print_error(f"XML マージエラー: {e}")
-        return False
+def merge_lists(existing: list, new: list, list_strategy: str = "replace",
+                list_merge_key: Optional[str] = None) -> list:
+    """
+    リスト同士をマージ
+
+    Args:
+        existing: 既存のリスト
+        new: マージするリスト
+        list_strategy: replace / append / union
+        list_merge_key: union で辞書要素を対応付けるキー（例: "name"）
+
+    Returns:
+        マージ結果（replace の場合は new そのもの）
+    """
+    if list_strategy == "replace":
+        return new
+    if list_strategy == "append":
+        return existing + new
+    if list_strategy != "union":
+        raise ValueError(f"不明なリスト戦略: {list_strategy}")
+
+    result = list(existing)
+    seen = {_list_item_fingerprint(item) for item in existing}
+    keyed: Dict[object, int] = {}
+    if list_merge_key is not None:
+        for index, item in enumerate(existing):
+            if isinstance(item, dict) and list_merge_key in item:
+                keyed.setdefault(_list_item_fingerprint(item[list_merge_key]), index)
+
+    for item in new:
+        if list_merge_key is not None and isinstance(item, dict) and list_merge_key in item:
+            identity = _list_item_fingerprint(item[list_merge_key])
+            index = keyed.get(identity)
+            if index is not None:
+                result[index] = deep_merge(result[index], item, list_strategy, list_merge_key)
+                continue
+            keyed[identity] = len(result)
+        else:
+            fingerprint = _list_item_fingerprint(item)
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+        result.append(item)
+
+    return result
+
+
+def deep_merge(existing_data, new_data, list_strategy: str = "replace",
+               list_merge_key: Optional[str] = None):
+    """
+    データを深くマージ（反復処理・コピーオンライト）
+
+    明示的なスタックで走査するため、ネストの深さによる再帰上限の影響を受けません。
+    新しいデータが触れない部分木はコピーせずにそのまま共有し、変更される経路上の
+    辞書だけを複製します。入力はどちらも変更されません（結果は入力と部分木を
+    共有するため、結果を変更する場合は呼び出し側でコピーしてください）。
+
+    Args:
+        existing_data: 既存のデータ
+        new_data: マージするデータ
+        list_strategy: リストのマージ戦略（LIST_STRATEGIES を参照）
+        list_merge_key: union で辞書要素を対応付けるキー
+
+    Returns:
+        マージ結果
+    """
+    if list_strategy not in LIST_STRATEGIES:
+        raise ValueError(f"不明なリスト戦略: {list_strategy}")
+
+    if not (isinstance(existing_data, dict) and isinstance(new_data, dict)):
+        if isinstance(existing_data, list) and isinstance(new_data, list):
+            return merge_lists(existing_data, new_data, list_strategy, list_merge_key)
+        return new_data
+
+    merge_list_values = list_strategy != "replace"
+    result = existing_data.copy()
+    stack = [(result, new_data)]
+    push = stack.append
+
+    while stack:
+        target, source = stack.pop()
+        for key, value in source.items():
+            if isinstance(value, dict):
+                current = target.get(key)
+                if isinstance(current, dict):
+                    if value and current is not value:
+                        # 変更される経路上の辞書のみ複製
+                        child = current.copy()
+                        target[key] = child
+                        push((child, value))
+                    continue
+            elif merge_list_values and isinstance(value, list):
+                current = target.get(key)
+                if isinstance(current, list):
+                    value = merge_lists(current, value, list_strategy, list_merge_key)
+            target[key] = value
+
+    return result
+
+
+def merge_json(existing_data: dict, new_data: dict) -> dict:
+    """JSONデータを深くマージ"""
+    return deep_merge(existing_data, new_data)
+
+
+# コメント除去用トークナイザ（構文別）
+#
+# 各パターンは「コメント」または「保持するトークン列（第1グループ）」に一致します。
+# 保持するトークン列はコメント記号を含まない平文と文字列リテラルの連続で、
+# 文字列リテラルを1つのトークンとして消費するため、文字列内の // や /* や # は
+# コメントとして扱われません。findall で第1グループのみを連結することで、
+# Pythonのループを介さずに1パスで処理します。
+_STRING_DOUBLE = r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"'
+
+_COMMENT_TOKENIZERS = {
+    # JSONC: // 行コメント / /* ブロックコメント */ / "..."
+    'json': re.compile(
+        r'//[^\n]*|/\*[\s\S]*?(?:\*/|\Z)'
+        r'|((?:[^"/]+|' + _STRING_DOUBLE + r'|/(?![/*]))+|[\s\S])'
+    ),
+    # YAML: 行頭または空白に続く # コメント / "..." / '...'（スカラー先頭のみ）
+    'yaml': re.compile(
+        r'(?<!\S)#[^\n]*'
+        r"""|((?:(?<![^\s\[{,:])(?:""" + _STRING_DOUBLE + r"""|'[^'\n]*(?:''[^'\n]*)*')"""
+        r"""|[^"'#]+|(?<=\S)#|['"])+|[\s\S])"""
+    ),
+    # TOML: # コメント / """...""" / '''...''' / "..." / '...'
+    'toml': re.compile(
+        r'#[^\n]*'
+        r"""|((?:[^"'#]+|\"\"\"(?:[^\\]|\\[\s\S])*?\"\"\"(?!")|'{3}[\s\S]*?'{3}(?!')"""
+        r"""|""" + _STRING_DOUBLE + r"""|'[^'\n]*')+|[\s\S])"""
+    ),
+}
+
+
+def strip_comments(content: str, syntax: str) -> str:
+    """
+    文字列からコメントを除去する（JSONC/YAML/TOML共通、1パス）
+
+    Args:
+        content: コンテンツ文字列
+        syntax: 'json' / 'yaml' / 'toml'
+
+    Returns:
+        コメントが除去された文字列（文字列リテラル内のコメント記号は保持）
+    """
+    with trace_span(f"strip_{syntax}_comments", "strip", bytes=len(content)):
+        return ''.join(_COMMENT_TOKENIZERS[syntax].findall(content))
+
+
+def strip_json_comments(content: str) -> str:
+    """
+    JSON文字列からコメントを除去する
+    - 単一行コメント (//) を除去
+    - 複数行コメント (/* */) を除去
+
+    Args:
+        content: JSONコンテンツ文字列
+
+    Returns:
+        コメントが除去されたJSON文字列
+    """
+    return strip_comments(content, 'json')
+
+
+def strip_yaml_comments(content: str) -> str:
+    """
+    YAML文字列からコメントを除去する
+    - # で始まるコメントを除去（文字列内の#は保持）
+
+    Args:
+        content: YAMLコンテンツ文字列
+
+    Returns:
+        コメントが除去されたYAML文字列
+    """
+    return strip_comments(content, 'yaml')
+
+
+def strip_toml_comments(content: str) -> str:
+    """
+    TOML文字列からコメントを除去する
+    - # で始まるコメントを除去（文字列内の#は保持）
+
+    Args:
+        content: TOMLコンテンツ文字列
+
+    Returns:
+        コメントが除去されたTOML文字列
+    """
+    return strip_comments(content, 'toml')
+
+
+# ============================================================================
+# JSONC パッチエンジン（書式保持マージ）
+# ============================================================================
+
+# 空白・コメント（BOMを含む）の読み飛ばし
+_JSONC_SKIP = re.compile(r'(?:[\s\ufeff]+|//[^\n]*|/\*[\s\S]*?(?:\*/|\Z))*')
+_JSONC_STRING = re.compile(_STRING_DOUBLE)
+_JSONC_SCALAR = re.compile(r'[^\s,:{}\[\]/"]+')
+# 括弧の対応付けに必要なトークン（文字列とコメント内の括弧は無視される）
+_JSONC_STRUCTURE = re.compile(_STRING_DOUBLE + r'|//[^\n]*|/\*[\s\S]*?(?:\*/|\Z)|[{}\[\]]')
+# 閉じ括弧の直前の末尾カンマ（コメント除去後のテキストに適用。文字列内のカンマは保持する）
+_JSONC_TRAILING_COMMA = re.compile('(' + _STRING_DOUBLE + r')|,(?=\s*[\]}])')
+
+
+class JsoncMember:
+    """オブジェクトのメンバー（キーと値のテキスト上の位置）"""
+
+    __slots__ = ('key', 'key_start', 'value_start', 'value_end', 'comma')
+
+    def __init__(self, key: str, key_start: int, value_start: int, value_end: int, comma: int):
+        self.key = key
+        self.key_start = key_start
+        self.value_start = value_start
+        self.value_end = value_end
+        # 後続のカンマ位置（なければ-1）
+        self.comma = comma
+
+
+class JsoncObject:
+    """スパン情報付きのJSONCオブジェクト（メンバーの値は必要になるまで解析しない）"""
+
+    __slots__ = ('start', 'close', 'members')
+
+    def __init__(self, start: int, close: int, members: List[JsoncMember]):
+        self.start = start
+        self.close = close
+        self.members = members
+
+
+class JsoncDocument:
+    """
+    JSONCテキストのスパンインデックス
+
+    オブジェクトのメンバーをテキスト上の位置とともに保持し、変更されたキーだけを
+    テキスト編集として適用します。変更されない領域（コメントを含む）はそのまま残ります。
+    ネストしたオブジェクトは、変更が必要な場合にのみ解析されます。
+    """
+
+    def __init__(self, text: str, list_strategy: str = "replace", list_merge_key: Optional[str] = None):
+        self.text = text
+        self.list_strategy = list_strategy
+        self.list_merge_key = list_merge_key
+        self.indent_unit = "  "
+        # 挿入するテキストの改行コード（既存の最初の改行に合わせる）
+        line_end = text.find('\n')
+        self.newline = '\r\n' if line_end > 0 and text[line_end - 1] == '\r' else '\n'
+        self._edits: List[Tuple[int, int, str]] = []
+
+    def _skip(self, pos: int) -> int:
+        return _JSONC_SKIP.match(self.text, pos).end()
+
+    def _error(self, message: str, pos: int) -> ValueError:
+        line = self.text.count('\n', 0, pos) + 1
+        return ValueError(f"{message}: 行 {line}")
+
+    def root(self) -> Optional[JsoncObject]:
+        """ルートのオブジェクトを解析（ルートがオブジェクトでない場合はNone）"""
+        pos = self._skip(0)
+        if pos >= len(self.text) or self.text[pos] != '{':
+            return None
+        root = self.parse_object(pos)
+        if root.members:
+            self.indent_unit = self._line_indent(root.members[0].key_start) or self.indent_unit
+        return root
+
+    def value_end(self, pos: int) -> int:
+        """値の終了位置を返す（値の中身は構築しない）"""
+        text = self.text
+        if pos >= len(text):
+            raise self._error("値がありません", pos)
+
+        char = text[pos]
+        if char == '"':
+            match = _JSONC_STRING.match(text, pos)
+            if not match:
+                raise self._error("文字列が閉じられていません", pos)
+            return match.end()
+
+        if char in '{[':
+            depth = 0
+            for match in _JSONC_STRUCTURE.finditer(text, pos):
+                token = match.group()
+                if token in '{[':
+                    depth += 1
+                elif token in '}]':
+                    depth -= 1
+                    if depth == 0:
+                        return match.end()
+            raise self._error("括弧が閉じられていません", pos)
+
+        match = _JSONC_SCALAR.match(text, pos)
+        if not match:
+            raise self._error("不正な値", pos)
+        return match.end()
+
+    def parse_object(self, pos: int) -> JsoncObject:
+        """pos の '{' から始まるオブジェクトのメンバー位置を解析"""
+        text = self.text
+        members = []
+        p = self._skip(pos + 1)
+
+        while p < len(text) and text[p] != '}':
+            key_match = _JSONC_STRING.match(text, p)
+            if not key_match:
+                raise self._error("キーが必要です", p)
+            key = json.loads(key_match.group())
+
+            p = self._skip(key_match.end())
+            if p >= len(text) or text[p] != ':':
+                raise self._error("':' が必要です", p)
+
+            value_start = self._skip(p + 1)
+            value_end = self.value_end(value_start)
+            p = self._skip(value_end)
+
+            comma = -1
+            if p < len(text) and text[p] == ',':
+                comma = p
+                p = self._skip(p + 1)
+            elif p < len(text) and text[p] != '}':
+                raise self._error("',' または '}' が必要です", p)
+
+            members.append(JsoncMember(key, key_match.start(), value_start, value_end, comma))
+
+        if p >= len(text):
+            raise self._error("オブジェクトが閉じられていません", pos)
+        return JsoncObject(pos, p, members)
+
+    def _line_start(self, pos: int) -> int:
+        return self.text.rfind('\n', 0, pos) + 1
+
+    def _line_indent(self, pos: int) -> Optional[str]:
+        """pos が行頭のインデント直後にある場合、そのインデントを返す"""
+        prefix = self.text[self._line_start(pos):pos]
+        return prefix if prefix.strip() == '' else None
+
+    def _render(self, value, indent: str) -> str:
+        """値をJSONとして書き出し、2行目以降に indent を付加"""
+        rendered = json.dumps(value, indent=self.indent_unit, ensure_ascii=False)
+        return rendered.replace('\n', self.newline + indent)
+
+    def _load_value(self, text: str):
+        """値のテキストを解析（コメントと末尾カンマを許容）"""
+        text = _JSONC_TRAILING_COMMA.sub(lambda match: match.group(1) or '', strip_json_comments(text))
+        return json.loads(text)
+
+    def patch_object(self, obj: JsoncObject, new_data: dict, indent: str) -> None:
+        """
+        new_data を obj に深くマージする編集を記録（deep_merge と同じ意味論）
+
+        Args:
+            obj: 対象オブジェクト
+            new_data: マージするデータ
+            indent: obj の閉じ括弧の行のインデント
+        """
+        member_indent = indent + self.indent_unit
+        if obj.members:
+            member_indent = self._line_indent(obj.members[0].key_start) or member_indent
+
+        # 重複キーは最後の出現が有効（json.loads と同じ）
+        members = {member.key: member for member in obj.members}
+        additions = []
+
+        for key, value in new_data.items():
+            member = members.get(key)
+            if member is None:
+                additions.append((key, value))
+                continue
+
+            if isinstance(value, dict) and self.text[member.value_start] == '{':
+                child_indent = self._line_indent(member.key_start) or member_indent
+                self.patch_object(self.parse_object(member.value_start), value, child_indent)
+                continue
+
+            current_text = self.text[member.value_start:member.value_end]
+            current = self._load_value(current_text)
+            if isinstance(current, list) and isinstance(value, list):
+                value = merge_lists(current, value, self.list_strategy, self.list_merge_key)
+            # 1 と true、1 と 1.0 を区別するため、正規化したJSON表現で比較
+            if json.dumps(current, sort_keys=True) == json.dumps(value, sort_keys=True):
+                continue
+
+            if '\n' in current_text:
+                value_indent = self._line_indent(member.key_start) or member_indent
+                rendered = self._render(value, value_indent)
+            else:
+                # 1行で書かれていた値（配列など）は1行のまま置き換える
+                rendered = json.dumps(value, ensure_ascii=False)
+            self._edits.append((member.value_start, member.value_end, rendered))
+
+        if additions:
+            self._insert_members(obj, additions, indent, member_indent)
+
+    def _insert_members(self, obj: JsoncObject, additions: List[Tuple[str, object]],
+                        indent: str, member_indent: str) -> None:
+        """オブジェクトの末尾に新しいメンバーを挿入する編集を記録"""
+        text = self.text
+        newline = self.newline
+        if obj.members and '\n' not in text[obj.start:obj.close]:
+            # 1行で書かれたオブジェクトは1行のまま追記する
+            body = ", ".join(f"{json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}"
+                             for key, value in additions)
+            last = obj.members[-1]
+            if last.comma >= 0:
+                self._edits.append((last.comma + 1, last.comma + 1, f" {body},"))
+            else:
+                self._edits.append((last.value_end, last.value_end, f", {body}"))
+            return
+
+        lines = [f"{member_indent}{json.dumps(key, ensure_ascii=False)}: {self._render(value, member_indent)}"
+                 for key, value in additions]
+
+        if not obj.members:
+            if text[obj.start + 1:obj.close].strip() == '':
+                self._edits.append((obj.start + 1, obj.close, newline + f",{newline}".join(lines) + newline + indent))
+            else:
+                # コメントのみのオブジェクト: 閉じ括弧の行の前に挿入
+                line_start = self._line_start(obj.close)
+                if text[line_start:obj.close].strip() == '':
+                    self._edits.append((line_start, line_start, f",{newline}".join(lines) + newline))
+                else:
+                    self._edits.append((obj.close, obj.close, newline + f",{newline}".join(lines) + newline + indent))
+            return
+
+        last = obj.members[-1]
+        if last.comma >= 0:
+            # 末尾カンマのスタイルを維持
+            anchor = last.comma + 1
+            body = "".join(f"{newline}{line}," for line in lines)
+        else:
+            anchor = last.value_end
+            self._edits.append((anchor, anchor, ","))
+            body = "".join(f"{newline}{line}" if i == len(lines) - 1 else f"{newline}{line},"
+                           for i, line in enumerate(lines))
+
+        # 同じ行の行末コメントの後ろ（改行コードの前）に挿入する
+        line_end = text.find('\n', anchor)
+        if line_end < 0 or line_end > obj.close:
+            line_end = anchor
+        else:
+            if text[line_end - 1] == '\r' and line_end - 1 >= anchor:
+                line_end -= 1
+            trailing = text[anchor:line_end]
+            if _JSONC_SKIP.fullmatch(trailing) is None:
+                line_end = anchor
+        self._edits.append((line_end, line_end, body))
+
+    def apply(self) -> str:
+        """記録した編集を適用したテキストを返す"""
+        if not self._edits:
+            return self.text
+
+        parts = []
+        pos = 0
+        for start, end, replacement in sorted(self._edits, key=lambda edit: (edit[0], edit[1])):
+            parts.append(self.text[pos:start])
+            parts.append(replacement)
+            pos = end
+        parts.append(self.text[pos:])
+        return ''.join(parts)
+
+
+def patch_jsonc(text: str, new_data: dict, options: Optional[dict] = None) -> Optional[str]:
+    """
+    JSONCテキストに new_data を書式を保持したまま深くマージ
+
+    Args:
+        text: 既存のJSONCテキスト
+        new_data: マージするデータ
+        options: マージオプション（list_strategy, list_merge_key）
+
+    Returns:
+        編集後のテキスト（ルートがオブジェクトでない場合はNone）
+    """
+    options = options or {}
+    document = JsoncDocument(text, options.get("list_strategy", "replace"), options.get("list_merge_key"))
+    root = document.root()
+    if root is None or not isinstance(new_data, dict):
+        return None
+
+    root_indent = document._line_indent(root.start) or ""
+    document.patch_object(root, new_data, root_indent)
+    return document.apply()
+
+
+# ============================================================================
+# XML マージ（ストリーミング）
+# ============================================================================
+
+class XmlStreamMerger:
+    """
+    XMLの深いマージ
+
+    要素はタグと識別属性（id, name など）の組で対応付け、再帰的にマージします。
+    識別属性を持たない要素は、タグが両側で1つずつしかない場合にマージし、
+    それ以外は同一内容の要素が既存側にあれば追加しません（再適用による重複を防止）。
+    ただしルート直下では既存側の同じタグの要素の数を先読みできないため、マージはせず、
+    同一内容の要素が既存側になければ末尾に追加します（<dependency> の並びなどを1つにまとめない）。
+
+    既存側は iterparse でストリーム処理し、ルート直下の要素ごとにマージ・書き出し後に
+    破棄するため、メモリ使用量はルート直下の最大の要素程度に抑えられます。
+    コメントと処理命令は保持されます（Python 3.8 以降）。
+    """
+
+    DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+
+    def __init__(self, overlay: bytes, identity_attributes: Optional[List[str]] = None):
+        """
+        Args:
+            overlay: マージするXML（テンプレート側、全体を読み込む）
+            identity_attributes: 要素の対応付けに使用する属性名
+        """
+        import io
+        from xml.etree import ElementTree
+
+        self._etree = ElementTree
+        self.identity_attributes = tuple(identity_attributes if identity_attributes is not None
+                                         else ("id", "name", "key"))
+        self.overlay_namespaces: Dict[str, str] = {}
+        self.overlay_root = None
+        for event, item in self._iterparse(io.BytesIO(overlay), ("start-ns", "end")):
+            if event == "start-ns":
+                self.overlay_namespaces.setdefault(item[1], item[0])
+            else:
+                self.overlay_root = item
+
+    def _iterparse(self, source, events: Tuple[str, ...]):
+        """コメント・処理命令を保持する iterparse（Python 3.7 では保持されない）"""
+        ET = self._etree
+        try:
+            builder = ET.TreeBuilder(insert_comments=True, insert_pis=True)
+        except TypeError:
+            # insert_comments / insert_pis と comment / pi イベントは Python 3.8 以降
+            builder = ET.TreeBuilder()
+            events = tuple(event for event in events if event not in ("comment", "pi"))
+        return ET.iterparse(source, events=events, parser=ET.XMLParser(target=builder))
+
+    # ------------------------------------------------------------------
+    # 要素の対応付けとマージ（メモリ上）
+    # ------------------------------------------------------------------
+
+    def identity(self, element) -> Optional[Tuple[Tuple[str, str], ...]]:
+        """要素の識別子（識別属性を持たない場合はNone）"""
+        values = tuple((name, element.attrib[name]) for name in self.identity_attributes
+                       if name in element.attrib)
+        return values or None
+
+    def canonical(self, element) -> tuple:
+        """内容比較用の正規形（空白・コメント・属性順を無視）"""
+        return (
+            element.tag,
+            tuple(sorted(element.attrib.items())),
+            (element.text or "").strip(),
+            tuple(self.canonical(child) for child in element if isinstance(child.tag, str)),
+        )
+
+    def merge_element(self, target, overlay) -> None:
+        """overlay を target に再帰的にマージ（属性は上書き、空白以外のテキストは置き換え）"""
+        target.attrib.update(overlay.attrib)
+        if overlay.text and overlay.text.strip():
+            target.text = overlay.text
+
+        keyed = {}
+        unkeyed: Dict[str, list] = {}
+        for child in target:
+            if not isinstance(child.tag, str):
+                continue
+            identity = self.identity(child)
+            if identity is None:
+                unkeyed.setdefault(child.tag, []).append(child)
+            else:
+                keyed.setdefault((child.tag, identity), child)
+
+        overlay_counts: Dict[str, int] = {}
+        for child in overlay:
+            if isinstance(child.tag, str) and self.identity(child) is None:
+                overlay_counts[child.tag] = overlay_counts.get(child.tag, 0) + 1
+
+        additions = []
+        canonical_forms: Dict[str, Set[tuple]] = {}
+        for child in overlay:
+            if not isinstance(child.tag, str):
+                continue
+
+            identity = self.identity(child)
+            if identity is not None:
+                match = keyed.get((child.tag, identity))
+            else:
+                candidates = unkeyed.get(child.tag, [])
+                match = None
+                if len(candidates) == 1 and overlay_counts[child.tag] == 1:
+                    match = candidates[0]
+                elif candidates:
+                    if child.tag not in canonical_forms:
+                        canonical_forms[child.tag] = {self.canonical(candidate) for candidate in candidates}
+                    if self.canonical(child) in canonical_forms[child.tag]:
+                        continue
+
+            if match is None:
+                additions.append(child)
+            else:
+                self.merge_element(match, child)
+
+        for child in additions:
+            self._append_child(target, child)
+
+    @staticmethod
+    def _append_child(parent, child) -> None:
+        """兄弟要素のインデントに合わせて子要素を末尾に追加"""
+        if len(parent):
+            last = parent[-1]
+            child.tail = last.tail
+            if parent.text is not None and parent.text.strip() == "":
+                last.tail = parent.text
+        else:
+            child.tail = None
+        parent.append(child)
+
+    # ------------------------------------------------------------------
+    # ストリーミングマージ
+    # ------------------------------------------------------------------
+
+    def merge(self, source, write) -> None:
+        """
+        既存のXMLをストリーム処理しながらマージし、結果を書き出す
+
+        Args:
+            source: 既存のXML（ファイルパスまたはバイナリファイルオブジェクト）
+            write: 出力先の書き込み関数（str を受け取る）
+        """
+        write(self.DECLARATION)
+        writer = None
+        root = None
+        depth = 0
+        pending_namespaces: List[Tuple[str, str]] = []
+        # 要素ごとの名前空間宣言
+        declarations: Dict[object, List[Tuple[str, str]]] = {}
+
+        # ルート直下のテンプレート要素の索引
+        overlay = self.overlay_root
+        keyed = {}
+        # タグ -> [(正規形, 要素)]（識別属性を持たない要素）
+        unkeyed: Dict[str, list] = {}
+        for child in overlay:
+            if isinstance(child.tag, str):
+                identity = self.identity(child)
+                if identity is None:
+                    unkeyed.setdefault(child.tag, []).append((self.canonical(child), child))
+                else:
+                    keyed[(child.tag, identity)] = child
+        matched: Set[int] = set()
+        # 処理済み（マージ済み）でまだ書き出していないルート直下の要素
+        completed = []
+        wrote_text = False
+
+        def flush(keep_last: bool) -> None:
+            """
+            処理済みの要素を書き出して破棄
+
+            iterparse はチャンク単位でツリーを構築するため、イベントを処理していない
+            後続の要素が既にツリーに存在する場合がある。書き出すのは処理済みの要素のみで、
+            末尾の要素は tail が確定していないため残す。
+            """
+            nonlocal wrote_text
+            while len(completed) > (1 if keep_last else 0):
+                if not wrote_text:
+                    writer.write_text(root.text)
+                    wrote_text = True
+                child = completed.pop(0)
+                writer.write_element(child, declarations)
+                writer.write_text(child.tail)
+                root.remove(child)
+
+        for event, item in self._iterparse(source, ("start", "end", "start-ns", "comment", "pi")):
+            if event == "start-ns":
+                pending_namespaces.append(item)
+                continue
+
+            if event == "start":
+                depth += 1
+                if pending_namespaces:
+                    declarations[item] = pending_namespaces
+                    pending_namespaces = []
+                if depth == 1:
+                    if item.tag != overlay.tag:
+                        raise ValueError(f"ルート要素が一致しません: {item.tag} / {overlay.tag}")
+                    root = item
+                    namespaces = {uri: prefix for prefix, uri in declarations.get(root, [])}
+                    writer = _XmlWriter(write, namespaces, self.overlay_namespaces)
+                    root.attrib.update(overlay.attrib)
+                    writer.write_start(root, declarations.pop(root, []))
+                continue
+
+            if depth == 0:
+                # ルート要素の外側のコメント・処理命令
+                if event in ("comment", "pi"):
+                    writer_for_prolog = writer or _XmlWriter(write, {}, {})
+                    writer_for_prolog.write_element(item, {})
+                    write("\n")
+                continue
+
+            if event == "end":
+                depth -= 1
+                if depth == 0:
+                    # ルートの終了: 未対応のテンプレート要素を追加
+                    additions = [child for child in overlay
+                                 if isinstance(child.tag, str) and id(child) not in matched]
+                    for child in additions:
+                        self._append_child(root, child)
+                        completed.append(child)
+                    if not completed:
+                        writer.write_text(root.text)
+                    flush(keep_last=False)
+                    writer.write_end(root)
+                    write("\n")
+                    continue
+                if depth != 1:
+                    continue
+                self._merge_top_level(item, keyed, unkeyed, matched)
+
+            if depth == 1:
+                completed.append(item)
+                flush(keep_last=True)
+
+    def _merge_top_level(self, element, keyed: dict, unkeyed: Dict[str, list], matched: Set[int]) -> None:
+        """ルート直下の要素をテンプレート側の対応する要素とマージ"""
+        identity = self.identity(element)
+        match = None
+        if identity is not None:
+            match = keyed.get((element.tag, identity))
+        elif element.tag in unkeyed:
+            # 同一内容のテンプレート要素は追加しない（マージはしない）
+            canonical = self.canonical(element)
+            for candidate_canonical, candidate in unkeyed[element.tag]:
+                if id(candidate) not in matched and candidate_canonical == canonical:
+                    matched.add(id(candidate))
+                    break
+
+        if match is not None and id(match) not in matched:
+            matched.add(id(match))
+            self.merge_element(element, match)
+
+
+class _XmlWriter:
+    """名前空間の接頭辞を保持したままXML要素を書き出す"""
+
+    def __init__(self, write, namespaces: Dict[str, str], fallback_prefixes: Dict[str, str]):
+        """
+        Args:
+            write: 書き込み関数
+            namespaces: ルートで宣言された名前空間（URI -> 接頭辞）
+            fallback_prefixes: 未宣言の名前空間に使用する接頭辞（テンプレート側の宣言）
+        """
+        from xml.etree import ElementTree
+        from xml.sax.saxutils import escape, quoteattr
+
+        self._write = write
+        self._etree = ElementTree
+        self._escape = escape
+        self._quoteattr = quoteattr
+        self.namespaces = namespaces
+        self.fallback_prefixes = fallback_prefixes
+
+    def write_text(self, text: Optional[str]) -> None:
+        if text:
+            self._write(self._escape(text))
+
+    def _qualify(self, name: str, scope: Dict[str, str], declare: List[Tuple[str, str]],
+                 attribute: bool = False) -> str:
+        """{uri}local を接頭辞付きの名前に変換（未宣言の名前空間は declare に追加）"""
+        if name[:1] != "{":
+            return name
+        uri, local = name[1:].split("}", 1)
+        prefix = scope.get(uri)
+        if prefix is None or (attribute and prefix == ""):
+            used = set(scope.values())
+            prefix = self.fallback_prefixes.get(uri)
+            if prefix is None or prefix in used or (attribute and prefix == ""):
+                index = 0
+                while f"ns{index}" in used:
+                    index += 1
+                prefix = f"ns{index}"
+            scope[uri] = prefix
+            declare.append((prefix, uri))
+        return f"{prefix}:{local}" if prefix else local
+
+    def _open_tag(self, element, scope: Dict[str, str], declare: List[Tuple[str, str]]) -> str:
+        tag = self._qualify(element.tag, scope, declare)
+        attributes = [f" {self._qualify(name, scope, declare, attribute=True)}={self._quoteattr(value)}"
+                      for name, value in element.attrib.items()]
+        namespaces = [f" xmlns:{prefix}={self._quoteattr(uri)}" if prefix else f" xmlns={self._quoteattr(uri)}"
+                      for prefix, uri in declare]
+        return f"<{tag}{''.join(namespaces)}{''.join(attributes)}"
+
+    def write_start(self, root, declarations: List[Tuple[str, str]]) -> None:
+        """ルート要素の開始タグを書き出す"""
+        self._write(self._open_tag(root, self.namespaces, list(declarations)) + ">")
+        self._root_tag = self._qualify(root.tag, self.namespaces, [])
+
+    def write_end(self, root) -> None:
+        """ルート要素の終了タグを書き出す"""
+        self._write(f"</{self._root_tag}>")
+
+    def write_element(self, element, declarations: Dict[object, List[Tuple[str, str]]],
+                      scope: Optional[Dict[str, str]] = None) -> None:
+        """要素（部分木）を書き出す（tail は含まない）"""
+        ET = self._etree
+        write = self._write
+        if element.tag is ET.Comment:
+            write(f"<!--{element.text or ''}-->")
+            return
+        if element.tag is ET.ProcessingInstruction:
+            write(f"<?{element.text or ''}?>")
+            return
+
+        scope = dict(self.namespaces if scope is None else scope)
+        declare = list(declarations.pop(element, []))
+        for prefix, uri in declare:
+            scope[uri] = prefix
+        opening = self._open_tag(element, scope, declare)
+
+        if not len(element) and not element.text:
+            write(opening + " />")
+            return
+
+        write(opening + ">")
+        self.write_text(element.text)
+        for child in element:
+            self.write_element(child, declarations, scope)
+            self.write_text(child.tail)
+        write(f"</{self._qualify(element.tag, scope, [])}>")
+
+
+# ============================================================================
+# フォーマットコーデック
+# ============================================================================
+
+# バックエンド未検出を表す値
+_UNDETECTED = object()
+
+
+def module_available(name: str) -> bool:
+    """モジュールがインストールされているか（インポートせずに判定）"""
+    from importlib.util import find_spec
+
+    try:
+        return find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class FormatCodec:
+    """
+    構造化ファイルフォーマットのコーデック基底クラス
+
+    parse / serialize / merge を提供します。バックエンドは最初に使用したときに検出し、
+    インストールされている中で最速のものを選択します。高速バックエンドと
+    純Pythonのフォールバックは同一の出力を生成する必要があります。
+    そのフォーマットのファイルを扱わない実行では、バックエンドはインポートされません。
+    """
+
+    name = ""
+    label = ""
+    # バックエンドが利用できない場合のエラーメッセージ
+    missing_message = ""
+    # 必要なモジュール（各タプルはいずれか1つがあればよい）
+    requirements: Tuple[Tuple[str, ...], ...] = ()
+
+    def __init__(self, prefer_fast: bool = True):
+        """
+        Args:
+            prefer_fast: Falseの場合は純Pythonのフォールバックを使用（比較・テスト用）
+        """
+        self.prefer_fast = prefer_fast
+        self._backend = _UNDETECTED
+
+    def __getattr__(self, name: str):
+        # バックエンド固有の属性（_yaml など）は検出時に設定されるため、未検出なら検出する
+        if name.startswith('_') and not name.startswith('__') and self.__dict__.get('_backend') is _UNDETECTED:
+            self.backend
+            return getattr(self, name)
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    @property
+    def backend(self) -> Optional[str]:
+        """使用するバックエンド名（利用不可の場合はNone）"""
+        if self._backend is _UNDETECTED:
+            self._backend = self.detect_backend(self.prefer_fast)
+        return self._backend
+
+    def detect_backend(self, prefer_fast: bool) -> Optional[str]:
+        """利用するバックエンドを検出（利用不可の場合はNone）"""
+        return "builtin"
+
+    @property
+    def available(self) -> bool:
+        """バックエンドが利用可能かどうか"""
+        return self.backend is not None
+
+    def installed(self) -> bool:
+        """必要なモジュールがインストールされているか（インポートせずに判定）"""
+        return all(any(module_available(module) for module in alternatives)
+                   for alternatives in self.requirements)
+
+    def parse(self, content: bytes):
+        """バイト列をデータに変換"""
+        raise NotImplementedError
+
+    def serialize(self, data) -> bytes:
+        """データをバイト列に変換"""
+        raise NotImplementedError
+
+    def merge(self, existing_data, new_data, options: Optional[dict] = None):
+        """
+        パース済みデータをマージ（デフォルトは深いマージ）
+
+        Args:
+            options: マージオプション（list_strategy, list_merge_key）
+        """
+        options = options or {}
+        return deep_merge(existing_data, new_data,
+                          options.get("list_strategy", "replace"), options.get("list_merge_key"))
+
+    def merge_content(self, existing: bytes, new: bytes, options: Optional[dict] = None) -> bytes:
+        """バイト列同士をマージ"""
+        with trace_span(self.name, "parse", bytes=len(existing) + len(new)):
+            existing_data = self.parse(existing)
+            new_data = self.parse(new)
+        merged = self.merge(existing_data, new_data, options)
+        with trace_span(self.name, "serialize"):
+            return self.serialize(merged)
+
+    def merge_file(self, existing_file: Path, new_file: Path, output_file: Path,
+                   options: Optional[dict] = None) -> None:
+        """ファイル同士をマージ（ストリーミング処理できるコーデックはオーバーライド）"""
+        output_file.write_bytes(self.merge_content(existing_file.read_bytes(), new_file.read_bytes(), options))
+
+    def can_merge_in_place(self, options: Optional[dict] = None) -> bool:
+        """merge_in_place に対応しているかどうか（対応するコーデックはオーバーライド）"""
+        return False
+
+    def merge_in_place(self, dest_file: Path, contents: List[bytes], options: Optional[dict] = None) -> bool:
+        """
+        配置先のファイルに contents を適用順にマージ（既存の内容をメモリに読み込まない）
+
+        Returns:
+            配置先を変更したかどうか
+        """
+        raise NotImplementedError
+
+
+# フォーマット名 -> コーデック
+CODECS: Dict[str, FormatCodec] = {}
+
+
+def register_codec(codec: FormatCodec) -> FormatCodec:
+    """コーデックを登録（同名のコーデックは置き換え）"""
+    CODECS[codec.name] = codec
+    return codec
+
+
+class JsonCodec(FormatCodec):
+    """JSON（コメント付きJSONを含む）"""
+
+    name = "json"
+    label = "JSON"
+
+    def __init__(self, prefer_fast: bool = True, preserve_format: bool = True):
+        """
+        Args:
+            prefer_fast: Falseの場合は純Pythonのフォールバックを使用（比較・テスト用）
+            preserve_format: Trueの場合、既存ファイルのコメントと書式を保持して差分のみ適用
+        """
+        super().__init__(prefer_fast)
+        self.preserve_format = preserve_format
+
+    def detect_backend(self, prefer_fast: bool) -> Optional[str]:
+        self._orjson = None
+        if prefer_fast:
+            try:
+                import orjson
+                self._orjson = orjson
+                return "orjson"
+            except ImportError:
+                pass
+        return "json"
+
+    def parse(self, content: bytes):
+        # コメント除去が唯一の前処理（1パス）
+        text = strip_json_comments(content.decode('utf-8'))
+        if self._orjson is not None:
+            try:
+                return self._orjson.loads(text)
+            except self._orjson.JSONDecodeError:
+                # NaNや64bitを超える整数など、orjsonが扱えない入力は標準ライブラリで処理
+                pass
+        return json.loads(text)
+
+    def serialize(self, data) -> bytes:
+        # 出力の同一性を保つため、シリアライズは常に標準ライブラリを使用
+        return (json.dumps(data, indent=2, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def merge_content(self, existing: bytes, new: bytes, options: Optional[dict] = None) -> bytes:
+        if self.preserve_format:
+            # 変更されたキーだけをテキスト編集として適用（コメント・書式を保持）
+            with trace_span(self.name, "parse", bytes=len(new)):
+                new_data = self.parse(new)
+            with trace_span("patch_jsonc", "serialize"):
+                patched = patch_jsonc(existing.decode('utf-8'), new_data, options)
+            if patched is not None:
+                return patched.encode('utf-8')
+        return super().merge_content(existing, new, options)
+
+
+class YamlCodec(FormatCodec):
+    """
+    YAML（読み込みは libyaml があれば CSafeLoader を使用）
+
+    libyaml のダンパーは長い文字列の折り返しやエスケープ（改行、\\x85、BMP外の文字など）が
+    純Python実装と異なるため、書き出しは常に SafeDumper を使用します。
+    """
+
+    name = "yaml"
+    label = "YAML"
+    missing_message = "PyYAML がインストールされていません: pip install pyyaml"
+    requirements = (("yaml",),)
+
+    def detect_backend(self, prefer_fast: bool) -> Optional[str]:
+        try:
+            import yaml
+        except ImportError:
+            return None
+
+        self._yaml = yaml
+        if prefer_fast and hasattr(yaml, "CSafeLoader"):
+            self._loader = yaml.CSafeLoader
+            return "libyaml"
+        self._loader = yaml.SafeLoader
+        return "pyyaml"
+
+    def parse(self, content: bytes):
+        # YAMLパーサーはコメントを扱えるため、前処理なしで1回だけパースする
+        # （事前にコメントを除去するとブロックスカラー内の # を壊す可能性がある）
+        return self._yaml.load(content.decode('utf-8'), Loader=self._loader) or {}
+
+    def serialize(self, data) -> bytes:
+        # 出力の同一性を保つため、シリアライズは常に純Pythonのダンパーを使用
+        return self._yaml.dump(data, Dumper=self._yaml.SafeDumper,
+                               default_flow_style=False, allow_unicode=True).encode('utf-8')
+
+
+class TomlCodec(FormatCodec):
+    """TOML（読み込みは標準ライブラリのtomllibを優先）"""
+
+    name = "toml"
+    label = "TOML"
+    missing_message = "tomli/tomli_w がインストールされていません: pip install tomli tomli-w"
+    requirements = (("tomli_w",), ("tomllib", "tomli"))
+
+    def detect_backend(self, prefer_fast: bool) -> Optional[str]:
+        try:
+            import tomli_w
+        except ImportError:
+            return None
+
+        self._writer = tomli_w
+        candidates = ("tomllib", "tomli") if prefer_fast else ("tomli", "tomllib")
+        for module_name in candidates:
+            try:
+                self._reader = __import__(module_name)
+                return module_name
+            except ImportError:
+                continue
+        return None
+
+    def parse(self, content: bytes):
+        # TOMLパーサーはコメントを扱えるため、前処理なしで1回だけパースする
+        return self._reader.loads(content.decode('utf-8'))
+
+    def serialize(self, data) -> bytes:
+        return self._writer.dumps(data).encode('utf-8')
+
+
+class XmlCodec(FormatCodec):
+    """
+    XML
+
+    merge_options の xml_mode で動作を選択します。
+      deep:   タグと識別属性で要素を対応付けて再帰的にマージ（ストリーミング、デフォルト）。
+              大きな既存ファイルへの適用は merge_in_place で既存の内容を読み込まずに行う
+      append: 新しいルートの子要素を末尾に追加（従来の動作）
+    """
+
+    name = "xml"
+    label = "XML"
+    missing_message = "XML サポートが利用できません"
+    requirements = (("xml.etree",),)
+
+    def detect_backend(self, prefer_fast: bool) -> Optional[str]:
+        try:
+            from xml.etree import ElementTree
+        except ImportError:
+            return None
+        self._etree = ElementTree
+        return "etree"
+
+    def parse(self, content: bytes):
+        return self._etree.fromstring(content)
+
+    def serialize(self, data) -> bytes:
+        import io
+
+        buffer = io.BytesIO()
+        self._etree.ElementTree(data).write(buffer, encoding='utf-8', xml_declaration=True)
+        return buffer.getvalue()
+
+    def merge(self, existing_data, new_data, options: Optional[dict] = None):
+        # 新しい要素を追加（単純な追加のみ、深いマージはなし）
+        for child in new_data:
+            existing_data.append(child)
+        return existing_data
+
+    def _stream_merger(self, new: bytes, options: Optional[dict]) -> Optional[XmlStreamMerger]:
+        """deep モードの場合はストリーミングマージャーを返す"""
+        options = options or {}
+        if options.get("xml_mode", "deep") != "deep":
+            return None
+        return XmlStreamMerger(new, options.get("xml_identity_attributes"))
+
+    def merge_content(self, existing: bytes, new: bytes, options: Optional[dict] = None) -> bytes:
+        import io
+
+        merger = self._stream_merger(new, options)
+        if merger is None:
+            return super().merge_content(existing, new, options)
+
+        buffer = io.StringIO()
+        merger.merge(io.BytesIO(existing), buffer.write)
+        return buffer.getvalue().encode('utf-8')
+
+    def merge_file(self, existing_file: Path, new_file: Path, output_file: Path,
+                   options: Optional[dict] = None) -> None:
+        merger = self._stream_merger(new_file.read_bytes(), options)
+        if merger is None:
+            return super().merge_file(existing_file, new_file, output_file, options)
+
+        # 出力先が既存ファイルと同じ場合があるため、一時ファイルに書き出してから置き換える
+        temp_file = output_file.with_name(f".{output_file.name}.{os.getpid()}.tmp")
+        try:
+            with existing_file.open('rb') as source, temp_file.open('w', encoding='utf-8') as output:
+                merger.merge(source, output.write)
+            os.replace(temp_file, output_file)
+        finally:
+            if temp_file.exists():
+                temp_file.unlink()
+
+    def can_merge_in_place(self, options: Optional[dict] = None) -> bool:
+        return (options or {}).get("xml_mode", "deep") == "deep"
+
+    def merge_in_place(self, dest_file: Path, contents: List[bytes], options: Optional[dict] = None) -> bool:
+        import filecmp
+
+        # テンプレートごとに前の結果を読みながら一時ファイルに書き出し、最後に置き換える
+        current = dest_file
+        temp_files = []
+        try:
+            for content in contents:
+                merger = self._stream_merger(content, options)
+                temp_file = dest_file.with_name(f".{dest_file.name}.{os.getpid()}.{len(temp_files)}.tmp")
+                temp_files.append(temp_file)
+                with current.open('rb') as source, temp_file.open('w', encoding='utf-8') as output:
+                    merger.merge(source, output.write)
+                if current != dest_file:
+                    current.unlink()
+                current = temp_file
+
+            # 既存の内容と同じ場合は置き換えない（更新時刻を変えない）
+            if filecmp.cmp(current, dest_file, shallow=False):
+                return False
+            os.replace(current, dest_file)
+            return True
+        finally:
+            for temp_file in temp_files:
+                if temp_file.exists():
+                    temp_file.unlink()
+
+
+class LineBasedCodec(FormatCodec):
+    """
+    行単位のテキスト（重複排除）
+
+    既存の内容はそのまま残し、既存にない新しい行だけを末尾に追加します。
+    重複判定には行の文字列ではなく64bitのハッシュ値をソートした配列（array('Q')）で保持するため、
+    メモリ使用量はファイルサイズではなく一意な行数に比例します（1行あたり8バイト）。
+    大きな既存ファイルへの適用は merge_in_place で追記するだけで、既存の内容を読み込みません。
+    """
+
+    name = "line_based"
+    label = "行ベース"
+
+    # 既存の行のハッシュ値を一度にソートする件数（Pythonのintのリストが大きくならないよう分割する）
+    INDEX_CHUNK_LINES = 4096
+
+    @staticmethod
+    def _iter_lines(buffer):
+        """バッファを改行を含む行ごとに返す（bytes / mmap 共通）"""
+        size = len(buffer)
+        start = 0
+        while start < size:
+            end = buffer.find(b'\n', start)
+            end = size if end < 0 else end + 1
+            yield buffer[start:end]
+            start = end
+
+    @staticmethod
+    def _fingerprint(line: bytes) -> int:
+        """改行を除いた行の64bitハッシュ値"""
+        import hashlib
+
+        return int.from_bytes(hashlib.blake2b(line.rstrip(b'\r\n'), digest_size=8).digest(), 'little')
+
+    def _fingerprint_index(self, buffer):
+        """
+        バッファの各行のハッシュ値をソート・重複排除した array('Q')
+
+        一定行数ごとにソートした配列を heapq.merge で統合するため、1行あたり
+        8バイト（統合中は16バイト）で済みます。
+        """
+        import heapq
+        from array import array
+        from itertools import islice
+
+        fingerprint = self._fingerprint
+        lines = self._iter_lines(buffer)
+        chunks = []
+        while True:
+            chunk = array('Q', sorted({fingerprint(line) for line in islice(lines, self.INDEX_CHUNK_LINES)}))
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+        if len(chunks) <= 1:
+            return chunks[0] if chunks else array('Q')
+
+        index = array('Q')
+        previous = None
+        for key in heapq.merge(*chunks):
+            if key != previous:
+                index.append(key)
+                previous = key
+        return index
+
+    def _append_new_lines(self, existing, contents: List[bytes], write) -> bool:
+        """
+        contents を順に走査し、existing（およびそれまでに追加した行）にない行を write に渡す
+
+        Returns:
+            1行以上追加したかどうか
+        """
+        from bisect import bisect_left
+
+        fingerprint = self._fingerprint
+        index = self._fingerprint_index(existing)
+        # テンプレートから追加した行（テンプレートは小さいためセットで保持する）
+        added = set()
+        # 末尾に改行がない場合は行が連結されないよう補う
+        needs_newline = len(existing) > 0 and existing[-1:] != b'\n'
+        appended = False
+
+        for new in contents:
+            for line in self._iter_lines(new):
+                key = fingerprint(line)
+                if key in added:
+                    continue
+                position = bisect_left(index, key)
+                if position < len(index) and index[position] == key:
+                    continue
+                added.add(key)
+                if needs_newline:
+                    write(b'\n')
+                write(line)
+                needs_newline = line[-1:] != b'\n'
+                appended = True
+        return appended
+
+    def merge_content(self, existing: bytes, new: bytes, options: Optional[dict] = None) -> bytes:
+        parts = [existing]
+        self._append_new_lines(existing, [new], parts.append)
+        return b''.join(parts)
+
+    def merge_file(self, existing_file: Path, new_file: Path, output_file: Path,
+                   options: Optional[dict] = None) -> None:
+        if output_file.exists() and os.path.samefile(existing_file, output_file):
+            self.merge_in_place(output_file, [new_file.read_bytes()], options)
+            return
+
+        with map_file(existing_file) as existing, map_file(new_file) as new:
+            temp_file = output_file.with_name(f".{output_file.name}.{os.getpid()}.tmp")
+            try:
+                with temp_file.open('wb') as output:
+                    output.write(existing)
+                    self._append_new_lines(existing, [new], output.write)
+                os.replace(temp_file, output_file)
+            finally:
+                if temp_file.exists():
+                    temp_file.unlink()
+
+    def can_merge_in_place(self, options: Optional[dict] = None) -> bool:
+        return True
+
+    def merge_in_place(self, dest_file: Path, contents: List[bytes], options: Optional[dict] = None) -> bool:
+        # 既存の内容はそのまま残すため、新しい行を追記するだけでよい
+        with map_file(dest_file) as existing, dest_file.open('ab') as output:
+            return self._append_new_lines(existing, contents, output.write)
+
+    def parse(self, content: bytes):
+        import io
+
+        # 改行コードを正規化して行に分割（テキストモード読み込みと同等）
+        return io.StringIO(content.decode('utf-8'), newline=None).readlines()
+
+    def serialize(self, data) -> bytes:
+        return ''.join(data).encode('utf-8')
+
+    def merge(self, existing_data, new_data, options: Optional[dict] = None):
+        # 既存の行をセットに保存（重複チェック用、改行を除いて比較）
+        existing_set = {line.rstrip('\n\r') for line in existing_data}
+
+        # マージ結果（既存 + 重複しない新規）
+        merged_lines = list(existing_data)
+
+        # 新規行を追加（既存にない行のみ）
+        for line in new_data:
+            line_stripped = line.rstrip('\n\r')
+            if line_stripped not in existing_set:
+                if merged_lines and not merged_lines[-1].endswith('\n'):
+                    merged_lines[-1] += '\n'
+                merged_lines.append(line)
+                existing_set.add(line_stripped)
+
+        return merged_lines
+
+
+register_codec(JsonCodec())
+register_codec(YamlCodec())
+register_codec(TomlCodec())
+register_codec(XmlCodec())
+register_codec(LineBasedCodec())
+
+# インポートせずに判定（check_dependencies 用）
+HAS_YAML = CODECS["yaml"].installed()
+HAS_TOML = CODECS["toml"].installed()
+HAS_XML = CODECS["xml"].installed()
+
+
+def _merge_files_with_codec(codec: FormatCodec, existing_file: Path, new_file: Path, output_file: Path) -> bool:
+    """コーデックを使用してファイルをマージ"""
+    if not codec.available:
+        print_error(codec.missing_message)
+        return False
+
+    try:
+        codec.merge_file(existing_file, new_file, output_file)
+        return True
+    except Exception as e:
+        print_error(f"{codec.label} マージエラー: {e}")
+        return False
+
+
+def merge_json_files(existing_file: Path, new_file: Path, output_file: Path) -> bool:
+    """JSONファイルをマージ（コメントを自動除去）"""
+    return _merge_files_with_codec(CODECS["json"], existing_file, new_file, output_file)
+
+
+def merge_yaml_files(existing_file: Path, new_file: Path, output_file: Path) -> bool:
+    """YAMLファイルをマージ（コメントを自動除去）"""
+    return _merge_files_with_codec(CODECS["yaml"], existing_file, new_file, output_file)
+
+
+def merge_toml_files(existing_file: Path, new_file: Path, output_file: Path) -> bool:
+    """TOMLファイルをマージ（コメントを自動除去）"""
+    return _merge_files_with_codec(CODECS["toml"], existing_file, new_file, output_file)
+
+
+def merge_xml_files(existing_file: Path, new_file: Path, output_file: Path) -> bool:
+    """XMLファイルをマージ（要素を対応付けた深いマージ、ストリーミング処理）"""
+    return _merge_files_with_codec(CODECS["xml"], existing_file, new_file, output_file)
 
 
 def merge_line_based_files(existing_file: Path, new_file: Path, output_file: Path) -> bool:
     """行単位のテキストファイルをマージ（重複排除）"""
+    return _merge_files_with_codec(CODECS["line_based"], existing_file, new_file, output_file)
+
+
+def get_file_format(filename: str, merge_patterns) -> Optional[str]:
+    """ファイル名からフォーマットを判定（merge_patterns は辞書またはコンパイル済みの照合器）"""
+    return as_pattern_matcher(merge_patterns).match(filename)
+
+
+def merge_structured_file(existing_file: Path, new_file: Path, output_file: Path, merge_patterns,
+                          merge_options: Optional[dict] = None) -> bool:
+    """構造化ファイルをフォーマットに応じてマージ"""
+    merged, error = merge_structured_content(
+        existing_file.name, existing_file.read_bytes(), new_file.read_bytes(), merge_patterns, merge_options
+    )
+    if merged is None:
+        print_error(error)
+        return False
+
+    output_file.write_bytes(merged)
+    return True
+
+
+def merge_structured_content(filename: str, existing: bytes, new: bytes,
+                             merge_patterns,
+                             merge_options: Optional[dict] = None) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    構造化データ（バイト列）をフォーマットに応じてマージ
+
+    ファイルI/Oを伴わないため、ワーカープロセスからも呼び出せます。
+
+    Returns:
+        (マージ結果, エラーメッセージ) のタプル（成功時はエラーメッセージがNone）
+    """
+    file_format = get_file_format(filename, merge_patterns)
+
+    if file_format is None:
+        return None, f"未対応のファイル: {filename}"
+
+    codec = CODECS.get(file_format)
+    if codec is None:
+        return None, f"未対応のフォーマット: {file_format}"
+    if not codec.available:
+        return None, codec.missing_message
+
+    try:
+        with trace_span(codec.name, "merge", file=filename):
+            return codec.merge_content(existing, new, merge_options), None
+    except Exception as e:
+        return None, f"{codec.label} マージエラー: {e}"
+
+
+# ============================================================================
+# マージ結果キャッシュ
+# ============================================================================
+
+# マージの意味論を変更した場合に上げる（永続キャッシュの無効化）
+# 2: XML のデフォルトを追加から深いマージ（xml_mode: deep）に変更
+# 3: YAML の書き出しを libyaml の有無によらず SafeDumper に統一
+# 4: XML のルート直下の識別属性を持たない要素をマージせずに追加
+MERGE_CACHE_VERSION = 4
+
+
+def default_cache_dir() -> Path:
+    """
+    キャッシュディレクトリを取得
+
+    優先順位: 環境変数 VSCODE_TEMPLATE_CACHE_DIR > $XDG_CACHE_HOME/vscode-templates > ~/.cache/vscode-templates
+    """
+    env_dir = os.environ.get("VSCODE_TEMPLATE_CACHE_DIR")
+    if env_dir:
+        return Path(env_dir)
+    xdg_cache = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg_cache) if xdg_cache else Path.home() / ".cache"
+    return base / "vscode-templates"
+
+
+class MergeCache:
+    """
+    マージ結果のメモ化キャッシュ
+
+    (フォーマット, 既存内容のハッシュ, テンプレート内容のハッシュ, マージオプション) を
+    キーとして、マージ結果のバイト列を保持します。メモリ上のLRUと、任意でディスク上の
+    永続キャッシュの2段構成です。キャッシュはベストエフォートで、読み書きに失敗しても
+    マージ処理は継続します。
+    """
+
+    def __init__(self, max_entries: int = 1024, directory: Optional[Path] = None):
+        """
+        Args:
+            max_entries: メモリ上に保持する最大エントリ数
+            directory: 永続キャッシュのディレクトリ（Noneの場合はメモリのみ）
+        """
+        from collections import OrderedDict
+
+        self.max_entries = max_entries
+        self.directory = directory
+        # キー -> (マージ結果, マージに要した時間)
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # ヒットにより省略できたマージ時間の合計
+        self.saved_time = 0.0
+
+    @staticmethod
+    def make_key(file_format: str, existing: Optional[bytes], contents: List[bytes],
+                 options: Optional[dict] = None) -> str:
+        """キャッシュキーを生成（各内容のハッシュとフォーマット・オプションから算出）"""
+        import hashlib
+
+        digest = hashlib.sha256()
+        header = json.dumps([MERGE_CACHE_VERSION, file_format, options or {}], sort_keys=True)
+        digest.update(header.encode('utf-8'))
+        digest.update(b'\0' if existing is None else hashlib.sha256(existing).digest())
+        for content in contents:
+            digest.update(hashlib.sha256(content).digest())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """キャッシュを検索（ディスクでヒットした場合はメモリに昇格）"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            self.saved_time += entry[1]
+            return entry[0]
+
+        if self.directory is not None:
+            try:
+                header, _, value = self._path(key).read_bytes().partition(b'\n')
+                cost = float(header)
+            except (OSError, ValueError):
+                pass
+            else:
+                self._remember(key, value, cost)
+                self.disk_hits += 1
+                self.saved_time += cost
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: bytes, cost: float = 0.0) -> None:
+        """マージ結果を保存"""
+        self._remember(key, value, cost)
+
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = path.with_name(f"{key}.{os.getpid()}.tmp")
+                temp_path.write_bytes(f"{cost:.6f}\n".encode('ascii') + value)
+                os.replace(temp_path, path)
+            except OSError:
+                pass
+
+    def _remember(self, key: str, value: bytes, cost: float) -> None:
+        self._entries[key] = (value, cost)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @property
+    def lookups(self) -> int:
+        return self.memory_hits + self.disk_hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        """ヒット率（0.0〜1.0）"""
+        return (self.memory_hits + self.disk_hits) / self.lookups if self.lookups else 0.0
+
+    def report(self) -> None:
+        """ヒット率と省略できたマージ時間を表示"""
+        if self.lookups == 0:
+            return
+        hits = self.memory_hits + self.disk_hits
+        print(f"  - マージキャッシュ: ヒット {hits}/{self.lookups} ({self.hit_rate * 100:.0f}%)"
+              f" [メモリ {self.memory_hits}, ディスク {self.disk_hits}],"
+              f" 省略したマージ時間 {self.saved_time * 1000:.1f} ms")
+
+
+class ContentCache:
+    """
+    テンプレートの内容の永続キャッシュ（内容の SHA-256 をキーとする）
+
+    テンプレートインデックスに記載されたハッシュと一致する内容のみを保存するため、
+    インデックスのハッシュのファイルがあれば取得せずに使用できます。ソース（レイヤー）を
+    またいで同じ内容は1つだけ保存されます。読み書きに失敗しても処理は継続します。
+    """
+
+    def __init__(self, directory: Path):
+        import threading
+
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def __contains__(self, digest: str) -> bool:
+        return self.path(digest).is_file()
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """キャッシュされた内容（ない場合はNone）"""
+        try:
+            content = self.path(digest).read_bytes()
+        except OSError:
+            content = None
+        self._count(content is not None)
+        return content
+
+    def copy_to(self, digest: str, dest_path: Path) -> bool:
+        """キャッシュされた内容を dest_path に配置（ない場合False）"""
+        try:
+            copy_file(self.path(digest), dest_path)
+        except OSError:
+            self._count(False)
+            return False
+        self._count(True)
+        return True
+
+    def put(self, digest: str, content: bytes) -> None:
+        """内容を保存"""
+        path = self.path(digest)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_write(path) as output:
+                output.write(content)
+        except OSError:
+            pass
+
+    def put_file(self, digest: str, source_path: Path) -> None:
+        """ファイルの内容を保存（大きなファイルをメモリに読み込まずに保存する）"""
+        path = self.path(digest)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            copy_file(source_path, path)
+        except OSError:
+            pass
+
+    def report(self) -> None:
+        """ヒット数を表示"""
+        if self.hits + self.misses:
+            print(f"  - 取得キャッシュ: ヒット {self.hits}/{self.hits + self.misses}")
+
+
+# ============================================================================
+# 並列マージ実行
+# ============================================================================
+
+def run_merge_chain(filename: str, existing: Optional[bytes], contents: List[bytes],
+                    merge_patterns,
+                    merge_options: Optional[dict] = None) -> Tuple[Optional[bytes], List[Tuple[str, Optional[str]]], int, float]:
+    """
+    1つの配置先に対するマージの連鎖を実行（ワーカープロセスで実行される）
+
+    同じ配置先に複数のテンプレートが書き込む場合、適用順に畳み込む必要があるため
+    配置先単位で1つのジョブとして扱います。
+
+    Args:
+        filename: 配置先のファイル名（フォーマット判定用）
+        existing: 配置先の既存内容（存在しない場合はNone）
+        contents: 適用順に並んだテンプレートの内容
+        merge_patterns: マージパターン（フォーマット別の辞書、またはコンパイル済みの照合器）
+        merge_options: マージオプション（list_strategy, list_merge_key）
+
+    Returns:
+        (最終内容, 各ステップの(アクション, エラー), プロセスID, 処理時間) のタプル
+    """
+    start = time.perf_counter()
+    current = existing
+    steps: List[Tuple[str, Optional[str]]] = []
+
+    with trace_span(filename, "job", steps=len(contents)):
+        for content in contents:
+            if current is None:
+                current = content
+                steps.append(("create", None))
+                continue
+
+            merged, error = merge_structured_content(filename, current, content, merge_patterns, merge_options)
+            if merged is None:
+                steps.append(("error", error))
+            else:
+                current = merged
+                steps.append(("merge", None))
+
+    return current, steps, os.getpid(), time.perf_counter() - start
+
+
+def in_place_codec(filename: str, merge_patterns, merge_options: Optional[dict] = None) -> Optional[FormatCodec]:
+    """配置先のファイル上で直接マージできる場合はそのコーデックを返す"""
+    file_format = get_file_format(filename, merge_patterns)
+    codec = CODECS.get(file_format) if file_format is not None else None
+    if codec is None or not codec.available or not codec.can_merge_in_place(merge_options):
+        return None
+    return codec
+
+
+def run_merge_in_place(dest_path: Path, contents: List[bytes], merge_patterns,
+                       merge_options: Optional[dict] = None) -> Tuple[bool, List[Tuple[str, Optional[str]]], float]:
+    """
+    既存の配置先に対するマージの連鎖をファイル上で実行（メインプロセスで実行される）
+
+    run_merge_chain と異なり既存の内容をメモリに読み込まないため、大きな配置先に使用します。
+    in_place_codec がコーデックを返すファイルのみが対象です。
+
+    Returns:
+        (配置先を変更したかどうか, 各ステップの(アクション, エラー), 処理時間) のタプル
+    """
+    start = time.perf_counter()
+    codec = in_place_codec(dest_path.name, merge_patterns, merge_options)
+    try:
+        with trace_span(dest_path.name, "job", steps=len(contents), in_place=True):
+            changed = codec.merge_in_place(dest_path, contents, merge_options)
+        steps = [("merge", None)] * len(contents)
+    except Exception as e:
+        changed = False
+        steps = [("error", f"{codec.label} マージエラー: {e}")] * len(contents)
+    return changed, steps, time.perf_counter() - start
+
+
+def run_merge_chain_traced(memory: bool, *job) -> Tuple[tuple, List[tuple]]:
+    """
+    ワーカープロセスで区間を記録しながら run_merge_chain を実行し、(戻り値, 記録した区間) を返す
+
+    memory=True の場合はワーカー内でもメモリ使用量を計測します（ジョブごとに計測し直す）。
+    """
+    global _tracer
+    tracer = _tracer = Tracer(MemoryProfiler() if memory else None)
     try:
-        # 既存ファイルを読み込み
-        with existing_file.open('r', encoding='utf-8') as f:
-            existing_lines = f.readlines()
+        return run_merge_chain(*job), tracer.events
+    finally:
+        _tracer = None
+        if tracer.memory is not None:
+            tracer.memory.stop()
+
+
+class MergeExecutor:
+    """
+    マージジョブの実行器
+
+    ジョブ数またはデータサイズが閾値を超えた場合のみプロセスプールに分散し、
+    小さなジョブはプールの起動コストを避けるためインラインで実行します。
+    ワーカーとはバイト列のみを受け渡しします。
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_jobs: int = 8, min_bytes: int = 1024 * 1024,
+                 cache: Optional[MergeCache] = None):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.min_jobs = min_jobs
+        self.min_bytes = min_bytes
+        # キャッシュの検索・保存はメインプロセスでのみ行う
+        self.cache = cache
+        self.used_pool = False
+        self.wall_time = 0.0
+        # ワーカーごとの (ジョブ数, 稼働時間)
+        self.worker_stats: Dict[int, List[float]] = {}
+
+    def should_use_pool(self, jobs: List[tuple]) -> bool:
+        """プロセスプールを使用するかどうかを判定"""
+        if self.workers <= 1 or len(jobs) <= 1:
+            return False
+        total_bytes = sum(len(job[1] or b'') + sum(len(c) for c in job[2]) for job in jobs)
+        return len(jobs) >= self.min_jobs or total_bytes >= self.min_bytes
+
+    def run(self, jobs: List[tuple]) -> List[tuple]:
+        """
+        マージジョブを実行
+
+        Args:
+            jobs: run_merge_chain の引数タプルのリスト
+
+        Returns:
+            各ジョブの run_merge_chain の戻り値（ジョブと同じ順序）
+        """
+        start = time.perf_counter()
+        results: List[Optional[tuple]] = [None] * len(jobs)
+        keys: Dict[int, str] = {}
+
+        if self.cache is not None:
+            for index, job in enumerate(jobs):
+                key = self._cache_key(job)
+                if key is None:
+                    continue
+                cached = self.cache.get(key)
+                if cached is None:
+                    keys[index] = key
+                else:
+                    results[index] = (cached, self._cached_steps(job), os.getpid(), 0.0)
+
+        pending = [index for index, result in enumerate(results) if result is None]
+        pending_jobs = [jobs[index] for index in pending]
+        executed = None
+
+        if self.should_use_pool(pending_jobs):
+            executed = self._run_pool(pending_jobs)
+
+        if executed is None:
+            executed = [run_merge_chain(*job) for job in pending_jobs]
+
+        self.wall_time = time.perf_counter() - start
+        for index, result in zip(pending, executed):
+            results[index] = result
+            merged, steps, pid, elapsed = result
+            stats = self.worker_stats.setdefault(pid, [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+
+            # エラーを含む結果はキャッシュしない
+            if index in keys and all(action != "error" for action, _ in steps):
+                self.cache.put(keys[index], merged, elapsed)
+
+        return results
+
+    @staticmethod
+    def _cache_key(job: tuple) -> Optional[str]:
+        """ジョブのキャッシュキー（フォーマットが判定できない場合はNone）"""
+        filename, existing, contents, merge_patterns = job[:4]
+        merge_options = job[4] if len(job) > 4 else None
+        file_format = get_file_format(filename, merge_patterns)
+        if file_format is None:
+            return None
+        return MergeCache.make_key(file_format, existing, contents, merge_options)
+
+    @staticmethod
+    def _cached_steps(job: tuple) -> List[Tuple[str, Optional[str]]]:
+        """キャッシュヒット時の各ステップ（エラーなしの結果のみキャッシュされる）"""
+        existing, contents = job[1], job[2]
+        return [("create" if existing is None and position == 0 else "merge", None)
+                for position in range(len(contents))]
+
+    def _run_pool(self, jobs: List[tuple]) -> Optional[List[tuple]]:
+        """プロセスプールでジョブを実行（失敗時はNoneを返しインライン実行へフォールバック）"""
+        from concurrent.futures import ProcessPoolExecutor
+
+        tracer = _tracer
+        try:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+                if tracer is None:
+                    futures = [pool.submit(run_merge_chain, *job) for job in jobs]
+                    results = [future.result() for future in futures]
+                else:
+                    # ワーカーで記録した区間を統合する
+                    memory = tracer.memory is not None
+                    futures = [pool.submit(run_merge_chain_traced, memory, *job) for job in jobs]
+                    results = []
+                    for future in futures:
+                        result, events = future.result()
+                        results.append(result)
+                        tracer.events.extend(events)
+        except Exception as e:
+            print_warning(f"並列マージを利用できないため逐次実行します: {e}")
+            return None
 
-        # 新規ファイルを読み込み
-        with new_file.open('r', encoding='utf-8') as f:
-            new_lines = f.readlines()
+        self.used_pool = True
+        return results
 
-        # 既存の行をセットに保存（重複チェック用、改行を除いて比較）
-        existing_set = {line.rstrip('\n\r') for line in existing_lines}
+    def report(self) -> None:
+        """キャッシュのヒット率と、ワーカーごとの稼働率を表示（プールを使用した場合のみ）"""
+        if self.cache is not None:
+            self.cache.report()
 
-        # マージ結果（既存 + 重複しない新規）
-        merged_lines = list(existing_lines)
+        if not self.used_pool:
+            return
 
-        # 新規行を追加（既存にない行のみ）
-        for line in new_lines:
-            line_stripped = line.rstrip('\n\r')
-            if line_stripped not in existing_set:
-                merged_lines.append(line)
-                existing_set.add(line_stripped)
+        print(f"  - 並列マージ: {len(self.worker_stats)} ワーカー")
+        for pid, (count, busy) in sorted(self.worker_stats.items()):
+            utilization = busy / self.wall_time * 100 if self.wall_time > 0 else 0.0
+            print(f"    ワーカー {pid}: {int(count)} ジョブ, 稼働率 {utilization:.0f}%")
 
-        # 出力ファイルに書き込み
-        with output_file.open('w', encoding='utf-8') as f:
-            f.writelines(merged_lines)
 
-        return True
-    except Exception as e:
-        print_error(f"行ベース マージエラー: {e}")
-        return False
+# ============================================================================
+# 実行統計（OpenMetrics）
+# ============================================================================
 
+class RunMetrics:
+    """
+    実行統計の集計と OpenMetrics 形式での出力
 
-def get_file_format(filename: str, merge_patterns: Dict[str, List[str]]) -> Optional[str]:
-    """ファイル名からフォーマットを判定"""
-    from fnmatch import fnmatch
-    for format_name, patterns in merge_patterns.items():
-        if any(fnmatch(filename, pattern) for pattern in patterns):
-            return format_name
-    return None
+    テンプレートごとのファイル数・転送量・処理結果のカウンターと、フェーズごとの
+    所要時間のヒストグラムを集計します。node_exporter の textfile collector で
+    収集できるよう、ファイルは一時ファイルに書き出してから置き換えます。
+    """
 
+    PREFIX = "vscode_template"
+    # ヒストグラムの上限（秒）
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    # カウンター名 -> 説明（テンプレートごと）
+    COUNTERS = {
+        "files_discovered": "探索で見つかったファイル数",
+        "files_fetched": "取得したファイル数",
+        "transferred_bytes": "取得・転送したバイト数",
+        "files_created": "新規作成したファイル数",
+        "merges": "マージしたファイル数",
+        "overwrites": "上書きしたファイル数",
+        "skipped": "マージ結果が既存の内容と同じため書き込まなかったファイル数",
+        "failures": "取得またはマージに失敗したファイル数",
+    }
+
+    def __init__(self):
+        # (カウンター名, テンプレート) -> 値
+        self.counters: Dict[Tuple[str, str], int] = {}
+        # (フェーズ, テンプレート) -> [バケットごとの件数, 合計秒, 件数]
+        self.histograms: Dict[Tuple[str, str], list] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.success: Optional[bool] = None
+
+    def count(self, name: str, template: str, value: int = 1) -> None:
+        key = (name, template)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, phase: str, template: str, seconds: float) -> None:
+        """フェーズの所要時間を記録"""
+        entry = self.histograms.get((phase, template))
+        if entry is None:
+            entry = self.histograms[(phase, template)] = [[0] * len(self.BUCKETS), 0.0, 0]
+        for index, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                entry[0][index] += 1
+        entry[1] += seconds
+        entry[2] += 1
+
+    @staticmethod
+    def _labels(**labels: str) -> str:
+        """ラベル（値の \\, ", 改行はエスケープ）"""
+        if not labels:
+            return ""
+        pairs = []
+        for name, value in labels.items():
+            value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            pairs.append(f'{name}="{value}"')
+        return "{" + ",".join(pairs) + "}"
+
+    def to_openmetrics(self) -> str:
+        """OpenMetrics テキスト形式"""
+        prefix = self.PREFIX
+        lines = []
+        templates = sorted({template for _, template in self.counters})
+        for name, help_text in self.COUNTERS.items():
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            if name.endswith("_bytes"):
+                lines.append(f"# UNIT {prefix}_{name} bytes")
+            for template in templates:
+                value = self.counters.get((name, template), 0)
+                lines.append(f"{prefix}_{name}_total{self._labels(template=template)} {value}")
+
+        lines.append(f"# TYPE {prefix}_merge_cache_hits counter")
+        lines.append(f"# HELP {prefix}_merge_cache_hits マージ結果キャッシュのヒット数")
+        lines.append(f"{prefix}_merge_cache_hits_total {self.cache_hits}")
+        lines.append(f"# TYPE {prefix}_merge_cache_misses counter")
+        lines.append(f"# HELP {prefix}_merge_cache_misses マージ結果キャッシュのミス数")
+        lines.append(f"{prefix}_merge_cache_misses_total {self.cache_misses}")
+
+        lines.append(f"# TYPE {prefix}_phase_duration_seconds histogram")
+        lines.append(f"# HELP {prefix}_phase_duration_seconds フェーズごとの所要時間")
+        lines.append(f"# UNIT {prefix}_phase_duration_seconds seconds")
+        for (phase, template), (buckets, total, count) in sorted(self.histograms.items()):
+            for bound, bucket_count in zip(self.BUCKETS, buckets):
+                labels = self._labels(phase=phase, template=template, le=repr(bound))
+                lines.append(f"{prefix}_phase_duration_seconds_bucket{labels} {bucket_count}")
+            labels = self._labels(phase=phase, template=template, le="+Inf")
+            lines.append(f"{prefix}_phase_duration_seconds_bucket{labels} {count}")
+            labels = self._labels(phase=phase, template=template)
+            lines.append(f"{prefix}_phase_duration_seconds_sum{labels} {total:.6f}")
+            lines.append(f"{prefix}_phase_duration_seconds_count{labels} {count}")
+
+        if self.success is not None:
+            lines.append(f"# TYPE {prefix}_last_run_success gauge")
+            lines.append(f"# HELP {prefix}_last_run_success 最後の実行が成功した場合1")
+            lines.append(f"{prefix}_last_run_success {int(self.success)}")
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"# HELP {prefix}_last_run_timestamp_seconds 最後の実行の終了時刻（UNIX時刻）")
+        lines.append(f"# UNIT {prefix}_last_run_timestamp_seconds seconds")
+        lines.append(f"{prefix}_last_run_timestamp_seconds {time.time():.3f}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> None:
+        """ファイルに書き出す（textfile collector が書き込み途中の内容を読まないよう置き換える）"""
+        with atomic_write(path) as output:
+            output.write(self.to_openmetrics().encode("utf-8"))
 
-def merge_structured_file(existing_file: Path, new_file: Path, output_file: Path, merge_patterns: Dict[str, List[str]]) -> bool:
-    """構造化ファイルをフォーマットに応じてマージ"""
-    file_format = get_file_format(existing_file.name, merge_patterns)
 
-    if file_format is None:
-        print_error(f"未対応のファイル: {existing_file.name}")
-        return False
+# ============================================================================
+# テンプレートインデックス（index）
+# ============================================================================
 
-    # フォーマットに応じたマージ関数を呼び出し
-    if file_format == 'json':
-        return merge_json_files(existing_file, new_file, output_file)
-    elif file_format == 'yaml':
-        return merge_yaml_files(existing_file, new_file, output_file)
-    elif file_format == 'toml':
-        return merge_toml_files(existing_file, new_file, output_file)
-    elif file_format == 'xml':
-        return merge_xml_files(existing_file, new_file, output_file)
-    elif file_format == 'line_based':
-        return merge_line_based_files(existing_file, new_file, output_file)
-    else:
-        print_error(f"未対応のフォーマット: {file_format}")
-        return False
+# リポジトリのルートに置くインデックスのファイル名
+TEMPLATE_INDEX_NAME = "template-index.json"
+TEMPLATE_INDEX_VERSION = 1
+
+
+class TemplateIndex:
+    """
+    テンプレートインデックス（全ファイルのパス・サイズ・SHA-256・所属するテンプレートとサブフォルダ）
+
+    一覧を取得するAPIがない静的なホスト（raw.githubusercontent.com、HTTPミラーなど）でも、
+    インデックスを1回取得すればファイル名を試行せずに探索できます。
+    """
+
+    def __init__(self, files: List[dict]):
+        # テンプレート内のパス -> (サイズ, SHA-256)
+        self._entries: Dict[str, Tuple[int, str]] = {entry["path"]: (entry["size"], entry["sha256"])
+                                                      for entry in files}
+        self._paths = sorted(self._entries)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Optional["TemplateIndex"]:
+        """インデックスを読み込む（形式・バージョンが不正な場合はNone）"""
+        try:
+            manifest = json.loads(data)
+            if manifest.get("version") != TEMPLATE_INDEX_VERSION:
+                return None
+            return cls(manifest["files"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def get(self, path: str) -> Optional[Tuple[int, str]]:
+        """ファイルの (サイズ, SHA-256)（インデックスにない場合はNone）"""
+        return self._entries.get(path)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._entries
+
+    def list_dir(self, base_path: str) -> List[str]:
+        """base_path 以下の全ファイル（base_path からの相対パス、ソート済み）"""
+        from bisect import bisect_left
+
+        prefix = f"{base_path.rstrip('/')}/"
+        results = []
+        for path in self._paths[bisect_left(self._paths, prefix):]:
+            if not path.startswith(prefix):
+                break
+            results.append(path[len(prefix):])
+        return results
+
+
+def sha256_file(path: Path) -> str:
+    """ファイルの SHA-256（16進数）"""
+    import hashlib
+
+    with path.open('rb') as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build_template_index(root: Path, template_dir: str, subfolders: Set[str]) -> dict:
+    """
+    テンプレートディレクトリを走査してインデックスを作成
+
+    パスの先頭から最初にサブフォルダ名（フォルダマッピングのキー）と一致する要素までを
+    テンプレート名とします（例: templates/python/base/vscode/settings.json は
+    テンプレート python/base のサブフォルダ vscode）。一致しないファイルは所属なしとして記載します。
+    """
+    files = []
+    base = root / template_dir
+    for directory, dirnames, filenames in os.walk(base):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = Path(directory) / filename
+            parts = path.relative_to(base).parts
+            digest = sha256_file(path)
+            template = subfolder = None
+            for position in range(1, len(parts) - 1):
+                if parts[position] in subfolders:
+                    template, subfolder = "/".join(parts[:position]), parts[position]
+                    break
+            files.append({"path": path.relative_to(root).as_posix(), "size": path.stat().st_size,
+                          "sha256": digest, "template": template, "subfolder": subfolder})
+
+    files.sort(key=lambda entry: entry["path"])
+    return {"version": TEMPLATE_INDEX_VERSION, "template_dir": template_dir, "files": files}
+
+
+def index_main(argv: List[str]) -> None:
+    """index サブコマンド"""
+    parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} index",
+        description="テンプレートインデックスを作成（リモートのソースはファイル名を試行せずに探索できる）",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+使用例:
+  %(prog)s                         # このリポジトリの {TEMPLATE_INDEX_NAME} を更新
+  %(prog)s -l ~/mirror             # ミラーのルートに作成
+  %(prog)s --check                 # 最新でない場合は終了コード1（CI用）
+        """
+    )
+    parser.add_argument('-l', '--local', type=Path, default=Path(__file__).resolve().parent,
+                        help='テンプレートのルートディレクトリ (デフォルト: このスクリプトのディレクトリ)')
+    parser.add_argument('-d', '--template-dir', default='templates',
+                        help='テンプレートディレクトリ (デフォルト: templates)')
+    parser.add_argument('-o', '--output', type=Path,
+                        help=f'出力先 (デフォルト: ルートディレクトリの {TEMPLATE_INDEX_NAME})')
+    parser.add_argument('--check', action='store_true', help='書き込まずに、既存のインデックスが最新か確認')
+    args = parser.parse_args(argv)
+
+    if not (args.local / args.template_dir).is_dir():
+        print_error(f"テンプレートディレクトリが見つかりません: {args.local / args.template_dir}")
+        sys.exit(1)
+
+    output = args.output or args.local / TEMPLATE_INDEX_NAME
+    manifest = build_template_index(args.local, args.template_dir, Config().subfolders)
+    content = (json.dumps(manifest, indent=2, ensure_ascii=False) + "\n").encode('utf-8')
+    templates = len({entry["template"] for entry in manifest["files"] if entry["template"]})
+
+    if args.check:
+        if not output.is_file() or output.read_bytes() != content:
+            print_error(f"インデックスが最新ではありません: {output}（index サブコマンドで更新してください）")
+            sys.exit(1)
+        print_success(f"インデックスは最新です: {output}")
+        return
+
+    with atomic_write(output) as f:
+        f.write(content)
+    print_success(f"インデックスを作成しました: {output}（テンプレート {templates} 個、ファイル {len(manifest['files'])} 個）")
 
 
 # ============================================================================
@@ -698,79 +3405,312 @@ def merge_structured_file(existing_file: Path, new_file: Path, output_file: Path
 class TemplateSource:
     """テンプレートソース（GitHub または ローカル）"""
 
-    def __init__(self, config: Config, local_path: Optional[Path] = None, token: Optional[str] = None):
+    def __init__(self, config: Config, local_path: Optional[Path] = None, token: Optional[str] = None,
+                 stream_threshold: int = 1024 * 1024, chunk_size: int = 64 * 1024,
+                 github: Optional[dict] = None, name: str = "github",
+                 content_cache: Optional[ContentCache] = None):
+        import threading
+
         self.config = config
         self.local_path = local_path
         self.token = token
         self.is_local = local_path is not None
+        # レイヤー名（表示・イベント出力用）
+        self.name = name
+        # 取得元のURL（未指定の場合は設定の github セクションのリポジトリ）
+        self.base_url = None
+        if not self.is_local:
+            github = github or {"user": config.github_user, "repo": config.repo_name, "branch": config.branch,
+                                "raw_base_url": config.raw_base_url, "index": config.template_index}
+            raw_base_url = github.get("raw_base_url", "https://raw.githubusercontent.com").rstrip("/")
+            self.base_url = f"{raw_base_url}/{github['user']}/{github['repo']}/{github.get('branch', 'main')}"
+        # リモートのテンプレートインデックス（最初に必要になった時に一度だけ取得する）
+        self.index_path = github.get("index", TEMPLATE_INDEX_NAME) if not self.is_local else None
+        self._index: Optional[TemplateIndex] = None
+        self._index_loaded = False
+        self._index_lock = threading.Lock()
+        # インデックスのハッシュで検証する内容の永続キャッシュ（リモートのみ）
+        self.content_cache = content_cache
+        # このサイズ以上のファイルはメモリに読み込まずに転送する
+        self.stream_threshold = stream_threshold
+        self.chunk_size = chunk_size
+        # 配置方法ごとの件数（ローカルの reflink/hardlink 配置のみ。転送は並列に行われ得る）
+        self.placements: Dict[str, int] = {}
+        self._placements_lock = threading.Lock()
+        # ディレクトリ -> {名前: ディレクトリかどうか}（存在しない場合はNone）
+        self._listing_cache: Dict[Path, Optional[Dict[str, bool]]] = {}
+        # テンプレート内のパス -> 内容（リモートの stream_threshold 未満のファイル。探索時に取得した内容を
+        # 再利用し、レイヤーごとに独立して保持する）
+        self._contents: Dict[str, bytes] = {}
 
     def get_file_content(self, template_path: str) -> Optional[bytes]:
         """ファイル内容を取得"""
+        with trace_span(template_path, "fetch"):
+            if self.is_local and self.local_path:
+                file_path = self.local_path / template_path
+                if file_path.exists():
+                    return file_path.read_bytes()
+                return None
+
+            content = self._contents.get(template_path)
+            if content is not None:
+                return content
+
+            digest = None
+            index = self._load_index()
+            if index is not None:
+                entry = index.get(template_path)
+                if entry is None:
+                    # インデックスにないファイルは存在しない（取得を試行しない）
+                    return None
+                digest = entry[1]
+                if self.content_cache is not None:
+                    content = self.content_cache.get(digest)
+
+            if content is None:
+                content = self._download_from_github(template_path)
+                if content is None:
+                    return None
+                if digest is not None:
+                    self._cache_content(template_path, content, digest)
+            if len(content) < self.stream_threshold:
+                self._contents[template_path] = content
+            return content
+
+    def transfer_file(self, template_path: str, dest_path: Path, link_mode: str = "copy") -> bool:
+        """
+        ファイルを取得して dest_path に配置（マージしないファイル用）
+
+        stream_threshold 以上のファイルはメモリに読み込まずに転送します。
+        ローカルは copy_file_range/sendfile によるカーネル内コピー、リモートは受信した
+        チャンクを順次書き出します。配置先は常に置き換えるため、ハードリンクで共有された
+        ファイルを書き換えることはありません。
+
+        Args:
+            template_path: テンプレート内のパス
+            dest_path: 配置先
+            link_mode: ローカルのファイルの配置方法（"copy", "reflink", "hardlink"）
+
+        Returns:
+            配置できた場合True（ファイルが存在しない・取得に失敗した場合False）
+        """
+        with trace_span(template_path, "fetch", link_mode=link_mode):
+            return self._transfer_file(template_path, dest_path, link_mode)
+
+    def _transfer_file(self, template_path: str, dest_path: Path, link_mode: str) -> bool:
         if self.is_local and self.local_path:
             file_path = self.local_path / template_path
-            if file_path.exists():
-                return file_path.read_bytes()
-            return None
-        else:
-            return self._download_from_github(template_path)
+            if not file_path.exists():
+                return False
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            if link_mode != "copy":
+                method = place_file(file_path, dest_path, link_mode)
+                with self._placements_lock:
+                    self.placements[method] = self.placements.get(method, 0) + 1
+            elif file_path.stat().st_size >= self.stream_threshold:
+                copy_file(file_path, dest_path)
+            else:
+                with atomic_write(dest_path) as output:
+                    output.write(file_path.read_bytes())
+            return True
+
+        import hashlib
+        import http.client
+
+        content = self._contents.get(template_path)
+        if content is not None:
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_write(dest_path) as output:
+                output.write(content)
+            return True
+
+        digest = None
+        index = self._load_index()
+        if index is not None:
+            entry = index.get(template_path)
+            if entry is None:
+                return False
+            digest = entry[1]
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            if self.content_cache is not None and self.content_cache.copy_to(digest, dest_path):
+                return True
+
+        response = self._open_github(template_path)
+        if response is None:
+            return False
+
+        with response:
+            length = response.headers.get("Content-Length")
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                with atomic_write(dest_path) as output:
+                    if length is not None and int(length) < self.stream_threshold:
+                        content = response.read()
+                        output.write(content)
+                    else:
+                        # サイズが大きい・不明な場合は受信しながら書き出す（失敗時は既存ファイルを残す）
+                        hasher = hashlib.sha256()
+                        while True:
+                            chunk = response.read(self.chunk_size)
+                            if not chunk:
+                                break
+                            output.write(chunk)
+                            hasher.update(chunk)
+            except (OSError, http.client.HTTPException) as e:
+                print_error(f"転送エラー: {template_path}: {e}")
+                return False
+
+        if digest is not None:
+            if content is not None:
+                self._cache_content(template_path, content, digest)
+            elif self._check_digest(template_path, hasher.hexdigest(), digest) and self.content_cache is not None:
+                self.content_cache.put_file(digest, dest_path)
+        return True
+
+    def _check_digest(self, template_path: str, actual: str, digest: str) -> bool:
+        """取得した内容のハッシュがインデックスと一致するか（一致しない場合は警告）"""
+        if actual == digest:
+            return True
+        print_warning(f"内容がテンプレートインデックスと一致しません: {template_path}"
+                      f"（インデックスを更新してください）")
+        return False
 
-    def _download_from_github(self, template_path: str) -> Optional[bytes]:
+    def _cache_content(self, template_path: str, content: bytes, digest: str) -> None:
+        """インデックスのハッシュと一致する内容を永続キャッシュに保存"""
+        import hashlib
+
+        if self._check_digest(template_path, hashlib.sha256(content).hexdigest(), digest) \
+                and self.content_cache is not None:
+            self.content_cache.put(digest, content)
+
+    def _load_index(self) -> Optional[TemplateIndex]:
+        """リモートのテンプレートインデックス（存在しない・使用しない場合はNone）"""
+        if not self._index_loaded:
+            # 並列の探索・取得から同時に呼ばれても取得は1回
+            with self._index_lock:
+                if not self._index_loaded:
+                    self._index = self._fetch_index()
+                    self._index_loaded = True
+        return self._index
+
+    def _fetch_index(self) -> Optional[TemplateIndex]:
+        if not self.index_path:
+            return None
+        with trace_span(self.index_path, "fetch"):
+            data = self._download_from_github(self.index_path)
+        if data is None:
+            return None
+        index = TemplateIndex.from_bytes(data)
+        if index is None:
+            print_warning(f"テンプレートインデックスの形式が不正です: {self.base_url}/{self.index_path}"
+                          f"（ファイル名を試行して探索します）")
+        return index
+
+    def index_digest(self, template_path: str) -> Optional[str]:
+        """インデックスに記載された SHA-256（リモートでインデックスがない場合はNone）"""
+        index = None if self.is_local else self._load_index()
+        entry = index.get(template_path) if index is not None else None
+        return entry[1] if entry is not None else None
+
+    def _download_from_github(self, template_path: str, report_errors: bool = True) -> Optional[bytes]:
         """GitHubからファイルをダウンロード"""
-        url = f"https://raw.githubusercontent.com/{self.config.github_user}/{self.config.repo_name}/{self.config.branch}/{template_path}"
+        response = self._open_github(template_path, report_errors)
+        if response is None:
+            return None
+        with response:
+            return response.read()
+
+    def _open_github(self, template_path: str, report_errors: bool = True):
+        """GitHubのファイルを開く（存在しない・エラーの場合はNone、report_errors がFalseの場合は表示しない）"""
+        # ネットワーク関連のモジュールはリモートから取得する場合のみ読み込む
+        from urllib import request
+        from urllib.error import HTTPError, URLError
+
+        url = f"{self.base_url}/{template_path}"
 
         req = request.Request(url)
         if self.token:
             req.add_header("Authorization", f"token {self.token}")
 
         try:
-            with request.urlopen(req) as response:
-                return response.read()
+            return request.urlopen(req)
         except HTTPError as e:
-            if e.code == 404:
-                return None
-            print_error(f"HTTP エラー {e.code}: {url}")
+            if e.code != 404 and report_errors:
+                print_error(f"HTTP エラー {e.code}: {url}")
             return None
         except URLError as e:
-            print_error(f"URL エラー: {e.reason}")
+            if report_errors:
+                print_error(f"URL エラー: {e.reason}")
             return None
 
-    def list_template_files(self, template_dir: str, template_name: str, subfolder: str) -> List[str]:
-        """テンプレート内のファイルをリスト"""
+    def list_template_files(self, template_dir: str, template_name: str, subfolder: str,
+                            include=None) -> List[str]:
+        """
+        テンプレート内のファイルをリスト
+
+        Args:
+            include: 追加の絞り込み (サブフォルダからの相対パス, ディレクトリかどうか) -> bool。
+                     対象外のディレクトリは探索せず、対象外のファイルは取得を試行しない
+        """
         base_path = f"{template_dir}/{template_name}/{subfolder}"
 
-        if self.is_local:
-            return self._list_local_files(base_path, template_name)
-        else:
-            # GitHubの場合、実際にファイルを探索するのは困難なため
-            # 既知のパターンを試行する簡易実装
-            # より堅牢な実装はGitHub APIを使用する必要がある
-            return self._list_github_files_simple(base_path, template_name)
+        with trace_span(f"{template_name}/{subfolder}", "discovery"):
+            return self._list_files(base_path, template_dir, template_name, include)
 
-    def _list_local_files(self, base_path: str, template_name: str) -> List[str]:
+    def _list_files(self, base_path: str, template_dir: str, template_name: str, include) -> List[str]:
+        if self.is_local:
+            # テンプレートのルートを一度だけ読み、存在しないサブフォルダの探索を省略する
+            self._list_dir(self.local_path / template_dir / template_name)
+            return self._list_local_files(base_path, template_name, include)
+        index = self._load_index()
+        if index is not None:
+            return self._list_indexed_files(index, base_path, template_name, include)
+        # インデックスがない場合は既知のパターンを試行する簡易実装
+        return self._list_github_files_simple(base_path, template_name, include)
+
+    def _list_indexed_files(self, index: TemplateIndex, base_path: str, template_name: str,
+                            include=None) -> List[str]:
+        """インデックスからファイルをリスト（ローカルと同じくグロブとパスのパターンを適用）"""
+        file_patterns = self.config.get_template_file_matcher(template_name)
+        return [rel for rel in index.list_dir(base_path)
+                if rel in file_patterns and (include is None or include(rel, False))]
+
+    def _list_local_files(self, base_path: str, template_name: str, include=None) -> List[str]:
         """ローカルファイルをリスト（パターンマッチング適用）"""
         if not self.local_path:
             return []
 
-        full_path = self.local_path / base_path
-        if not full_path.exists():
-            return []
-
-        # パターンマッチングを取得
-        file_patterns = self.config.get_template_file_match_patterns(template_name)
-
-        files = []
-        for item in full_path.rglob('*'):
-            if item.is_file():
-                rel_path = item.relative_to(full_path)
-                file_name = rel_path.name
+        # パターンに一致し得るディレクトリのみ探索
+        file_patterns = self.config.get_template_file_matcher(template_name)
+        return file_patterns.walk(self.local_path / base_path, self._list_dir, include)
 
-                # パターンに一致するファイルのみ追加
-                if file_name in file_patterns:
-                    files.append(str(rel_path))
+    def _list_dir(self, path: Path) -> Optional[Dict[str, bool]]:
+        """ディレクトリの内容を取得（キャッシュあり、シンボリックリンクのディレクトリはたどらない）"""
+        if path in self._listing_cache:
+            return self._listing_cache[path]
 
-        return files
+        # 親ディレクトリが読み込み済みなら、存在しないディレクトリをシステムコールなしで判定
+        if path.parent in self._listing_cache:
+            parent_entries = self._listing_cache[path.parent]
+            if not parent_entries or not parent_entries.get(path.name):
+                self._listing_cache[path] = None
+                return None
 
-    def _list_github_files_simple(self, base_path: str, template_name: str) -> List[str]:
+        entries: Optional[Dict[str, bool]] = {}
+        try:
+            with os.scandir(path) as iterator:
+                for entry in iterator:
+                    if entry.is_dir(follow_symlinks=False):
+                        entries[entry.name] = True
+                    elif entry.is_file():
+                        entries[entry.name] = False
+        except (FileNotFoundError, NotADirectoryError):
+            entries = None
+
+        self._listing_cache[path] = entries
+        return entries
+
+    def _list_github_files_simple(self, base_path: str, template_name: str, include=None) -> List[str]:
         """GitHubファイルを簡易リスト（テンプレート固有またはグローバル設定のパターンを試行）"""
         # 注: これは簡易実装。実際のGitHub API実装が必要
         # テンプレート固有のパターン、なければグローバル設定を使用
@@ -778,6 +3718,12 @@ class TemplateSource:
 
         found_files = []
         for pattern in file_patterns:
+            # ワイルドカードを含むパターンは試行できないため対象外
+            if _GLOB_WILDCARD.search(pattern):
+                continue
+            pattern = pattern.lstrip("/")
+            if include is not None and not include(pattern, False):
+                continue
             test_path = f"{base_path}/{pattern}"
             if self.get_file_content(test_path):
                 found_files.append(pattern)
@@ -785,6 +3731,141 @@ class TemplateSource:
         return found_files
 
 
+# ============================================================================
+# 先読み（prefetch）
+# ============================================================================
+
+class UsageStats:
+    """
+    テンプレートの組み合わせの利用履歴（直近の実行ごとの適用テンプレート）
+
+    P(b | a) = a と b を同時に適用した実行数 / a を適用した実行数 として、
+    次に適用されやすいテンプレートを予測します。古い実行は HISTORY 件を超えると削除します。
+    """
+
+    VERSION = 1
+    HISTORY = 200
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.runs: List[List[str]] = []
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+            if data.get("version") == self.VERSION:
+                self.runs = data.get("runs", [])
+        except (OSError, ValueError):
+            pass
+
+    def predict(self, template_types: List[str], min_probability: float = 0.3, limit: int = 3) -> List[str]:
+        """
+        template_types と同時に適用されやすいテンプレート（確率の高い順）
+
+        Args:
+            template_types: 今回適用するテンプレート
+            min_probability: いずれかのテンプレートとの条件付き確率がこれ以上のもののみ
+            limit: 最大件数
+        """
+        current = set(template_types)
+        scores: Dict[str, float] = {}
+        for name in current:
+            runs = [run for run in self.runs if name in run]
+            for other in {other for run in runs for other in run} - current:
+                probability = sum(1 for run in runs if other in run) / len(runs)
+                scores[other] = max(scores.get(other, 0.0), probability)
+        ranked = sorted((name for name, score in scores.items() if score >= min_probability),
+                        key=lambda name: (-scores[name], name))
+        return ranked[:limit]
+
+    def record(self, template_types: List[str]) -> None:
+        """実行を記録して保存（保存できない場合は何もしない）"""
+        self.runs = (self.runs + [sorted(set(template_types))])[-self.HISTORY:]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_write(self.path) as output:
+                output.write(json.dumps({"version": self.VERSION, "runs": self.runs}).encode('utf-8'))
+        except OSError:
+            pass
+
+
+class Prefetcher:
+    """
+    次に適用されやすいテンプレートの先読み
+
+    今回の探索・取得と並行してバックグラウンドのスレッドで、予測したテンプレートのファイルを
+    取得キャッシュ（ContentCache）に保存します。確率の高いテンプレートから順に、インデックスの
+    サイズで合計の上限（バイト数）に収まるファイルのみを取得し、複数の候補に上限を分散します。
+    今回の取得と帯域を奪い合わないよう、取得の速度は rate_bytes（バイト/秒）以下に抑えます。
+    キャッシュの検証にハッシュが必要なため、インデックスのあるリモートのソースのみが対象です。
+    スレッドはデーモンのため、完了を待たずに終了した場合は取得途中のまま破棄されます。
+    """
+
+    def __init__(self, sources: List[TemplateSource], config: Config, template_dir: str,
+                 templates: List[str], cache: ContentCache, budget_bytes: int,
+                 rate_bytes: Optional[int] = None):
+        import threading
+
+        self.sources = [source for source in sources if not source.is_local]
+        self.config = config
+        self.template_dir = template_dir
+        self.templates = templates
+        self.cache = cache
+        self.budget_bytes = budget_bytes
+        # 取得の速度の上限（バイト/秒、Noneの場合は制限なし）
+        self.rate_bytes = rate_bytes
+        self.fetched = 0
+        self.fetched_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+
+    def start(self) -> "Prefetcher":
+        self._thread.start()
+        return self
+
+    def finish(self, timeout: float) -> None:
+        """完了を最大 timeout 秒待ち、未完了の場合は以降の取得を中止する"""
+        self._thread.join(timeout)
+        self._stop.set()
+
+    def _candidates(self, source: TemplateSource, index: TemplateIndex, template_name: str):
+        """テンプレートのファイルのうちキャッシュにないもの (パス, サイズ, SHA-256)"""
+        for subfolder, _ in self.config.plan(template_name).folder_mapping:
+            base_path = f"{self.template_dir}/{template_name}/{subfolder}"
+            for rel in source._list_indexed_files(index, base_path, template_name):
+                path = f"{base_path}/{rel}"
+                size, digest = index.get(path)
+                if digest not in self.cache:
+                    yield path, size, digest
+
+    def _throttle(self, start: float) -> None:
+        """開始からの平均の取得速度が上限を超えないよう待機（中止された場合はすぐに戻る）"""
+        if not self.rate_bytes:
+            return
+        delay = self.fetched_bytes / self.rate_bytes - (time.perf_counter() - start)
+        if delay > 0:
+            self._stop.wait(delay)
+
+    def _run(self) -> None:
+        start = time.perf_counter()
+        for template_name in self.templates:
+            for source in self.sources:
+                index = source._load_index()
+                if index is None:
+                    continue
+                for path, size, digest in list(self._candidates(source, index, template_name)):
+                    if self._stop.is_set():
+                        return
+                    if size >= source.stream_threshold or self.fetched_bytes + size > self.budget_bytes:
+                        continue
+                    with trace_span(path, "prefetch"):
+                        content = source._download_from_github(path, report_errors=False)
+                    if content is None:
+                        continue
+                    self.fetched += 1
+                    self.fetched_bytes += len(content)
+                    source._cache_content(path, content, digest)
+                    self._throttle(start)
+
+
 # ============================================================================
 # メイン処理
 # ============================================================================
@@ -796,113 +3877,790 @@ class TemplateSetup:
                  config: Optional[Config] = None,
                  template_dir: str = "templates",
                  local_path: Optional[Path] = None,
-                 merge_patterns: Optional[Dict[str, List[str]]] = None):
+                 merge_patterns: Optional[Dict[str, List[str]]] = None,
+                 workers: Optional[int] = None,
+                 use_cache: bool = True,
+                 link_mode: Optional[str] = None,
+                 only: Optional[List[str]] = None,
+                 exclude: Optional[List[str]] = None,
+                 metrics: Optional[RunMetrics] = None):
         self.template_types = template_types
         self.template_dir = template_dir
         self.config = config or Config()
         self.merge_patterns = merge_patterns or self.config.merge_patterns
+        self.merge_matcher = (self.config.merge_matcher if merge_patterns is None
+                              else PatternMatcher.from_groups(merge_patterns))
+        self.merge_options = self.config.merge_options
         self.project_dir = Path.cwd()
-
-        # テンプレートソース
-        token = load_github_token()
-        self.source = TemplateSource(config=self.config, local_path=local_path, token=token)
+        # 適用対象の絞り込み（--only / --exclude）
+        self.file_filter = FileFilter(only, exclude)
+        # 実行統計（--metrics を指定した場合のみ集計）
+        self.metrics = metrics
+
+        # リモートから取得した内容の永続キャッシュ（テンプレートインデックスのハッシュで検証する）
+        self.content_cache = None
+        fetch_cache = self.config.fetch_cache
+        if use_cache and fetch_cache.get("enabled", True):
+            configured_dir = fetch_cache.get("directory")
+            self.content_cache = ContentCache(Path(configured_dir).expanduser() if configured_dir
+                                              else default_cache_dir() / "content")
+
+        # テンプレートソース（優先度の低い順のレイヤー。-l を指定した場合はそのディレクトリのみ）
+        transfer = self.config.transfer
+        layers = [{"name": "local", "local": local_path}] if local_path is not None else self.config.sources
+        self.sources = [self._open_source(layer, transfer) for layer in layers]
+        # 探索・取得を並列に行うスレッド数（複数のレイヤー、またはリモートのレイヤーがある場合）
+        self.fetch_workers = transfer.get("fetch_workers", 8)
+        # このサイズ以上の既存ファイルへのマージは、対応するフォーマットなら配置先のファイル上で直接行う
+        self.in_place_threshold = transfer.get("stream_threshold", 1024 * 1024)
+        # ローカルのテンプレートのマージしないファイルの配置方法（設定 < コマンドライン引数）
+        self.link_mode = link_mode or transfer.get("link_mode", "copy")
+        if self.link_mode not in LINK_MODES:
+            print_error(f"未対応の link_mode: {self.link_mode}（copy を使用します）")
+            self.link_mode = "copy"
+
+        # マージ結果キャッシュ
+        cache = None
+        cache_config = self.config.merge_cache
+        if use_cache and cache_config.get("enabled", True):
+            directory = None
+            if cache_config.get("persistent", False):
+                configured_dir = cache_config.get("directory")
+                directory = Path(configured_dir).expanduser() if configured_dir else default_cache_dir() / "merge"
+            cache = MergeCache(max_entries=cache_config.get("max_entries", 1024), directory=directory)
+
+        # マージ実行器（設定 < コマンドライン引数）
+        parallel = self.config.parallel
+        self.executor = MergeExecutor(
+            workers=workers if workers is not None else parallel.get("workers"),
+            min_jobs=parallel.get("min_jobs", 8),
+            min_bytes=parallel.get("min_bytes", 1024 * 1024),
+            cache=cache,
+        )
 
         # 処理するファイルリスト
         self.files_to_process: List[Tuple[str, Path, str]] = []  # (template_path, dest_path, template_name)
+        # files_to_process と同じ順の、各ファイルの取得元のレイヤー
+        self.file_sources: List[TemplateSource] = []
+        # files_to_process のインデックス -> (取得したバイト数, 所要秒)（統計・イベント出力時のみ）
+        self._fetches: Dict[int, Tuple[int, float]] = {}
+
+    def _open_source(self, layer: dict, transfer: dict) -> TemplateSource:
+        """レイヤーの設定からテンプレートソースを作成"""
+        token = None
+        if "github" in layer:
+            # レイヤーごとに別のトークンを使用できる（未指定の場合は通常の読み込み順）
+            token = os.environ.get(layer["token_env"]) if layer.get("token_env") else load_github_token()
+        return TemplateSource(
+            config=self.config, local_path=layer.get("local"), token=token,
+            stream_threshold=transfer.get("stream_threshold", 1024 * 1024),
+            chunk_size=transfer.get("chunk_size", 64 * 1024),
+            github=layer.get("github"), name=layer["name"], content_cache=self.content_cache,
+        )
 
     def run(self) -> bool:
         """セットアップ実行"""
         print_info("プロジェクトテンプレート セットアップ")
         print(f"適用テンプレート: {', '.join(self.template_types)}")
         print(f"テンプレートディレクトリ: {self.template_dir}")
+        if len(self.sources) > 1:
+            print(f"テンプレートソース: {' < '.join(source.name for source in self.sources)}")
         print(f"対象ディレクトリ: {self.project_dir}")
         print()
 
-        # ファイルリストを収集
-        if not self._collect_files():
-            return False
-
-        print_success(f"合計 {len(self.files_to_process)} 個のファイルを検出")
-        print()
+        # 次に適用されやすいテンプレートの先読み（探索・取得と並行して行う）
+        usage, prefetcher = self._start_prefetch()
+        try:
+            # ファイルリストを収集
+            with self._phase("collect"):
+                collected = self._collect_files()
+            if not collected:
+                if self.file_filter:
+                    print_error("--only / --exclude に一致するファイルがありません")
+                return False
+
+            print_success(f"合計 {len(self.files_to_process)} 個のファイルを検出")
+            print()
 
-        # ファイルを処理
-        return self._process_files()
+            # ファイルを処理
+            success = self._process_files()
+        finally:
+            if prefetcher is not None:
+                # デフォルトでは待たずに中止する（取得途中のスレッドは終了時に破棄される）
+                prefetcher.finish(self.config.prefetch.get("wait_seconds", 0))
+                emit_event("prefetch", templates=prefetcher.templates, files=prefetcher.fetched,
+                           bytes=prefetcher.fetched_bytes)
+                if prefetcher.fetched:
+                    print(f"  - 先読み: {', '.join(prefetcher.templates)}"
+                          f"（{prefetcher.fetched} ファイル, {_format_size(prefetcher.fetched_bytes)}）")
+
+        if success and usage is not None:
+            usage.record(self.template_types)
+        return success
+
+    def _start_prefetch(self) -> Tuple[Optional[UsageStats], Optional[Prefetcher]]:
+        """利用履歴を読み込み、予測したテンプレートの先読みを開始"""
+        settings = self.config.prefetch
+        # キャッシュを使用しない実行（--no-cache など）は利用履歴も読み書きしない
+        if not settings.get("enabled", True) or self.content_cache is None:
+            return None, None
+        history = settings.get("history")
+        usage = UsageStats(Path(history).expanduser() if history else default_cache_dir() / "usage.json")
+
+        # 先読みはインデックスのあるリモートのソースが必要（メモリ計測中は行わない）
+        if all(source.is_local for source in self.sources) \
+                or (_tracer is not None and _tracer.memory is not None):
+            return usage, None
+        templates = usage.predict(self.template_types, settings.get("min_probability", 0.3),
+                                  settings.get("max_templates", 3))
+        if not templates:
+            return usage, None
+        rate_kbps = settings.get("rate_kbps", 256)
+        rate_bytes = int(rate_kbps * 1024) if rate_kbps else None
+        prefetcher = Prefetcher(self.sources, self.config, self.template_dir, templates, self.content_cache,
+                                int(settings.get("budget_kb", 512) * 1024), rate_bytes)
+        return usage, prefetcher.start()
 
     def _collect_files(self) -> bool:
-        """処理対象ファイルを収集"""
-        for template_name in self.template_types:
-            # Configから設定を取得（デフォルト + テンプレート固有）
-            folder_mapping = self.config.folder_mapping.copy()
-            folder_mapping.update(self.config.get_template_folder_mapping(template_name))
-
-            # フォルダベースのファイル
-            for subfolder, dest_dir in folder_mapping.items():
-                files = self.source.list_template_files(
-                    self.template_dir, template_name, subfolder
-                )
-
-                for file in files:
-                    template_path = f"{self.template_dir}/{template_name}/{subfolder}/{file}"
-                    dest_path = self.project_dir / dest_dir / file
-                    self.files_to_process.append((template_path, dest_path, template_name))
+        """
+        処理対象ファイルを収集
+
+        レイヤー × テンプレート × サブフォルダの探索は並列に行い、結果はレイヤー順（同じレイヤー内は
+        テンプレートの適用順）に並べます。後のレイヤーのファイルほど後に適用されます。
+        """
+        tasks = []  # (ソース, テンプレート名, サブフォルダ, 配置先ディレクトリ, 絞り込み)
+        for source in self.sources:
+            for template_name in self.template_types:
+                # 解決済みの実効設定（デフォルト + テンプレート固有）
+                plan = self.config.plan(template_name)
+
+                # フォルダベースのファイル
+                for subfolder, dest_dir in plan.folder_mapping:
+                    include = None
+                    if self.file_filter:
+                        # 対象となり得ないサブフォルダは探索しない
+                        if not self.file_filter.may_include_dir(subfolder, dest_dir):
+                            continue
+                        include = self.file_filter.for_folder(subfolder, dest_dir)
+                    tasks.append((source, template_name, subfolder, dest_dir, include))
+
+        def discover(task) -> Tuple[List[str], float]:
+            source, template_name, subfolder, _, include = task
+            start = time.perf_counter()
+            files = source.list_template_files(self.template_dir, template_name, subfolder, include)
+            return files, time.perf_counter() - start
+
+        discovered = dict.fromkeys(self.template_types, 0)
+        elapsed_times = dict.fromkeys(self.template_types, 0.0)
+        for (source, template_name, subfolder, dest_dir, _), (files, elapsed) in zip(tasks, self._map(discover, tasks)):
+            for file in files:
+                template_path = f"{self.template_dir}/{template_name}/{subfolder}/{file}"
+                dest_path = self.project_dir / dest_dir / file
+                self.files_to_process.append((template_path, dest_path, template_name))
+                self.file_sources.append(source)
+            discovered[template_name] += len(files)
+            elapsed_times[template_name] += elapsed
+
+        if self.metrics is not None:
+            for template_name in self.template_types:
+                self.metrics.count("files_discovered", template_name, discovered[template_name])
+                self.metrics.observe("collect", template_name, elapsed_times[template_name])
 
         return len(self.files_to_process) > 0
 
+    def _map(self, function, items: list) -> list:
+        """
+        items の各要素に function を適用した結果を順に返す
+
+        複数のレイヤー、またはリモートのレイヤーがある場合はスレッドで並列に実行します
+        （メモリ計測中はフェーズごとの計測を乱さないよう逐次実行）。
+        """
+        workers = min(self.fetch_workers, len(items))
+        concurrent = len(self.sources) > 1 or any(not source.is_local for source in self.sources)
+        if workers <= 1 or not concurrent or (_tracer is not None and _tracer.memory is not None):
+            return [function(item) for item in items]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(function, items))
+
     def _process_files(self) -> bool:
         """ファイルを処理（ダウンロード・マージ・配置）"""
         success_count = 0
         merge_count = 0
         overwrite_count = 0
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
+        # 配置先ごとに適用順でまとめる
+        targets: Dict[Path, List[Tuple[int, str]]] = {}
+        for index, (template_path, dest_path, template_name) in enumerate(self.files_to_process):
+            targets.setdefault(dest_path, []).append((index, template_path))
+
+        # マージが必要な配置先は内容を取得してジョブにまとめ、それ以外はそのまま転送する
+        outcomes: Dict[int, Tuple[str, Optional[str]]] = {}
+        final_contents: Dict[Path, bytes] = {}
+        jobs = []
+        job_targets = []
+        in_place_targets = []  # (配置先, 適用順の (インデックス, 内容))
+        with self._phase("transfer"):
+            merge_targets = []  # (配置先, 既存かどうか, 適用順の (インデックス, パス))
+            copy_targets = []   # (配置先, 既存かどうか, 適用順の (インデックス, パス), 配置方法)
+            for dest_path, entries in targets.items():
+                exists = dest_path.is_file()
+                if should_merge_file(dest_path.name, self.merge_matcher) and (exists or len(entries) > 1):
+                    merge_targets.append((dest_path, exists, entries))
+                    continue
 
-            for template_path, dest_path, template_name in self.files_to_process:
-                # ファイル内容を取得
-                content = self.source.get_file_content(template_path)
-                if content is None:
-                    print_error(f"取得失敗: {template_path}")
+                # ハードリンクはテンプレートとファイルを共有するため、後でマージされ得るファイルには使用しない
+                link_mode = self.link_mode
+                if link_mode == "hardlink" and should_merge_file(dest_path.name, self.merge_matcher):
+                    link_mode = "reflink"
+                copy_targets.append((dest_path, exists, entries, link_mode))
+
+            # マージする内容の取得（ファイルごと）と、それ以外の転送（配置先ごとに適用順）を並列に行う
+            tasks = [(dest_path, [entry], None) for dest_path, _, entries in merge_targets for entry in entries]
+            tasks += [(dest_path, entries, link_mode) for dest_path, _, entries, link_mode in copy_targets]
+            fetches = {}
+            for task_results in self._map(self._fetch_entries, tasks):
+                fetches.update(task_results)
+
+            for dest_path, exists, entries in merge_targets:
+                fetched = []
+                for index, template_path in entries:
+                    content, size, elapsed = fetches[index]
+                    if content is None:
+                        print_error(f"取得失敗: {template_path}")
+                        continue
+                    fetched.append((index, content))
+                    self._record_fetch(index, size, elapsed)
+
+                # 大きな既存ファイルは読み込まず、ジョブとは別に配置先のファイル上でマージする
+                if (exists and fetched and dest_path.stat().st_size >= self.in_place_threshold
+                        and in_place_codec(dest_path.name, self.merge_matcher, self.merge_options) is not None):
+                    in_place_targets.append((dest_path, fetched))
                     continue
 
-                # 一時ファイルに保存
-                temp_file = temp_path / dest_path.name
-                temp_file.write_bytes(content)
-
-                # 配置先ディレクトリを作成
-                dest_path.parent.mkdir(parents=True, exist_ok=True)
-
-                # マージまたはコピー
-                if dest_path.exists() and should_merge_file(dest_path.name, self.merge_patterns):
-                    # マージ
-                    merged_file = temp_path / f"{dest_path.name}.merged"
-                    if merge_structured_file(dest_path, temp_file, merged_file, self.merge_patterns):
-                        shutil.copy2(merged_file, dest_path)
-                        print(f"  [マージ] {dest_path.relative_to(self.project_dir)}")
-                        merge_count += 1
-                        success_count += 1
-                    else:
-                        print_error(f"マージ失敗: {dest_path}")
-                else:
-                    # コピー（上書き）
-                    shutil.copy2(temp_file, dest_path)
-                    action = "上書き" if dest_path.exists() else "作成"
-                    print(f"  [{action}] {dest_path.relative_to(self.project_dir)}")
-                    if dest_path.exists():
-                        overwrite_count += 1
-                    success_count += 1
+                existing = dest_path.read_bytes() if exists else None
+                if existing is not None or len(fetched) > 1:
+                    jobs.append((dest_path.name, existing, [content for _, content in fetched],
+                                 self.merge_matcher, self.merge_options))
+                    job_targets.append((dest_path, fetched))
+                elif fetched:
+                    index, content = fetched[0]
+                    final_contents[dest_path] = content
+                    outcomes[index] = ("create", None)
+
+            # 後のテンプレート（レイヤー）が前の内容を上書きする
+            for dest_path, exists, entries, _ in copy_targets:
+                for index, template_path in entries:
+                    transferred, size, elapsed = fetches[index]
+                    if not transferred:
+                        print_error(f"取得失敗: {template_path}")
+                        continue
+                    outcomes[index] = ("overwrite" if exists else "create", None)
+                    exists = True
+                    if self.metrics is not None or _event_log is not None:
+                        self._record_fetch(index, size, elapsed)
+
+        unchanged = set()
+        merge_times: Dict[Path, float] = {}
+        with self._phase("merge", jobs=len(jobs) + len(in_place_targets)):
+            results = self.executor.run(jobs)
+            for dest_path, entries in in_place_targets:
+                changed, steps, elapsed = run_merge_in_place(dest_path, [content for _, content in entries],
+                                                             self.merge_matcher, self.merge_options)
+                for (index, _), step in zip(entries, steps):
+                    outcomes[index] = step
+                merge_times[dest_path] = elapsed
+                if self.metrics is not None:
+                    self.metrics.observe("merge", self._template_of(entries[-1][0]), elapsed)
+                if not changed and any(action != "error" for action, _ in steps):
+                    unchanged.add(dest_path)
+        for job, (dest_path, entries), (merged, steps, _, elapsed) in zip(jobs, job_targets, results):
+            for (index, _), step in zip(entries, steps):
+                outcomes[index] = step
+            merge_times[dest_path] = elapsed
+            if self.metrics is not None and entries:
+                self.metrics.observe("merge", self._template_of(entries[-1][0]), elapsed)
+            # 1つもマージに成功しなかった場合は既存ファイルに触れない
+            if not any(action != "error" for action, _ in steps):
+                continue
+            # 既存の内容と同じ場合は書き込まない（更新時刻を変えない）
+            if merged == job[1]:
+                unchanged.add(dest_path)
+            else:
+                final_contents[dest_path] = merged
+
+        # 配置
+        with self._phase("write", files=len(final_contents)):
+            for dest_path, content in final_contents.items():
+                start = time.perf_counter()
+                with trace_span(dest_path.name, "write", bytes=len(content)):
+                    dest_path.parent.mkdir(parents=True, exist_ok=True)
+                    with atomic_write(dest_path) as output:
+                        output.write(content)
+                if self.metrics is not None:
+                    self.metrics.observe("write", self._template_of(targets[dest_path][-1][0]),
+                                         time.perf_counter() - start)
+
+        # 適用順に結果を表示（イベント出力時はファイルごとの file イベント）
+        for index, (template_path, dest_path, template_name) in enumerate(self.files_to_process):
+            if index not in outcomes:
+                if self.metrics is not None:
+                    self.metrics.count("failures", template_name)
+                self._emit_file_event(index, "fetch", "取得失敗")
+                continue
 
+            action, error = outcomes[index]
+            if self.metrics is not None:
+                self._record_outcome(template_name, action, dest_path in unchanged)
+            if _event_log is not None:
+                self._emit_file_event(index, "unchanged" if action == "merge" and dest_path in unchanged else action,
+                                      error, merge_times.get(dest_path))
+            elif action == "error":
+                print_error(error)
+                print_error(f"マージ失敗: {dest_path}")
+            else:
+                label = {"merge": "マージ", "overwrite": "上書き"}.get(action, "作成")
+                print(f"  [{label}] {dest_path.relative_to(self.project_dir)}")
+
+            if action == "merge":
+                merge_count += 1
+            elif action == "overwrite":
+                overwrite_count += 1
+            if action != "error":
+                success_count += 1
+
+        emit_event("summary", processed=success_count, total=len(self.files_to_process), merges=merge_count,
+                   overwrites=overwrite_count, unchanged=len(unchanged), success=success_count > 0)
         print()
         print_success(f"完了: {success_count}/{len(self.files_to_process)} ファイル処理")
         if merge_count > 0:
             print(f"  - マージ: {merge_count} ファイル")
         if overwrite_count > 0:
             print(f"  - 上書き: {overwrite_count} ファイル")
+        placements: Dict[str, int] = {}
+        for source in self.sources:
+            for method, count in source.placements.items():
+                placements[method] = placements.get(method, 0) + count
+        if placements:
+            methods = ", ".join(f"{method} {count}" for method, count in sorted(placements.items()))
+            print(f"  - 配置方法: {methods}")
+        if self.content_cache is not None:
+            self.content_cache.report()
+        self.executor.report()
+
+        cache = self.executor.cache
+        if self.metrics is not None and cache is not None:
+            self.metrics.cache_hits += cache.memory_hits + cache.disk_hits
+            self.metrics.cache_misses += cache.misses
 
         return success_count > 0
 
+    @contextmanager
+    def _phase(self, name: str, **args):
+        """フェーズの区間（トレースの区間と、イベント出力時は phase イベント）"""
+        start = time.perf_counter()
+        with trace_span(name, "phase", **args):
+            yield
+        emit_event("phase", phase=name, duration_ms=round((time.perf_counter() - start) * 1000, 3), **args)
+
+    def _template_of(self, index: int) -> str:
+        return self.files_to_process[index][2]
+
+    def _fetch_entries(self, task: tuple) -> Dict[int, tuple]:
+        """
+        配置先のファイルを適用順に取得（スレッドから呼び出されるため結果の記録は行わない）
+
+        Args:
+            task: (配置先, [(インデックス, テンプレート内のパス)], 配置方法)。配置方法がNoneの場合は
+                  内容を取得し、それ以外は配置先に転送する
+
+        Returns:
+            インデックス -> (内容または転送できたかどうか, バイト数, 所要秒)
+        """
+        dest_path, entries, link_mode = task
+        results = {}
+        for index, template_path in entries:
+            source = self.file_sources[index]
+            start = time.perf_counter()
+            if link_mode is None:
+                content = source.get_file_content(template_path)
+                results[index] = (content, len(content) if content is not None else 0,
+                                  time.perf_counter() - start)
+                continue
+            transferred = source.transfer_file(template_path, dest_path, link_mode)
+            size = 0
+            if transferred and (self.metrics is not None or _event_log is not None):
+                size = dest_path.stat().st_size
+            results[index] = (transferred, size, time.perf_counter() - start)
+        return results
+
+    def _record_fetch(self, index: int, size: int, elapsed: float) -> None:
+        """取得したファイルのサイズと所要時間を記録"""
+        self._fetches[index] = (size, elapsed)
+        if self.metrics is None:
+            return
+        template_name = self._template_of(index)
+        self.metrics.count("files_fetched", template_name)
+        self.metrics.count("transferred_bytes", template_name, size)
+        self.metrics.observe("fetch", template_name, elapsed)
+
+    def _emit_file_event(self, index: int, action: str, error: Optional[str] = None,
+                         merge_time: Optional[float] = None) -> None:
+        """ファイルごとの file イベント（イベント出力時のみ）"""
+        if _event_log is None:
+            return
+        template_path, dest_path, template_name = self.files_to_process[index]
+        size, elapsed = self._fetches.get(index, (None, None))
+        event = {
+            "action": action,
+            "template": template_name,
+            "layer": self.file_sources[index].name,
+            "source": template_path,
+            "dest": dest_path.relative_to(self.project_dir).as_posix(),
+            "bytes": size,
+            "duration_ms": round(elapsed * 1000, 3) if elapsed is not None else None,
+            "outcome": "error" if error else "ok",
+        }
+        if merge_time is not None:
+            event["merge_ms"] = round(merge_time * 1000, 3)
+        if error:
+            event["error"] = error
+        _event_log.emit("file", **event)
+
+    def _record_outcome(self, template_name: str, action: str, unchanged: bool) -> None:
+        """ファイルの処理結果の統計を記録"""
+        if action == "error":
+            self.metrics.count("failures", template_name)
+        elif action == "merge":
+            self.metrics.count("skipped" if unchanged else "merges", template_name)
+        elif action == "overwrite":
+            self.metrics.count("overwrites", template_name)
+        else:
+            self.metrics.count("files_created", template_name)
+
+
+# ============================================================================
+# 監査（audit）
+# ============================================================================
+
+class StatCache:
+    """
+    ファイルのハッシュの永続キャッシュ
+
+    (パス, サイズ, mtime_ns, inode) が一致するファイルは読み込まずに前回のハッシュを使用します。
+    更新時刻の分解能より短い間隔で書き換えられたファイルを見逃さないよう、
+    更新時刻が直近のファイルはキャッシュしません。監査の判定結果もあわせて保持します。
+    """
+
+    VERSION = 1
+    # 更新時刻がこれより新しいファイルはキャッシュしない（ナノ秒）
+    RACY_WINDOW_NS = 2_000_000_000
+
+    def __init__(self, path: Optional[Path] = None):
+        import threading
+
+        self.path = path
+        self._lock = threading.Lock()
+        # パス -> [サイズ, mtime_ns, inode, SHA-256]
+        self.files: Dict[str, list] = {}
+        # 判定キー -> 既存の内容のままでよいか
+        self.verdicts: Dict[str, bool] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        if path is not None:
+            try:
+                data = json.loads(path.read_text(encoding='utf-8'))
+                if data.get("version") == self.VERSION:
+                    self.files = data.get("files", {})
+                    self.verdicts = data.get("verdicts", {})
+            except (OSError, ValueError):
+                pass
+
+    def digest(self, path: Path) -> Optional[str]:
+        """ファイルの SHA-256（存在しない場合はNone）"""
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        key = str(path)
+        entry = self.files.get(key)
+        if entry is not None and entry[:3] == [st.st_size, st.st_mtime_ns, st.st_ino]:
+            with self._lock:
+                self.hits += 1
+            return entry[3]
+
+        with self._lock:
+            self.misses += 1
+        try:
+            digest = sha256_file(path)
+        except OSError:
+            return None
+        if time.time_ns() - st.st_mtime_ns > self.RACY_WINDOW_NS:
+            self.files[key] = [st.st_size, st.st_mtime_ns, st.st_ino, digest]
+            self._dirty = True
+        return digest
+
+    def get_verdict(self, key: str) -> Optional[bool]:
+        return self.verdicts.get(key)
+
+    def put_verdict(self, key: str, clean: bool) -> None:
+        self.verdicts[key] = clean
+        self._dirty = True
+
+    def save(self) -> None:
+        """変更があれば書き出す（失敗しても監査は継続）"""
+        if self.path is None or not self._dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_write(self.path) as output:
+                output.write(json.dumps({"version": self.VERSION, "files": self.files,
+                                         "verdicts": self.verdicts}).encode('utf-8'))
+            self._dirty = False
+        except OSError as e:
+            print_error(f"監査キャッシュを保存できません: {e}")
+
+
+class TemplateAudit:
+    """
+    テンプレートとプロジェクトの差分の監査（書き込みは行わない）
+
+    テンプレートのファイル一覧は全プロジェクトで共通のため一度だけ探索し、各プロジェクトの
+    配置先ごとに、セットアップを実行した場合の内容と現在の内容を比較します。
+      - マージしないファイル: 最後に適用されるテンプレートのファイルとハッシュを比較
+      - マージするファイル: 既存の内容にテンプレートを順にマージした結果が既存の内容と同じか
+        （再シリアライズでコメント・書式が変わるだけの場合は、解析したデータが同じなら一致とする。
+        テンプレートが1つで内容がそのテンプレートと同じ場合は、新規作成されたものとしてマージしない）
+    ハッシュの計算はスレッドで並列に行い、StatCache により変更のないファイルは読み込みません。
+    マージの判定結果も各内容のハッシュをキーとして保持するため、変更のないプロジェクトでは
+    ファイルの内容を読み込むこともマージすることもありません。
+    """
+
+    # 判定方法を変更した場合に上げる（保持している判定結果の無効化）
+    VERDICT_VERSION = 2
+
+    def __init__(self, setup: TemplateSetup, stat_cache: StatCache, workers: Optional[int] = None):
+        self.setup = setup
+        self.stat_cache = stat_cache
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        # (レイヤー, テンプレート内のパス) -> SHA-256
+        self._digests: Dict[Tuple[TemplateSource, str], Optional[str]] = {}
+
+    def _template_digest(self, entry: Tuple[TemplateSource, str]) -> Optional[str]:
+        import hashlib
+
+        source, template_path = entry
+        if source.is_local and source.local_path:
+            return self.stat_cache.digest(source.local_path / template_path)
+        # インデックスがある場合は取得せずにハッシュを使用する
+        digest = source.index_digest(template_path)
+        if digest is not None:
+            return digest
+        content = source.get_file_content(template_path)
+        return hashlib.sha256(content).hexdigest() if content is not None else None
+
+    def run(self, projects: List[Path]) -> Dict[Path, List[Tuple[str, str]]]:
+        """
+        監査を実行
+
+        Returns:
+            プロジェクト -> [(配置先の相対パス, 状態)]。状態は "ok", "drift", "missing", "error"
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        setup = self.setup
+        with setup._phase("collect"):
+            setup._collect_files()
+
+        # 配置先の相対パス -> 適用順の (レイヤー, テンプレート内のパス)
+        targets: Dict[str, List[Tuple[TemplateSource, str]]] = {}
+        for (template_path, dest_path, _), source in zip(setup.files_to_process, setup.file_sources):
+            rel = dest_path.relative_to(setup.project_dir).as_posix()
+            targets.setdefault(rel, []).append((source, template_path))
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            # テンプレートと、全プロジェクトの配置先のハッシュを並列に計算
+            template_entries = list(dict.fromkeys(entry for entries in targets.values() for entry in entries))
+            with setup._phase("hash", files=len(template_entries)):
+                self._digests = dict(zip(template_entries, pool.map(self._template_digest, template_entries)))
+                dests = [(project, rel) for project in projects for rel in targets]
+                digests = dict(zip(dests, pool.map(lambda item: self.stat_cache.digest(item[0] / item[1]), dests)))
+        finally:
+            pool.shutdown()
+
+        results: Dict[Path, List[Tuple[str, str]]] = {project: [] for project in projects}
+        # 判定キー -> ジョブ（同じ内容の配置先はプロジェクトをまたいで1回だけマージする）
+        pending: Dict[str, tuple] = {}
+        waiting = []  # (プロジェクト, 相対パス, 判定キー)
+        for (project, rel), digest in digests.items():
+            entries = [entry for entry in targets[rel] if self._digests.get(entry) is not None]
+            if digest is None:
+                results[project].append((rel, "missing"))
+                continue
+            if not entries:
+                results[project].append((rel, "error"))
+                continue
+
+            name = Path(rel).name
+            if not should_merge_file(name, setup.merge_matcher):
+                status = "ok" if digest == self._digests[entries[-1]] else "drift"
+                results[project].append((rel, status))
+                continue
+
+            # セットアップはテンプレートが1つで配置先がない場合、テンプレートをそのまま書き込む
+            if len(entries) == 1 and digest == self._digests[entries[0]]:
+                results[project].append((rel, "ok"))
+                continue
+
+            key = self._verdict_key(name, digest, [self._digests[entry] for entry in entries])
+            verdict = self.stat_cache.get_verdict(key)
+            if verdict is not None:
+                results[project].append((rel, "ok" if verdict else "drift"))
+                continue
+
+            waiting.append((project, rel, key))
+            if key not in pending:
+                contents = [source.get_file_content(template_path) for source, template_path in entries]
+                existing = (project / rel).read_bytes()
+                pending[key] = (name, existing, contents, setup.merge_matcher, setup.merge_options)
+
+        # 判定結果がない内容のみ実際にマージして比較する
+        verdicts: Dict[str, Optional[bool]] = {}
+        with setup._phase("merge", jobs=len(pending)):
+            merged_results = setup.executor.run(list(pending.values()))
+        for (key, job), (merged, steps, _, _) in zip(pending.items(), merged_results):
+            if not any(action != "error" for action, _ in steps):
+                verdicts[key] = None
+                continue
+            verdicts[key] = merged == job[1] or self._same_data(job[0], merged, job[1])
+            self.stat_cache.put_verdict(key, verdicts[key])
+        for project, rel, key in waiting:
+            verdict = verdicts[key]
+            results[project].append((rel, "error" if verdict is None else "ok" if verdict else "drift"))
+
+        for entries in results.values():
+            entries.sort()
+        return results
+
+    def _same_data(self, filename: str, merged: bytes, existing: bytes) -> bool:
+        """マージ結果と既存の内容を解析したデータが同じか（コメント・書式の違いは無視する）"""
+        codec = CODECS.get(get_file_format(filename, self.setup.merge_matcher) or "")
+        if codec is None or not codec.available:
+            return False
+        try:
+            return codec.parse(merged) == codec.parse(existing)
+        except Exception:
+            return False
+
+    def _verdict_key(self, filename: str, existing_digest: str, template_digests: List[str]) -> str:
+        import hashlib
+
+        file_format = get_file_format(filename, self.setup.merge_matcher)
+        header = json.dumps([MERGE_CACHE_VERSION, self.VERDICT_VERSION, file_format, self.setup.merge_options or {},
+                             existing_digest, template_digests], sort_keys=True)
+        return hashlib.sha256(header.encode('utf-8')).hexdigest()
+
+
+def audit_main(argv: List[str]) -> None:
+    """audit サブコマンド"""
+    parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} audit",
+        description="プロジェクトがテンプレートを適用した状態と一致しているかを確認（ファイルは変更しない）",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用例:
+  %(prog)s default/base python/base                     # カレントディレクトリ
+  %(prog)s -p ~/src/app1 -p ~/src/app2 default/base     # 複数のプロジェクト
+  find ~/src -maxdepth 1 -mindepth 1 -type d | %(prog)s --projects-from - default/base
+
+終了コード: 全て一致 0、差分・未配置・エラーあり 1
+        """
+    )
+    parser.add_argument('template_types', nargs='+', help='適用するテンプレート名')
+    parser.add_argument('-d', '--template-dir', default='templates',
+                        help='テンプレートディレクトリ (デフォルト: templates)')
+    parser.add_argument('-l', '--local', type=Path, help='ローカルテンプレートディレクトリのパス')
+    parser.add_argument('-p', '--project', type=Path, action='append', metavar='PATH',
+                        help='監査するプロジェクト（複数指定可、デフォルト: カレントディレクトリ）')
+    parser.add_argument('--projects-from', metavar='FILE',
+                        help='監査するプロジェクトを1行に1つ記載したファイル（- は標準入力）')
+    parser.add_argument('-j', '--jobs', type=int, help='ハッシュ計算のスレッド数・マージのワーカープロセス数')
+    parser.add_argument('--stat-cache', type=Path, metavar='PATH',
+                        help='ハッシュと判定結果のキャッシュファイル '
+                             '(デフォルト: キャッシュディレクトリの audit/stat.json)')
+    parser.add_argument('--no-stat-cache', action='store_true', help='キャッシュを使用しない')
+    parser.add_argument('--only', action='append', metavar='PATTERN', help='一致するファイルのみ監査')
+    parser.add_argument('--exclude', action='append', metavar='PATTERN', help='一致するファイルを監査しない')
+    parser.add_argument('--output', choices=('text', 'jsonl'), default='text',
+                        help='出力形式 (jsonl: 配置先ごとの audit イベントを標準出力へ)')
+    args = parser.parse_args(argv)
+
+    if args.output == 'jsonl':
+        start_event_log(sys.stdout)
+        sys.stdout = sys.stderr
+
+    projects = [path.resolve() for path in args.project or []]
+    if args.projects_from:
+        stream = sys.stdin if args.projects_from == '-' else open(args.projects_from, encoding='utf-8')
+        with stream:
+            projects += [Path(line.strip()).expanduser().resolve() for line in stream if line.strip()]
+    if not projects:
+        projects = [Path.cwd()]
+
+    config = Config()
+    stat_path = None
+    if not args.no_stat_cache:
+        stat_path = args.stat_cache or default_cache_dir() / "audit" / "stat.json"
+    stat_cache = StatCache(stat_path)
+
+    setup = TemplateSetup(template_types=args.template_types, config=config, template_dir=args.template_dir,
+                          local_path=args.local, workers=args.jobs, only=args.only, exclude=args.exclude)
+    start = time.perf_counter()
+    results = TemplateAudit(setup, stat_cache, workers=args.jobs).run(projects)
+    elapsed = time.perf_counter() - start
+    stat_cache.save()
+
+    labels = {"drift": "差分", "missing": "未配置", "error": "エラー"}
+    counts = {"ok": 0, "drift": 0, "missing": 0, "error": 0}
+    clean_projects = 0
+    for project, entries in results.items():
+        problems = [(rel, status) for rel, status in entries if status != "ok"]
+        for rel, status in entries:
+            counts[status] += 1
+            emit_event("audit", project=str(project), dest=rel, status=status)
+        if not problems:
+            clean_projects += 1
+            continue
+        if _event_log is None:
+            print(f"{Colors.YELLOW}{project}{Colors.NC}")
+            for rel, status in problems:
+                print(f"  [{labels[status]}] {rel}")
+
+    success = clean_projects == len(results) and bool(setup.files_to_process)
+    emit_event("summary", projects=len(results), clean_projects=clean_projects, success=success, **counts)
+    print()
+    print_success(f"監査完了: {clean_projects}/{len(results)} プロジェクトが一致"
+                  f"（{elapsed * 1000:.0f} ms、ファイル {sum(counts.values())} 件）")
+    print(f"  - 一致 {counts['ok']}, 差分 {counts['drift']}, 未配置 {counts['missing']}, エラー {counts['error']}")
+    if stat_cache.path is not None:
+        print(f"  - ハッシュキャッシュ: ヒット {stat_cache.hits}/{stat_cache.hits + stat_cache.misses}")
+    sys.exit(0 if success else 1)
+
 
 def main():
     """メイン関数"""
+    # サブコマンド（テンプレート名と区別するため先頭の引数のみで判定）
+    if len(sys.argv) > 1 and sys.argv[1] == "audit":
+        audit_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        index_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         description="VSCode プロジェクトテンプレート セットアップ",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -912,6 +4670,8 @@ def main():
   %(prog)s base python             # 基本 + Python
   %(prog)s -d test base            # testディレクトリから取得
   %(prog)s -l ./templates base     # ローカルテンプレート使用
+  %(prog)s audit base python      # 適用した状態との差分を確認（変更しない）
+  %(prog)s index                   # テンプレートインデックスを作成
 
 プライベートリポジトリの場合:
   export GITHUB_TOKEN='your_token' してから実行
@@ -936,10 +4696,102 @@ def main():
         help='ローカルテンプレートディレクトリのパス'
     )
 
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='マージに使用するワーカープロセス数 (デフォルト: CPU数、1で逐次実行)'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='マージ結果・取得した内容のキャッシュを使用しない（利用履歴も記録しない）'
+    )
+
+    parser.add_argument(
+        '--link-mode',
+        choices=LINK_MODES,
+        help='ローカルテンプレートのマージしないファイルの配置方法 '
+             '(reflink: CoWクローン, hardlink: ハードリンク。未対応の場合はコピー)'
+    )
+
+    parser.add_argument(
+        '--only',
+        action='append',
+        metavar='PATTERN',
+        help='一致するファイルのみ適用（配置先またはテンプレート内のパスのグロブ、複数指定可）'
+    )
+
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        metavar='PATTERN',
+        help='一致するファイルを適用しない（--only と同じ形式、複数指定可）'
+    )
+
+    parser.add_argument(
+        '--trace',
+        type=Path,
+        metavar='PATH',
+        help='処理区間を Chrome trace-event 形式で書き出す（chrome://tracing や Perfetto で表示）'
+    )
+
+    parser.add_argument(
+        '--timings',
+        action='store_true',
+        help='フェーズ・処理ごとの所要時間を表示'
+    )
+
+    parser.add_argument(
+        '--output',
+        choices=('text', 'jsonl'),
+        default='text',
+        help='出力形式 (text: 人が読む形式, jsonl: フェーズ・ファイルごとの構造化イベントを1行1JSONで標準出力へ。'
+             '人が読む表示は標準エラーへ)'
+    )
+
+    parser.add_argument(
+        '--metrics',
+        type=Path,
+        metavar='PATH',
+        help='実行統計を OpenMetrics 形式で書き出す（node_exporter の textfile collector 用）'
+    )
+
+    parser.add_argument(
+        '--memory-report',
+        action='store_true',
+        help='tracemalloc でフェーズ・処理・ファイルごとのメモリ使用量の最大値と主な割り当て箇所を表示'
+    )
+
+    parser.add_argument(
+        '--memory-budget',
+        type=float,
+        metavar='MB',
+        help='実行全体のメモリ使用量の上限（設定の memory.budget_mb を上書き。超えた場合は memory.on_exceed に従う）'
+    )
+
     args = parser.parse_args()
 
+    if args.output == 'jsonl':
+        start_event_log(sys.stdout)
+        # 標準出力はイベントのみにし、それ以外の表示は標準エラーへ
+        sys.stdout = sys.stderr
+
+    # トレースは設定の読み込みから記録する（無効な場合は区間を記録しない）
+    measure_memory = args.memory_report or args.memory_budget is not None
+    if args.trace or args.timings or measure_memory:
+        enable_tracing(memory=measure_memory)
+
     # 設定を読み込み
-    config = Config()
+    start = time.perf_counter()
+    with trace_span("config", "phase"):
+        config = Config()
+    emit_event("phase", phase="config", duration_ms=round((time.perf_counter() - start) * 1000, 3))
+
+    # 設定に上限がある場合は常にメモリ使用量を計測する（設定の読み込み以降）
+    memory_config = config.memory
+    if _tracer is None and (memory_config.get("budget_mb") is not None or memory_config.get("phase_budget_mb")):
+        enable_tracing(memory=True)
 
     # プロジェクトディレクトリは常にカレントディレクトリ
     project_dir = Path.cwd()
@@ -952,10 +4804,47 @@ def main():
         template_types=args.template_types,
         config=config,
         template_dir=args.template_dir,
-        local_path=args.local
+        local_path=args.local,
+        workers=args.jobs,
+        use_cache=not args.no_cache,
+        link_mode=args.link_mode,
+        only=args.only,
+        exclude=args.exclude,
+        metrics=RunMetrics() if args.metrics else None
     )
 
     success = setup.run()
+
+    tracer = disable_tracing()
+    if tracer is not None:
+        if args.timings:
+            print()
+            tracer.print_summary()
+        if tracer.memory is not None:
+            tracer.memory.stop()
+            if args.memory_report:
+                print()
+                tracer.memory.print_report(tracer.events)
+
+            budget = args.memory_budget if args.memory_budget is not None else memory_config.get("budget_mb")
+            exceeded = tracer.memory.check_budget(tracer.events, budget, memory_config.get("phase_budget_mb", {}))
+            if exceeded:
+                fail = memory_config.get("on_exceed", "warn") == "fail"
+                print()
+                for item in exceeded:
+                    if fail:
+                        print_error(f"メモリ使用量が上限を超えました: {item}")
+                    else:
+                        print_warning(f"メモリ使用量が上限を超えました: {item}")
+                if fail:
+                    success = False
+        if args.trace:
+            tracer.write(args.trace)
+            print(f"トレースを書き出しました: {args.trace}")
+
+    if setup.metrics is not None:
+        setup.metrics.success = success
+        setup.metrics.write(args.metrics)
     sys.exit(0 if success else 1)
 
 